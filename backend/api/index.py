@@ -25,8 +25,11 @@ def handler(event, context):
         os.chdir(backend_path)
         
         # Import and create handler - main.py is in the api/ directory
-        from main import app
+        from main import app, start_once
         from mangum import Mangum
+        # Startup (data load, indexes, warm-up) once per process, on the first invocation.
+        # lifespan="off": Mangum would otherwise run the whole lifespan, teardown included, on every invocation
+        start_once()
         _handler_cache = Mangum(app, lifespan="off")
     
-    return _handler_cache(event, context)
\ No newline at end of file
+    return _handler_cache(event, context)
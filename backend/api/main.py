@@ -1,26 +1,162 @@
 """
 AnangAI Civic Portal API - applications.txt (Get Featured) + Admin-only auth.
 """
+import asyncio
 import hashlib
-import json
-import shutil
+import logging
 import sys
+import threading
 import uuid
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+from datetime import datetime
 from pathlib import Path
 
-from fastapi import Body, Depends, FastAPI, File, Form, Header, HTTPException, Query, UploadFile
+from fastapi import Body, Depends, FastAPI, File, Form, Header, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
 # Add parent directory to path so we can import router.py from backend root
 _backend_root = Path(__file__).resolve().parent.parent
 if str(_backend_root) not in sys.path:
     sys.path.insert(0, str(_backend_root))
 
-from router import ask, discover_data_files, load_data, split_food_entries, split_place_entries, split_shops_entries, parse_food_entry, parse_place_entry, parse_shop_entry, parse_event_entry
+from logs import setup_logging, shutdown_logging
+# Before the other imports, so records logged while they load go through the queue too
+setup_logging()
+
+from router import ask, close_http_client, prompt_cache_stats
+from deadline import Deadline, RequestCancelled
+from data_watcher import start_watcher, stop_watcher
+from dataset import DATA_TYPES, FACET_FILTERS, append_food_entries, decode_cursor, encode_cursor, filter_mask, find_category, get_dataset, project_entries
+from hours import positions
+from http_cache import cached_json_response, etag_matches, make_etag
+from json_codec import USE_ORJSON_RESPONSES, raw_json_response
+from json_store import JsonStore
+from upload_store import MAX_UPLOAD_BYTES, resolve_upload, store_upload, too_large_detail
+from warmup import start_background_warm_up, warm_status, warm_up_core
+import memory
+import profiler
+import tracing
+
+log = logging.getLogger(__name__)
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_once() -> None:
+    """
+    Startup, once per process: parse the data files and build every index before the first
+    request, keep them current in the background (DATA_WATCH=0 disables), then pre-connect to
+    OpenRouter and prime the answer cache off the request path. The lifespan runs it under a
+    server; the serverless handler runs it on its first invocation.
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        if memory.MEMORY_TRACE_FRAMES:
+            memory.start_tracing(memory.MEMORY_TRACE_FRAMES)
+        start_watcher()
+        warm_up_core()
+        if memory.MEMORY_TRACE_FRAMES:
+            # Baseline for "what has grown since startup"
+            memory.take_snapshot("startup")
+        start_background_warm_up()
+        if profiler.PROFILE_CONTINUOUS_INTERVAL_MS:
+            profiler.start_continuous(profiler.PROFILE_CONTINUOUS_INTERVAL_MS)
+        _started = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup as in start_once(). Shutdown (a real server only; the serverless handler runs with
+    the lifespan off): stop the watcher, close the pool, fold the user and application journals
+    into their files.
+    """
+    await run_in_threadpool(start_once)
+    yield
+    profiler.stop_continuous()
+    stop_watcher()
+    close_http_client()
+    for store in (USERS, APPLICATIONS):
+        await run_in_threadpool(store.compact)
+    tracing.shutdown_tracing()
+    shutdown_logging()
+
+app = FastAPI(
+    title="AnangAI Civic Portal API",
+    lifespan=lifespan,
+    # Set ORJSON_RESPONSES=1 (with orjson installed) to encode every response with orjson.
+    default_response_class=ORJSONResponse if USE_ORJSON_RESPONSES else JSONResponse,
+)
+
+# Multipart endpoints that accept a document; bodies larger than the upload cap (plus room
+# for the other form fields) are refused from Content-Length before anything is read.
+UPLOAD_ROUTES = {"/api/submit-application", "/api/register", "/api/upload-license"}
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    if request.method == "POST" and request.url.path in UPLOAD_ROUTES:
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse(status_code=413, content={"detail": too_large_detail()})
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def profile_admin_requests(request: Request, call_next):
+    """
+    With "X-Profile: 1" and an admin token, sample the request's stacks; X-Profile-Id names the
+    stored profile. Any other request, including one asking without an admin token, runs unprofiled.
+    """
+    if request.headers.get("x-profile", "").strip() != "1":
+        return await call_next(request)
+    try:
+        require_admin(request.headers.get("authorization"))
+    except HTTPException:
+        return await call_next(request)
+    sampler = profiler.start_request_profile()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.finish_request_profile(sampler)
+    profile_id = profiler.store_request_profile(f"{request.method} {request.url.path}", sampler)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Root span of each request, continuing the caller's traceparent when there is one; the
+    trace id goes back in X-Trace-Id and traceresponse so a response can be looked up later.
+    """
+    with tracing.span(
+        f"{request.method} {request.url.path}",
+        "server",
+        traceparent=request.headers.get("traceparent"),
+        **{"http.request.method": request.method, "url.path": request.url.path},
+    ) as root:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            root.name = f"{request.method} {route.path}"
+            root.set("http.route", route.path)
+        root.set("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            root.fail(f"HTTP {response.status_code}")
+    response.headers["X-Trace-Id"] = root.trace_id
+    response.headers["traceresponse"] = root.traceparent()
+    return response
 
-app = FastAPI(title="AnangAI Civic Portal API")
 
 # Hardcoded Admin credentials (backend check only). In production use env vars.
 # List of (email_lower, password) that can access Founder's Portal.
@@ -106,45 +242,26 @@ class ApplicationIdBody(BaseModel):
     email: str | None = None
 
 
-def load_db():
-    if not DB_PATH.exists():
-        return {"users": []}
-    with open(DB_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
+# Users and applications live in memory; changes are journaled and folded into the files (see json_store.py)
+USERS = JsonStore(DB_PATH, "users")
+APPLICATIONS = JsonStore(APP_PATH, "applications")
 
-def save_db(data):
-    with open(DB_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
 
-
-def get_user_by_email(email: str):
-    data = load_db()
-    for u in data.get("users", []):
-        if u.get("email") == email:
-            return u, data
-    return None, data
+def _same_email(email: str):
+    return lambda record: record.get("email") == email
 
 
-def load_applications():
-    if not APP_PATH.exists():
-        return {"applications": []}
-    with open(APP_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+def _same_email_ci(email: str):
+    email_lower = (email or "").strip().lower()
+    return lambda record: (record.get("email") or "").strip().lower() == email_lower
 
 
-def save_applications(data):
-    with open(APP_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+def get_user_by_email(email: str):
+    return USERS.find(_same_email(email))[1]
 
 
 def get_application_by_email(email: str):
-    data = load_applications()
-    email_lower = (email or "").strip().lower()
-    for a in data.get("applications", []):
-        if (a.get("email") or "").strip().lower() == email_lower:
-            return a, data
-    return None, data
+    return APPLICATIONS.find(_same_email_ci(email))[1]
 
 
 def require_admin(authorization: str | None = Header(None)):
@@ -157,12 +274,12 @@ def require_admin(authorization: str | None = Header(None)):
     return True
 
 
-def ensure_user(email: str, data: dict):
-    users = data.get("users", [])
-    for i, u in enumerate(users):
-        if u.get("email") == email:
-            return i, users
-    users.append({
+def ensure_user(tx, email: str) -> int:
+    """Index of the user in a USERS transaction, adding a blank account if there is none."""
+    i, _ = tx.find(_same_email(email))
+    if i is not None:
+        return i
+    return tx.append({
         "email": email,
         "password": "",
         "name": "",
@@ -173,7 +290,6 @@ def ensure_user(email: str, data: dict):
         "category": "",
         "address": "",
     })
-    return len(users) - 1, users
 
 
 # Allowed category_file values (file stems under Food/)
@@ -219,30 +335,21 @@ async def submit_application(
         raise HTTPException(status_code=400, detail="Invalid category")
     if not cat:
         raise HTTPException(status_code=400, detail="Category is required")
-    apps_data = load_applications()
-    for a in apps_data.get("applications", []):
-        if (a.get("email") or "").strip().lower() == email.lower():
-            raise HTTPException(status_code=409, detail="An application for this email already exists.")
+    duplicate = HTTPException(status_code=409, detail="An application for this email already exists.")
+    if get_application_by_email(email):
+        raise duplicate
     license_url = ""
     safe_email = email.replace("@", "_").replace(".", "_")
     if license_file and license_file.filename:
         suffix = Path(license_file.filename).suffix.lower()
         if suffix not in ALLOWED_EXTENSIONS:
             raise HTTPException(400, f"License file: allowed types {', '.join(ALLOWED_EXTENSIONS)}")
-        dest_name = f"license_{safe_email}_{uuid.uuid4().hex[:8]}{suffix}"
-        dest_path = UPLOADS_DIR / dest_name
-        try:
-            with open(dest_path, "wb") as f:
-                shutil.copyfileobj(license_file.file, f)
-        except Exception as e:
-            raise HTTPException(500, f"Save failed: {e}")
-        license_url = dest_name
+        license_url = await store_upload(license_file, lambda digest: f"license_{safe_email}_{digest[:12]}{suffix}")
     # Display name: store name or business name
     biz_name = (storeName or businessName or "").strip() or (businessType or "").strip()
     app_id = str(uuid.uuid4())
-    apps = apps_data.get("applications", [])
     # Store ALL data from Get Featured form so admin can review and we can append to Food/*.txt on approve
-    apps.append({
+    record = {
         "id": app_id,
         "name": (name or "").strip(),
         "email": email,
@@ -269,9 +376,16 @@ async def submit_application(
         # Legacy form fields (keep so we store everything from the page)
         "businessType": (businessType or "").strip(),
         "businessDescription": (businessDescription or "").strip(),
-    })
-    apps_data["applications"] = apps
-    save_applications(apps_data)
+    }
+
+    def insert():
+        with APPLICATIONS.transaction() as tx:
+            # Checked again: another submission may have landed during the upload
+            if tx.find(_same_email_ci(email))[0] is not None:
+                raise duplicate
+            tx.append(record)
+
+    await run_in_threadpool(insert)
     return {"id": app_id, "email": email, "message": "Application submitted. You will hear from admin@anangai.com regarding verification."}
 
 
@@ -286,16 +400,71 @@ def admin_login(body: LoginBody):
     return {"token": ADMIN_TOKEN}
 
 
+# Page size cap and bulk action size cap for the admin application endpoints
+ADMIN_APPLICATIONS_MAX_LIMIT = 500
+ADMIN_BULK_MAX_IDS = 1000
+APPLICATION_STATUSES = {"pending", "approved", "rejected"}
+
+
+def _encode_applications_cursor(position: int, version: int) -> str:
+    return encode_cursor(position) + "." + encode_cursor(version)
+
+
+def _decode_applications_cursor(cursor: str) -> tuple[int, int]:
+    position, _, version = cursor.partition(".")
+    return decode_cursor(position), decode_cursor(version)
+
+
 @app.get("/api/admin/applications")
-def admin_list_applications(_: bool = Depends(require_admin)):
-    """Return all applications from applications.txt (admin only)."""
-    data = load_applications()
-    return data
+def admin_list_applications(
+    if_none_match: str | None = Header(None),
+    status: str | None = Query(None, description="Comma-separated statuses, e.g. pending"),
+    since: int | None = Query(None, ge=0, description="Only applications changed after this version"),
+    limit: int | None = Query(None, ge=1, le=ADMIN_APPLICATIONS_MAX_LIMIT, description="Page size; omit for all"),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    _: bool = Depends(require_admin),
+):
+    """
+    Applications from applications.txt (admin only), in submission order, with the store's
+    change counter as "version". Poll with since=<version> to get only the applications
+    changed after it; with a status filter, "removed" lists the ids of changed applications
+    that no longer match. Pages of one listing all report the version of its first page,
+    which is the one to poll with next. Unchanged listings answer If-None-Match with 304.
+    A cursor is a position in the store, whose applications are only ever appended, so a
+    status change while paging cannot shift the applications still to come past it.
+    """
+    statuses = {s.lower() for s in _split_param(status)}
+    if statuses - APPLICATION_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(sorted(APPLICATION_STATUSES))}")
+    current, records, versions = APPLICATIONS.view()
+    version, position = current, 0
+    if cursor:
+        try:
+            position, version = _decode_applications_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    etag = make_etag("applications", current, status, since, limit, cursor)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    changed = range(len(records)) if since is None else [i for i, changed_in in enumerate(versions) if changed_in > since]
+    matched = [i for i in changed if (records[i].get("status") or "pending") in statuses] if statuses else list(changed)
+    start = bisect_left(matched, position)
+    page = matched[start:start + limit] if limit else matched[start:]
+    payload = {
+        "applications": [records[i] for i in page],
+        "version": version,
+        "total": len(matched),
+        "next_cursor": _encode_applications_cursor(page[-1] + 1, version) if limit and start + len(page) < len(matched) else None,
+    }
+    if since is not None and statuses:
+        payload["removed"] = [records[i].get("id") for i in changed if (records[i].get("status") or "pending") not in statuses]
+    return raw_json_response(payload, headers=headers)
 
 
-def _find_application(data, app_id: str | None, email: str | None):
+def _find_application(apps, app_id: str | None, email: str | None):
     """Return (index, app) or (None, None)."""
-    apps = data.get("applications", [])
     email_lower = (email or "").strip().lower()
     for i, a in enumerate(apps):
         if app_id and a.get("id") == app_id:
@@ -305,24 +474,25 @@ def _find_application(data, app_id: str | None, email: str | None):
     return None, None
 
 
-def _append_application_to_food_file(app: dict) -> None:
+def _food_entry_for_application(app: dict) -> tuple[Path, str] | None:
     """
     On approve: read selective data from the application (saved in applications.txt)
-    and append one entry to the correct Food/*.txt file using that file's exact schema.
+    and build one entry for the correct Food/*.txt file using that file's exact schema.
+    Returns (file path, entry block), or None when the application has no usable category or name.
     - shops -> shops.txt: Store Name, Location, Hours of Operation, Info, Category, ---
     - restaurants/bakeries/cafes/etc. -> Business Name, Location, Hours, Local Sourcing,
       Veg/Vegan Options, Green Plate Certification, Notes
     """
     cat_file = (app.get("category_file") or "").strip()
     if not cat_file or cat_file not in FEATURED_CATEGORY_FILES:
-        return
+        return None
     path = FOOD_DIR / f"{cat_file}.txt"
     if not path.exists():
-        return
+        return None
     # Require at least a name so we don't append empty entries (e.g. old applications)
     entry_name = (app.get("store_name") or app.get("biz_name") or app.get("businessName") or "").strip()
     if not entry_name:
-        return
+        return None
     if cat_file == "shops":
         # Exact schema required by shops.txt
         lines = [
@@ -346,29 +516,42 @@ def _append_application_to_food_file(app: dict) -> None:
             "Green Plate Certification: " + (app.get("green_plate_cert") or "null"),
             "Notes: " + (app.get("notes") or app.get("info") or ""),
         ]
-    block = "\n".join(lines)
+    return path, "\n".join(lines)
+
+
+def _append_applications_to_food_files(apps: list[dict]) -> bool:
+    """
+    Append the approved applications to their Food/*.txt files. The entries are indexed into
+    the in-memory dataset at the same time, as one new version for the whole batch, so chat
+    and discovery see the newly featured businesses immediately without a reparse.
+    Returns False if that failed; the approvals themselves are already saved by then.
+    """
+    blocks = [block for block in map(_food_entry_for_application, apps) if block is not None]
     try:
-        with open(path, "a", encoding="utf-8") as f:
-            f.write(block)
+        append_food_entries(blocks)
     except Exception:
-        pass
+        log.exception("featured entries not appended", extra={"applications": [a.get("id") for a in apps], "entries": len(blocks)})
+        return False
+    return True
 
 
 @app.post("/api/admin/applications/approve")
 def admin_approve_application(body: ApplicationIdBody, _: bool = Depends(require_admin)):
-    """Set application status to approved (admin only). Appends entry to the category Food/*.txt file."""
+    """
+    Set application status to approved (admin only). Appends entry to the category Food/*.txt file;
+    "indexed" is false when that failed (the approval is saved regardless).
+    """
     app_id = (body.id or "").strip() or None
     email = (body.email or "").strip() or None
     if not app_id and not email:
         raise HTTPException(status_code=400, detail="Application id or email required")
-    data = load_applications()
-    i, a = _find_application(data, app_id, email)
-    if i is None:
-        raise HTTPException(status_code=404, detail="Application not found")
-    a["status"] = "approved"
-    _append_application_to_food_file(a)
-    save_applications(data)
-    return {"id": a.get("id"), "status": "approved"}
+    with APPLICATIONS.transaction() as tx:
+        i, a = _find_application(tx.records, app_id, email)
+        if i is None:
+            raise HTTPException(status_code=404, detail="Application not found")
+        a = tx.update(i, status="approved")
+    indexed = _append_applications_to_food_files([a])
+    return {"id": a.get("id"), "status": "approved", "indexed": indexed}
 
 
 @app.post("/api/admin/applications/reject")
@@ -378,24 +561,85 @@ def admin_reject_application(body: ApplicationIdBody, _: bool = Depends(require_
     email = (body.email or "").strip() or None
     if not app_id and not email:
         raise HTTPException(status_code=400, detail="Application id or email required")
-    data = load_applications()
-    i, a = _find_application(data, app_id, email)
-    if i is None:
-        raise HTTPException(status_code=404, detail="Application not found")
-    a["status"] = "rejected"
-    save_applications(data)
+    with APPLICATIONS.transaction() as tx:
+        i, a = _find_application(tx.records, app_id, email)
+        if i is None:
+            raise HTTPException(status_code=404, detail="Application not found")
+        tx.update(i, status="rejected")
     return {"id": a.get("id"), "status": "rejected"}
 
 
+class BulkApplicationsBody(BaseModel):
+    """Body for admin bulk approve/reject: application ids and the status to set."""
+    ids: list[str]
+    status: str
+
+
+@app.post("/api/admin/applications/bulk")
+def admin_bulk_applications(body: BulkApplicationsBody, _: bool = Depends(require_admin)):
+    """
+    Approve or reject many applications in one transaction (admin only). Body:
+    { "ids": [...], "status": "approved" | "rejected" }. Applications already in that status
+    are left alone; approved ones are appended to their Food/*.txt files as with /approve,
+    with one dataset update for the whole batch. "indexed" is false when that update failed
+    (the status changes are saved regardless).
+    """
+    if body.status not in ("approved", "rejected"):
+        raise HTTPException(status_code=400, detail="status must be approved or rejected")
+    if len(body.ids) > ADMIN_BULK_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {ADMIN_BULK_MAX_IDS} ids per request")
+    wanted = set(body.ids)
+    updated, unchanged = [], []
+    with APPLICATIONS.transaction() as tx:
+        for i, a in enumerate(tx.records):
+            if a.get("id") not in wanted:
+                continue
+            if a.get("status") == body.status:
+                unchanged.append(a["id"])
+            else:
+                updated.append(tx.update(i, status=body.status))
+        version = tx.version if updated else APPLICATIONS.version
+    indexed = _append_applications_to_food_files(updated) if body.status == "approved" and updated else True
+    found = {a["id"] for a in updated} | set(unchanged)
+    return {
+        "status": body.status,
+        "updated": [a["id"] for a in updated],
+        "unchanged": unchanged,
+        "not_found": [app_id for app_id in body.ids if app_id not in found],
+        "version": version,
+        "indexed": indexed,
+    }
+
+
+# Upload names embed the content hash, so a name always means the same bytes.
+UPLOAD_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Pre-blob-store files can be overwritten in place; let clients revalidate them.
+LEGACY_UPLOAD_CACHE_CONTROL = "private, no-cache"
+
+
 @app.get("/api/uploads/{filename}")
-def serve_upload(filename: str):
-    """Serve an uploaded file (e.g. license document). Filename must be safe (no path traversal)."""
-    if ".." in filename or "/" in filename or "\\" in filename:
+def serve_upload(filename: str, if_none_match: str | None = Header(None)):
+    """
+    Serve an uploaded file (e.g. license document). Filename must be safe (no path traversal).
+    Sends a strong ETag (the content SHA-256), answers If-None-Match with 304 and supports Range requests.
+    """
+    if ".." in filename or "/" in filename or "\\" in filename or filename.startswith("."):
         raise HTTPException(status_code=400, detail="Invalid filename")
-    path = UPLOADS_DIR / filename
-    if not path.is_file():
+    resolved = resolve_upload(filename)
+    if not resolved:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(path, filename=filename)
+    path, digest = resolved
+    if digest:
+        etag = f'"{digest}"'
+        cache_control = UPLOAD_CACHE_CONTROL
+    else:
+        st = path.stat()
+        etag = f'W/"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        cache_control = LEGACY_UPLOAD_CACHE_CONTROL
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, filename=filename, headers=headers)
 
 
 @app.post("/api/finalize-account")
@@ -411,24 +655,20 @@ def finalize_account(body: LoginBody):
         raise HTTPException(status_code=400, detail="Email is required")
     if not password or len(password) < 6:
         raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
-    app_record, _ = get_application_by_email(email)
+    app_record = get_application_by_email(email)
     if not app_record:
         raise HTTPException(status_code=400, detail="Please submit your business details first.")
-    data = load_db()
-    for u in data.get("users", []):
-        if (u.get("email") or "").strip().lower() == email:
+    with USERS.transaction() as tx:
+        if tx.find(_same_email_ci(email))[0] is not None:
             raise HTTPException(status_code=409, detail="Account already exists. Please log in.")
-    users = data.get("users", [])
-    users.append({
-        "email": email,
-        "hashed_password": hash_password(password),
-        "role": "partner",
-        "is_verified": False,
-        "progress": 1,
-        "name": email.split("@")[0],
-    })
-    data["users"] = users
-    save_db(data)
+        tx.append({
+            "email": email,
+            "hashed_password": hash_password(password),
+            "role": "partner",
+            "is_verified": False,
+            "progress": 1,
+            "name": email.split("@")[0],
+        })
     return {
         "email": email,
         "business_name": app_record.get("biz_name", ""),
@@ -445,8 +685,8 @@ def dashboard_data(email: str):
     JOIN database.txt (auth) + applications.txt (business). Returns merged object.
     """
     email = email.strip()
-    user, _ = get_user_by_email(email)
-    app_record, _ = get_application_by_email(email)
+    user = get_user_by_email(email)
+    app_record = get_application_by_email(email)
     auth = {
         "email": email,
         "progress": 1,
@@ -487,39 +727,36 @@ async def register(
     """
     Legacy: full partner application (kept for backward compat). Prefer submit-application + finalize-account.
     """
-    data = load_db()
     email = (email or "").strip()
     if not email:
         raise HTTPException(status_code=400, detail="Email is required")
-    for u in data.get("users", []):
-        if u.get("email") == email:
-            raise HTTPException(status_code=409, detail="Email already registered. Please log in.")
+    duplicate = HTTPException(status_code=409, detail="Email already registered. Please log in.")
+    if get_user_by_email(email):
+        raise duplicate
     safe_email = email.replace("@", "_").replace(".", "_")
     if drivers_license and drivers_license.filename:
         suffix = Path(drivers_license.filename).suffix.lower()
         if suffix not in ALLOWED_EXTENSIONS:
             raise HTTPException(400, f"Driver's license: allowed types {', '.join(ALLOWED_EXTENSIONS)}")
-        dest_name = f"drivers_license_{safe_email}{suffix}"
-        dest_path = UPLOADS_DIR / dest_name
-        try:
-            with open(dest_path, "wb") as f:
-                shutil.copyfileobj(drivers_license.file, f)
-        except Exception as e:
-            raise HTTPException(500, f"Save failed: {e}")
-    users = data.get("users", [])
-    users.append({
-        "email": email,
-        "password": password or "",
-        "name": (username or "").strip() or email.split("@")[0],
-        "progress": 1,
-        "is_verified": False,
-        "business_name": (businessName or "").strip(),
-        "business_description": (businessDescription or "").strip(),
-        "category": (businessType or "").strip(),
-        "address": (contact or "").strip(),
-    })
-    data["users"] = users
-    save_db(data)
+        await store_upload(drivers_license, lambda digest: f"drivers_license_{safe_email}_{digest[:12]}{suffix}")
+
+    def insert():
+        with USERS.transaction() as tx:
+            if tx.find(_same_email(email))[0] is not None:
+                raise duplicate
+            tx.append({
+                "email": email,
+                "password": password or "",
+                "name": (username or "").strip() or email.split("@")[0],
+                "progress": 1,
+                "is_verified": False,
+                "business_name": (businessName or "").strip(),
+                "business_description": (businessDescription or "").strip(),
+                "category": (businessType or "").strip(),
+                "address": (contact or "").strip(),
+            })
+
+    await run_in_threadpool(insert)
     return {"email": email, "message": "Application received. Our team is verifying your local status."}
 
 
@@ -529,28 +766,24 @@ def signup(body: LoginBody):
     Simple sign up: email + password. Saves to database.txt with hashed_password.
     If email already exists, returns 409. Email is stored lowercase.
     """
-    data = load_db()
     email = (body.email or "").strip().lower()
     password = body.password or ""
     if not email:
         raise HTTPException(status_code=400, detail="Email is required")
     if not password or len(password) < 6:
         raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
-    for u in data.get("users", []):
-        if (u.get("email") or "").strip().lower() == email:
-            raise HTTPException(status_code=409, detail="Email already registered. Please log in.")
     name = email.split("@")[0]
-    users = data.get("users", [])
-    users.append({
-        "email": email,
-        "hashed_password": hash_password(password),
-        "name": name,
-        "progress": 1,
-        "is_verified": False,
-        "status": "approved",
-    })
-    data["users"] = users
-    save_db(data)
+    with USERS.transaction() as tx:
+        if tx.find(_same_email_ci(email))[0] is not None:
+            raise HTTPException(status_code=409, detail="Email already registered. Please log in.")
+        tx.append({
+            "email": email,
+            "hashed_password": hash_password(password),
+            "name": name,
+            "progress": 1,
+            "is_verified": False,
+            "status": "approved",
+        })
     return {
         "email": email,
         "business_name": "",
@@ -568,17 +801,16 @@ def login(body: LoginBody):
     On success returns user object with business_name from application if available.
     Email comparison is case-insensitive so "User@Mail.com" matches "user@mail.com".
     """
-    data = load_db()
     email = (body.email or "").strip()
     email_lower = email.lower()
     password = body.password or ""
-    for u in data.get("users", []):
+    for u in USERS.records():
         if (u.get("email") or "").strip().lower() != email_lower:
             continue
         stored = u.get("hashed_password") or u.get("password") or ""
         if not verify_password(password, stored):
             continue
-        app_record, _ = get_application_by_email(email)
+        app_record = get_application_by_email(email)
         biz_name = ((app_record or {}).get("biz_name") or u.get("business_name") or "").strip()
         status = u.get("status") or ("approved" if u.get("is_verified") else "pending_review")
         return {
@@ -599,7 +831,7 @@ def _user_status(u):
 @app.get("/api/user")
 def get_user(email: str = Query(..., description="User email")):
     """Get current user progress and verification status."""
-    user, _ = get_user_by_email(email)
+    user = get_user_by_email(email)
     if not user:
         return {"email": email, "progress": 1, "is_verified": False, "status": "pending_review"}
     out = dict(user)
@@ -610,10 +842,9 @@ def get_user(email: str = Query(..., description="User email")):
 @app.get("/api/admin/pending")
 def admin_pending():
     """Return all users with status == 'pending_review' (admin gate)."""
-    data = load_db()
     pending = [
         {**u, "status": u.get("status") or "pending_review"}
-        for u in data.get("users", [])
+        for u in USERS.records()
         if (u.get("status") or ("approved" if u.get("is_verified") else "pending_review")) == "pending_review"
     ]
     return {"users": pending}
@@ -629,15 +860,11 @@ def admin_approve(body: AdminActionBody):
     email = (body.email or "").strip()
     if not email:
         raise HTTPException(400, detail="Email is required")
-    user, data = get_user_by_email(email)
-    if not user:
-        raise HTTPException(404, detail="User not found")
-    users = data.get("users", [])
-    i = next(idx for idx, u in enumerate(users) if u.get("email") == email)
-    users[i]["status"] = "approved"
-    users[i]["is_verified"] = True
-    data["users"] = users
-    save_db(data)
+    with USERS.transaction() as tx:
+        i, _ = tx.find(_same_email(email))
+        if i is None:
+            raise HTTPException(404, detail="User not found")
+        tx.update(i, status="approved", is_verified=True)
     return {"email": email, "status": "approved", "is_verified": True}
 
 
@@ -647,14 +874,11 @@ def admin_reject(body: AdminActionBody):
     email = (body.email or "").strip()
     if not email:
         raise HTTPException(400, detail="Email is required")
-    user, data = get_user_by_email(email)
-    if not user:
-        raise HTTPException(404, detail="User not found")
-    users = data.get("users", [])
-    i = next(idx for idx, u in enumerate(users) if u.get("email") == email)
-    users[i]["status"] = "rejected"
-    data["users"] = users
-    save_db(data)
+    with USERS.transaction() as tx:
+        i, _ = tx.find(_same_email(email))
+        if i is None:
+            raise HTTPException(404, detail="User not found")
+        tx.update(i, status="rejected")
     return {"email": email, "status": "rejected"}
 
 
@@ -671,37 +895,30 @@ def update_progress(
     Update user's progress. If body.step is provided: set progress = max(current, step).
     Otherwise increment by 1. Step 7 is completed when license is uploaded.
     """
-    user, data = get_user_by_email(email)
-    if not user:
-        i, users = ensure_user(email, data)
-        user = users[i]
-    else:
-        users = data.get("users", [])
-        i = next(idx for idx, u in enumerate(users) if u.get("email") == email)
-
-    current = user.get("progress", 1)
-    if current >= 7:
-        return {"email": email, "progress": 7, "is_verified": user.get("is_verified", False)}
-    if body and body.step is not None:
-        new_progress = max(current, min(7, body.step))
-    else:
-        new_progress = current + 1
-    users[i]["progress"] = new_progress
-    data["users"] = users
-    save_db(data)
-    return {"email": email, "progress": users[i]["progress"], "is_verified": user.get("is_verified", False)}
+    with USERS.transaction() as tx:
+        i = ensure_user(tx, email)
+        user = tx.records[i]
+        current = user.get("progress", 1)
+        if current >= 7:
+            return {"email": email, "progress": 7, "is_verified": user.get("is_verified", False)}
+        if body and body.step is not None:
+            new_progress = max(current, min(7, body.step))
+        else:
+            new_progress = current + 1
+        if new_progress != current:
+            user = tx.update(i, progress=new_progress)
+    return {"email": email, "progress": new_progress, "is_verified": user.get("is_verified", False)}
 
 
 @app.get("/api/businesses")
 def list_businesses(category: str | None = Query(None, description="Optional category filter")):
     """Return only verified businesses. Joins database (is_verified) + applications (biz_name, etc)."""
-    data = load_db()
     verified = []
-    for u in data.get("users", []):
+    for u in USERS.records():
         if not u.get("is_verified"):
             continue
         email = u.get("email", "")
-        app_record, _ = get_application_by_email(email)
+        app_record = get_application_by_email(email)
         name = (app_record.get("biz_name") or u.get("business_name") or "Unnamed").strip() or "Unnamed"
         desc = (app_record.get("biz_desc") or u.get("business_description") or "").strip()
         cat = (app_record.get("biz_cat") or u.get("category") or "Other").strip() or "Other"
@@ -733,36 +950,18 @@ async def upload_license(
 
     email = email.strip()
     safe_email = email.replace("@", "_").replace(".", "_")
-    dest_name = f"license_{safe_email}{suffix}"
-    dest_path = UPLOADS_DIR / dest_name
+    dest_name = await store_upload(file, lambda digest: f"license_{safe_email}_{digest[:12]}{suffix}")
 
-    try:
-        with open(dest_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-    except Exception as e:
-        raise HTTPException(500, f"Save failed: {e}")
 
-    app_record, app_data = get_application_by_email(email)
-    if app_record:
-        apps = app_data.get("applications", [])
-        i = next(idx for idx, a in enumerate(apps) if a.get("email") == email)
-        apps[i]["license_url"] = dest_name
-        apps[i]["status"] = "approved"
-        app_data["applications"] = apps
-        save_applications(app_data)
-
-    user, data = get_user_by_email(email)
-    if not user:
-        i, users = ensure_user(email, data)
-        user = users[i]
-    else:
-        users = data.get("users", [])
-        i = next(idx for idx, u in enumerate(users) if u.get("email") == email)
+    def record_license():
+        with APPLICATIONS.transaction() as tx:
+            i, _ = tx.find(_same_email_ci(email))
+            if i is not None:
+                tx.update(i, license_url=dest_name, status="approved")
+        with USERS.transaction() as tx:
+            tx.update(ensure_user(tx, email), is_verified=True, progress=7)
 
-    users[i]["is_verified"] = True
-    users[i]["progress"] = 7
-    data["users"] = users
-    save_db(data)
+    await run_in_threadpool(record_license)
 
     return {
         "email": email,
@@ -772,11 +971,27 @@ async def upload_license(
     }
 
 
+# How often a running chat request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+async def _run_until_disconnected(http_request: Request, deadline: Deadline, func, *args):
+    """Run a blocking function in the threadpool; cancel its deadline if the client disconnects first."""
+    task = asyncio.ensure_future(run_in_threadpool(func, *args))
+    while not task.done():
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if not task.done() and await http_request.is_disconnected():
+            deadline.cancel()
+            break
+    return await task
+
+
 @app.post("/api/chat")
-def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
     """
     Chat endpoint that uses RAG to answer questions about Kingston.
-    Uses the ask() function from router.py to generate responses.
+    Uses the ask() function from router.py to generate responses, within a
+    CHAT_DEADLINE_SECONDS budget; a client that disconnects cancels the upstream call.
     """
     try:
         question = request.question.strip()
@@ -784,7 +999,12 @@ def chat_endpoint(request: ChatRequest):
             raise HTTPException(status_code=400, detail="Question cannot be empty")
         
         language = request.language or "en"  # Default to English
-        answer = ask(question, language)
+        deadline = Deadline()
+        try:
+            answer = await _run_until_disconnected(http_request, deadline, ask, question, language, deadline)
+        except RequestCancelled:
+            # Nobody is listening; 499 (client closed request) only shows up in access logs
+            return Response(status_code=499)
         
         if answer is None:
             raise HTTPException(
@@ -799,125 +1019,228 @@ def chat_endpoint(request: ChatRequest):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@app.get("/api/admin/metrics/prompt-cache")
+def admin_prompt_cache_metrics(_: bool = Depends(require_admin)):
+    """Prompt-cache hits and token counts reported by OpenRouter since this worker started (admin only)."""
+    return prompt_cache_stats()
+
+
+@app.get("/api/admin/tracing")
+def admin_tracing_status(_: bool = Depends(require_admin)):
+    """Where spans are exported, the sampling settings and the exporter's counters (admin only)."""
+    return tracing.tracing_status()
+
+
+@app.get("/api/admin/profiles")
+def admin_list_profiles(_: bool = Depends(require_admin)):
+    """Per-request profiles kept in memory, newest first (admin only)."""
+    return {"profiles": profiler.list_request_profiles()}
+
+
+@app.get("/api/admin/profiles/{profile_id}")
+def admin_get_profile(
+    profile_id: str,
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope)$"),
+    _: bool = Depends(require_admin),
+):
+    """A request profile as collapsed stacks (flamegraph.pl, speedscope, inferno) or speedscope JSON."""
+    stored = profiler.get_request_profile(profile_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    label, sampler = stored
+    body, media_type = profiler.render(sampler, format, label)
+    return Response(content=body, media_type=media_type)
+
+
+@app.get("/api/admin/profiler")
+def admin_continuous_profile(
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope)$"),
+    reset: bool = Query(False, description="Clear the aggregate after reading it"),
+    _: bool = Depends(require_admin),
+):
+    """Hot stacks aggregated across traffic by the continuous sampler (admin only)."""
+    sampler = profiler.continuous_sampler()
+    if sampler is None:
+        raise HTTPException(status_code=404, detail="Continuous profiling has not been started")
+    body, media_type = profiler.render(sampler, format, "continuous")
+    if reset:
+        sampler.reset()
+    return Response(content=body, media_type=media_type, headers={"X-Profile-Samples": str(sampler.summary()["samples"])})
+
+
+@app.post("/api/admin/profiler/start")
+def admin_start_profiler(interval_ms: float = Query(10, ge=1, le=1000), _: bool = Depends(require_admin)):
+    """Start (or restart) continuous sampling at the given interval."""
+    return {"running": True, **profiler.start_continuous(interval_ms).summary()}
+
+
+@app.post("/api/admin/profiler/stop")
+def admin_stop_profiler(_: bool = Depends(require_admin)):
+    sampler = profiler.stop_continuous()
+    return {"running": False, **(sampler.summary() if sampler is not None else {})}
+
+
+@app.get("/api/admin/memory")
+def admin_memory_report(_: bool = Depends(require_admin)):
+    """
+    What this worker's memory goes to: RSS, the deep size of each data file's entries and
+    indexes, the caches (entries, bytes, hit ratios) and the tracemalloc status (admin only).
+    """
+    return memory.report()
+
+
+@app.post("/api/admin/memory/tracing/start")
+def admin_start_memory_tracing(frames: int = Query(1, ge=1, le=100), _: bool = Depends(require_admin)):
+    """Start tracemalloc (frames per allocation site); only allocations made from now on are traced."""
+    memory.start_tracing(frames)
+    return memory.tracing_status()
+
+
+@app.post("/api/admin/memory/tracing/stop")
+def admin_stop_memory_tracing(_: bool = Depends(require_admin)):
+    memory.stop_tracing()
+    return memory.tracing_status()
+
+
+@app.post("/api/admin/memory/snapshots")
+def admin_take_memory_snapshot(label: str = Query(""), _: bool = Depends(require_admin)):
+    """Keep a tracemalloc snapshot to compare later ones against."""
+    try:
+        snapshot_id = memory.take_snapshot(label)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"id": snapshot_id, "label": label}
+
+
+@app.get("/api/admin/memory/snapshots/{snapshot_id}")
+def admin_memory_snapshot(
+    snapshot_id: str,
+    against: str = Query(None, description="Snapshot id to diff against, or 'now'"),
+    limit: int = Query(25, ge=1, le=500),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    _: bool = Depends(require_admin),
+):
+    """
+    Top allocation sites of a kept snapshot, or with `against` the growth per site between
+    this snapshot and another one (or the current state, against=now).
+    """
+    snapshot = memory.get_snapshot(snapshot_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    if against is None:
+        return memory.top_allocations(snapshot, limit, group_by)
+    try:
+        other = memory.current_snapshot() if against == "now" else memory.get_snapshot(against)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if other is None:
+        raise HTTPException(status_code=404, detail="Snapshot to compare against not found")
+    return memory.compare_snapshots(snapshot, other, limit, group_by)
+
+
 @app.get("/api/discovery/categories")
-def get_discovery_categories():
+def get_discovery_categories(request: Request):
     """
     Get all available data file categories for the discovery page.
     Returns a list of categories with their file names and display names.
+    Cached by data version: sends an ETag and answers If-None-Match with 304.
     """
     try:
-        data_files = discover_data_files()
-        categories = []
-        
-        # Food categories
-        for file_path in data_files["food"]:
-            file_name = file_path.stem
-            display_name = file_name.replace("_", " ").title()
-            categories.append({
-                "id": file_name,
-                "label": display_name,
-                "type": "food",
-                "file": file_path.name
-            })
-        
-        # Places categories
-        for file_path in data_files["places"]:
-            file_name = file_path.stem
-            display_name = file_name.replace("_", " ").title()
-            categories.append({
-                "id": file_name,
-                "label": display_name,
-                "type": "places",
-                "file": file_path.name
-            })
-        
-        # Events categories
-        for file_path in data_files["events"]:
-            file_name = file_path.stem
-            display_name = file_name.replace("_", " ").title()
-            categories.append({
-                "id": file_name,
-                "label": display_name,
-                "type": "events",
-                "file": file_path.name
-            })
-        
-        return {"categories": categories}
+        snapshot = get_dataset()
+
+        def build():
+            categories = []
+            for file_type in DATA_TYPES:
+                for file_name, file_path in snapshot.files[file_type].items():
+                    categories.append({
+                        "id": file_name,
+                        "label": file_name.replace("_", " ").title(),
+                        "type": file_type,
+                        "file": file_path.name
+                    })
+            return {"categories": categories}
+
+        return cached_json_response(request, make_etag("categories", snapshot.version), build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load categories: {str(e)}")
 
 
+# Page size cap for /api/discovery/data
+DISCOVERY_MAX_LIMIT = 200
+
+
+def _split_param(value: str | None) -> list[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def _parse_iso_date(value: str | None, name: str):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be YYYY-MM-DD")
+
+
 @app.get("/api/discovery/data")
-def get_discovery_data(category_id: str = Query(..., description="Category ID (file name without extension)")):
+def get_discovery_data(
+    request: Request,
+    category_id: str = Query(..., description="Category ID (file name without extension)"),
+    limit: int | None = Query(None, ge=1, le=DISCOVERY_MAX_LIMIT, description="Page size; omit for all entries"),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    fields: str | None = Query(None, description="Comma-separated fields to return, e.g. name,location,url"),
+    accessibility: str | None = Query(None, description="e.g. Full Access,Partial Access"),
+    washrooms: str | None = Query(None, description="e.g. Available"),
+    veg_vegan: str | None = Query(None, description="e.g. Yes"),
+    certification: str | None = Query(None, description="e.g. Gold,Silver"),
+    local_sourcing: str | None = Query(None, description="Yes for locally sourced food"),
+    date_from: str | None = Query(None, description="Events ending on or after this date (YYYY-MM-DD)"),
+    date_to: str | None = Query(None, description="Events starting on or before this date (YYYY-MM-DD)"),
+):
     """
-    Get all entries from a specific data file.
-    Returns parsed entries ready for display.
+    Get entries from a specific data file, served from the in-memory dataset.
+    Supports limit/cursor pagination, a fields= projection and facet/date filters; filter
+    values are case-insensitive and comma-separated values match any of them; date filters
+    only apply to events (400 for other categories). facet_counts gives, per facet, how many of
+    the filtered entries - the same set as total - have each value (for the UI's filter chips).
+    Cached by data version and query: sends an ETag and answers If-None-Match with 304.
     """
     try:
-        data_files = discover_data_files()
-        
-        # Find the file
-        found_file = None
-        file_type = None
-        
-        for file_path in data_files["food"]:
-            if file_path.stem == category_id:
-                found_file = file_path
-                file_type = "food"
-                break
-        
-        if not found_file:
-            for file_path in data_files["places"]:
-                if file_path.stem == category_id:
-                    found_file = file_path
-                    file_type = "places"
-                    break
-        
-        if not found_file:
-            for file_path in data_files["events"]:
-                if file_path.stem == category_id:
-                    found_file = file_path
-                    file_type = "events"
-                    break
-        
-        if not found_file:
+        snapshot = get_dataset()
+        file_type, entries = find_category(snapshot, category_id)
+        if file_type is None:
             raise HTTPException(status_code=404, detail=f"Category '{category_id}' not found")
-        
-        # Load and parse the file
-        content = load_data(found_file)
-        if not content:
-            return {"entries": []}
-        
-        entries = []
-        
-        if file_type == "food":
-            if category_id == "shops":
-                entry_texts = split_shops_entries(content)
-                for entry_text in entry_texts:
-                    entry = parse_shop_entry(entry_text)
-                    if entry.get("name"):
-                        entries.append(entry)
-            else:
-                entry_texts = split_food_entries(content)
-                for entry_text in entry_texts:
-                    entry = parse_food_entry(entry_text)
-                    if entry.get("name"):
-                        entries.append(entry)
-        elif file_type == "places":
-            entry_texts = split_place_entries(content)
-            for entry_text in entry_texts:
-                entry = parse_place_entry(entry_text)
-                if entry.get("name"):
-                    entries.append(entry)
-        elif file_type == "events":
-            lines = content.strip().split('\n')
-            for line in lines:
-                if line.strip() and '|' in line:
-                    entry = parse_event_entry(line)
-                    if entry and entry.get("name"):
-                        entries.append(entry)
-        
-        return {"entries": entries, "category": category_id, "type": file_type}
+        try:
+            offset = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        facet_values = {"accessibility": accessibility, "washrooms": washrooms, "veg_vegan": veg_vegan, "certification": certification, "local_sourcing": local_sourcing}
+        facets = {FACET_FILTERS[name]: _split_param(value) for name, value in facet_values.items()}
+        start = _parse_iso_date(date_from, "date_from")
+        end = _parse_iso_date(date_to, "date_to")
+        if (start or end) and file_type != "events":
+            raise HTTPException(status_code=400, detail="date_from and date_to only apply to event categories")
+        field_list = _split_param(fields)
+        etag = make_etag("data", snapshot.version, category_id, limit, offset, field_list, sorted(facets.items()), date_from, date_to)
+
+        def build():
+            if not entries:
+                return {"entries": []}
+            index = snapshot.facets[file_type].get(category_id)
+            mask = filter_mask(entries, facets, start, end, index)
+            matched = [entries[i] for i in positions(mask)]
+            page = matched[offset:offset + limit] if limit else matched[offset:]
+            next_offset = offset + len(page)
+            return {
+                "entries": project_entries(page, field_list),
+                "category": category_id,
+                "type": file_type,
+                "total": len(matched),
+                "next_cursor": encode_cursor(next_offset) if limit and next_offset < len(matched) else None,
+                "facet_counts": index.counts(mask) if index is not None else {},
+            }
+
+        return cached_json_response(request, etag, build)
     except HTTPException:
         raise
     except Exception as e:
@@ -938,4 +1261,8 @@ def root():
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    """Readiness: 200 once the worker is warm (data indexed, upstream connected, cache primed), 503 before."""
+    status = warm_status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming", **status})
+    return {"status": "ok", **status}
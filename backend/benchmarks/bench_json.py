@@ -0,0 +1,80 @@
+"""
+Serialization benchmark: FastAPI default path vs the json_codec fast path.
+
+For each discovery/admin payload it times
+  - default: jsonable_encoder + stdlib json (what JSONResponse does)
+  - orjson:  ORJSONResponse after jsonable_encoder
+  - direct:  json_codec.dumps on the cached records (no jsonable_encoder)
+and for the JSON stores, indent=2 stdlib writes vs compact json_codec writes.
+
+Run from backend/:  python benchmarks/bench_json.py [--repeat 200]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+import json_codec  # noqa: E402
+from dataset import DATA_TYPES, get_dataset  # noqa: E402
+
+
+def _time(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def _stdlib(payload):
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_response(payload):
+    return json_codec.orjson.dumps(jsonable_encoder(payload))
+
+
+def payloads():
+    snapshot = get_dataset()
+    for file_type in DATA_TYPES:
+        for category_id, entries in snapshot.all_data[file_type].items():
+            yield f"/api/discovery/data?category_id={category_id}", {"entries": entries, "category": category_id, "type": file_type}
+    applications = BACKEND_DIR / "applications.txt"
+    if applications.exists():
+        yield "/api/admin/applications", json.loads(applications.read_text(encoding="utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"orjson available: {json_codec.orjson is not None}")
+    print(f"{'endpoint':55} {'bytes':>8} {'default us':>11} {'orjson us':>10} {'direct us':>10} {'saved':>7}")
+    for name, payload in payloads():
+        size = len(_stdlib(payload))
+        default_us = _time(lambda: _stdlib(payload), args.repeat)
+        orjson_us = _time(lambda: _orjson_response(payload), args.repeat) if json_codec.orjson else float("nan")
+        direct_us = _time(lambda: json_codec.dumps(payload), args.repeat)
+        print(f"{name:55} {size:8d} {default_us:11.1f} {orjson_us:10.1f} {direct_us:10.1f} {1 - direct_us / default_us:6.0%}")
+
+    print()
+    print(f"{'store write':55} {'indent=2 us':>11} {'compact us':>10} {'saved':>7}")
+    for store in ("database.txt", "applications.txt"):
+        path = BACKEND_DIR / store
+        if not path.exists():
+            continue
+        data = json.loads(path.read_text(encoding="utf-8"))
+        pretty_us = _time(lambda: json.dumps(data, indent=2), args.repeat)
+        compact_us = _time(lambda: json_codec.dumps(data), args.repeat)
+        print(f"{store:55} {pretty_us:11.1f} {compact_us:10.1f} {1 - compact_us / pretty_us:6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,540 @@
+"""
+Tiered cache for chat answers and encoded discovery responses.
+
+Lookups go through up to three tiers, fastest first:
+    memory  - per-process LRU, bounded by entry count and bytes
+    disk    - SQLite file (CACHE_SQLITE_PATH, default in the temp dir), shared by the workers
+              on a machine and surviving restarts; size-bounded, least recently used evicted
+              (hits refresh recency in batches, not one write per hit)
+    redis   - optional, when REDIS_URL is set: any server speaking the Redis protocol (RESP),
+              shared across machines and cold starts
+A hit in a lower tier is copied into the tiers above it. Keys are namespaced ("chat",
+"http-body") and hashed; every entry carries an expiry and an optional version tag (the
+dataset version), and an entry whose tag differs from the caller's is a miss, so a data
+reload invalidates without a purge. Backend failures count as misses - the cache never
+fails a request: a tier that raises is skipped for CACHE_TIER_BACKOFF seconds, then tried
+again.
+
+`python cache.py resp-server [port]` runs a minimal in-memory RESP stand-in (GET, SET with
+PX, DEL, PING) for trying the redis tier locally.
+"""
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from json_codec import dumps, loads
+
+log = logging.getLogger(__name__)
+
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "anang")
+CACHE_MEMORY_ITEMS = int(os.getenv("CACHE_MEMORY_ITEMS", "512"))
+CACHE_MEMORY_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))
+# Empty string disables the disk tier
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", str(Path(tempfile.gettempdir()) / "anang-cache.sqlite3"))
+CACHE_DISK_MAX_BYTES = int(os.getenv("CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+# Disk hits are recorded for LRU in one write per this many hits, or after this many seconds
+CACHE_DISK_TOUCH_BATCH = int(os.getenv("CACHE_DISK_TOUCH_BATCH", "64"))
+CACHE_DISK_TOUCH_SECONDS = float(os.getenv("CACHE_DISK_TOUCH_SECONDS", "5"))
+REDIS_URL = os.getenv("REDIS_URL", "")
+# Default time to live of an entry, in seconds
+CACHE_DEFAULT_TTL = float(os.getenv("CACHE_DEFAULT_TTL", "3600"))
+# Seconds a tier that raised is skipped before it is tried again
+CACHE_TIER_BACKOFF = float(os.getenv("CACHE_TIER_BACKOFF", "30"))
+
+
+class MemoryBackend:
+    """In-process LRU of key -> (expires_at, value bytes)."""
+    name = "memory"
+
+    def __init__(self, max_items: int = CACHE_MEMORY_ITEMS, max_bytes: int = CACHE_MEMORY_MAX_BYTES):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[float, bytes]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                self._remove(key)
+                return None
+            self._items.move_to_end(key)
+            return item
+
+    def set(self, key: str, value: bytes, expires_at: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._items[key] = (expires_at, value)
+            self._bytes += len(value)
+            while len(self._items) > self.max_items or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._items)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[1])
+
+    def usage(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes, "max_entries": self.max_items, "max_bytes": self.max_bytes}
+
+
+class SQLiteBackend:
+    """Entries in one SQLite table; WAL mode so worker processes read while one writes.
+
+    The total stored size is kept in cache_size by triggers, so every process sees the same
+    running total without summing the table. Hits are queued and their used_at written in
+    one transaction per batch (and before each eviction).
+    """
+    name = "disk"
+
+    def __init__(self, path: Path, max_bytes: int = CACHE_DISK_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> time of its latest hit not yet written
+        self._touched: Dict[str, float] = {}
+        self._touched_since = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # One transaction, so a worker starting alongside another cannot seed the total twice
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+                " expires_at REAL NOT NULL, used_at REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_used_at ON cache (used_at)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)")
+            self._db.execute("INSERT OR IGNORE INTO cache_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM cache")
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON cache"
+                " BEGIN UPDATE cache_size SET total = total + new.size WHERE id = 0; END"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_size_update AFTER UPDATE OF size ON cache"
+                " BEGIN UPDATE cache_size SET total = total + new.size - old.size WHERE id = 0; END"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON cache"
+                " BEGIN UPDATE cache_size SET total = total - old.size WHERE id = 0; END"
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def get(self, key: str) -> Optional[Tuple[float, bytes]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT expires_at, value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] <= now:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            if not self._touched:
+                self._touched_since = now
+            self._touched[key] = now
+            if len(self._touched) >= CACHE_DISK_TOUCH_BATCH or now - self._touched_since >= CACHE_DISK_TOUCH_SECONDS:
+                self._flush_touched()
+        return row[0], bytes(row[1])
+
+    def set(self, key: str, value: bytes, expires_at: float) -> None:
+        now = time.time()
+        with self._lock:
+            # An upsert, not INSERT OR REPLACE: the replaced row's delete would not fire the size trigger
+            self._db.execute(
+                "INSERT INTO cache (key, value, expires_at, used_at, size) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at,"
+                " used_at = excluded.used_at, size = excluded.size",
+                (key, value, expires_at, now, len(value)),
+            )
+            self._touched.pop(key, None)
+            self._evict(now)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._touched.pop(key, None)
+
+    def usage(self) -> Dict:
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()
+            stored = self._total()
+        file_bytes = sum(p.stat().st_size for p in self.path.parent.glob(self.path.name + "*") if p.is_file())
+        return {"entries": entries, "bytes": stored, "file_bytes": file_bytes, "max_bytes": self.max_bytes, "path": str(self.path)}
+
+    def _total(self) -> int:
+        return self._db.execute("SELECT total FROM cache_size WHERE id = 0").fetchone()[0]
+
+    def _flush_touched(self) -> None:
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany("UPDATE cache SET used_at = ? WHERE key = ?", [(at, key) for key, at in touched.items()])
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _evict(self, now: float) -> None:
+        self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        total = self._total()
+        if total <= self.max_bytes:
+            return
+        # Queued hits count towards recency
+        self._flush_touched()
+        # Least recently used first, until a tenth below the bound so eviction does not run on every write
+        excess = total - int(self.max_bytes * 0.9)
+        doomed, freed = [], 0
+        for key, size in self._db.execute("SELECT key, size FROM cache ORDER BY used_at"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM cache WHERE key = ?", doomed)
+
+
+class RespBackend:
+    """Redis-protocol backend (GET / SET PX / DEL) over one lazily opened, auto-reconnecting socket."""
+    name = "redis"
+
+    def __init__(self, url: str, timeout: float = 0.5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._call_locked("AUTH", self.password)
+        if self.db:
+            self._call_locked("SELECT", str(self.db))
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    def _call_locked(self, *args) -> Any:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise RuntimeError(f"unexpected reply {line!r}")
+
+    def call(self, *args) -> Any:
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._call_locked(*args)
+                except (OSError, ConnectionError):
+                    self._close()
+                    if attempt == 2:
+                        raise
+
+    def get(self, key: str) -> Optional[Tuple[float, bytes]]:
+        data = self.call("GET", key)
+        if data is None:
+            return None
+        expires_raw, _, value = data.partition(b"\n")
+        return float(expires_raw), value
+
+    def set(self, key: str, value: bytes, expires_at: float) -> None:
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms > 0:
+            self.call("SET", key, b"%.3f\n" % expires_at + value, "PX", str(ttl_ms))
+
+    def delete(self, key: str) -> None:
+        self.call("DEL", key)
+
+    def usage(self) -> Dict:
+        # Entry counts and memory live on the server (shared with other clients); report where it is
+        return {"server": f"{self.host}:{self.port}/{self.db}", "connected": self._sock is not None}
+
+
+class TieredCache:
+    """Namespaced, version-tagged cache over the configured backends (fastest first)."""
+
+    def __init__(self, backends: List):
+        self.backends = backends
+        self.stats = {"hits": 0, "misses": 0, "errors": 0}
+        # namespace -> {"hits", "misses"}, and hits per tier name
+        self.namespace_stats: Dict[str, Dict[str, int]] = {}
+        self.tier_hits: Dict[str, int] = {backend.name: 0 for backend in backends}
+        # tier name -> time until which it is skipped after a failure
+        self._down_until: Dict[str, float] = {}
+        # Lookups run on threadpool and background threads; counters and tier state change under this
+        self._stats_lock = threading.Lock()
+
+    def _key(self, namespace: str, key: Any) -> str:
+        raw = key if isinstance(key, str) else "\x1f".join(str(part) for part in key)
+        return f"{CACHE_PREFIX}:{namespace}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    def _available(self, backend) -> bool:
+        """False while a failed tier's backoff runs; once it is over the tier gets one more try."""
+        until = self._down_until.get(backend.name)
+        return until is None or time.time() >= until
+
+    def _failed(self, backend, error: Exception) -> None:
+        with self._stats_lock:
+            self.stats["errors"] += 1
+            newly_down = backend.name not in self._down_until
+            self._down_until[backend.name] = time.time() + CACHE_TIER_BACKOFF
+        if newly_down:
+            log.warning("cache tier unavailable", extra={"tier": backend.name, "error": str(error), "backoff": CACHE_TIER_BACKOFF})
+
+    def _recovered(self, backend) -> None:
+        if backend.name not in self._down_until:
+            return
+        with self._stats_lock:
+            was_down = self._down_until.pop(backend.name, None) is not None
+        if was_down:
+            log.info("cache tier recovered", extra={"tier": backend.name})
+
+    def get_bytes(self, namespace: str, key: Any, version: Optional[str] = None) -> Optional[bytes]:
+        """Cached bytes for (namespace, key) with this version tag, or None."""
+        full_key = self._key(namespace, key)
+        tag = (version or "").encode("utf-8")
+        for depth, backend in enumerate(self.backends):
+            if not self._available(backend):
+                continue
+            try:
+                item = backend.get(full_key)
+            except Exception as e:
+                self._failed(backend, e)
+                continue
+            self._recovered(backend)
+            if item is None:
+                continue
+            expires_at, stored = item
+            stored_tag, _, value = stored.partition(b"\n")
+            if stored_tag != tag:
+                continue
+            # Copy into the faster tiers that missed
+            for upper in self.backends[:depth]:
+                self._set_in(upper, full_key, stored, expires_at)
+            self._count(namespace, "hits", backend.name)
+            return value
+        self._count(namespace, "misses")
+        return None
+
+    def _count(self, namespace: str, outcome: str, tier: Optional[str] = None) -> None:
+        with self._stats_lock:
+            self.stats[outcome] += 1
+            counts = self.namespace_stats.get(namespace)
+            if counts is None:
+                counts = self.namespace_stats[namespace] = {"hits": 0, "misses": 0}
+            counts[outcome] += 1
+            if tier is not None:
+                self.tier_hits[tier] += 1
+
+    def set_bytes(self, namespace: str, key: Any, value: bytes, ttl: Optional[float] = None, version: Optional[str] = None) -> None:
+        full_key = self._key(namespace, key)
+        stored = (version or "").encode("utf-8") + b"\n" + value
+        expires_at = time.time() + (CACHE_DEFAULT_TTL if ttl is None else ttl)
+        for backend in self.backends:
+            self._set_in(backend, full_key, stored, expires_at)
+
+    def _set_in(self, backend, full_key: str, stored: bytes, expires_at: float) -> None:
+        if not self._available(backend):
+            return
+        try:
+            backend.set(full_key, stored, expires_at)
+        except Exception as e:
+            self._failed(backend, e)
+            return
+        self._recovered(backend)
+
+    def get(self, namespace: str, key: Any, version: Optional[str] = None) -> Any:
+        """Cached JSON value, or None on a miss."""
+        data = self.get_bytes(namespace, key, version)
+        return loads(data) if data is not None else None
+
+    def set(self, namespace: str, key: Any, value: Any, ttl: Optional[float] = None, version: Optional[str] = None) -> None:
+        self.set_bytes(namespace, key, dumps(value), ttl, version)
+
+    def delete(self, namespace: str, key: Any) -> None:
+        full_key = self._key(namespace, key)
+        for backend in self.backends:
+            if not self._available(backend):
+                continue
+            try:
+                backend.delete(full_key)
+            except Exception as e:
+                self._failed(backend, e)
+                continue
+            self._recovered(backend)
+
+    def usage(self) -> Dict:
+        """Counters, hit ratios (overall and per namespace) and each tier's size."""
+        def ratio(counts: Dict[str, int]) -> float:
+            lookups = counts["hits"] + counts["misses"]
+            return round(counts["hits"] / lookups, 3) if lookups else 0.0
+
+        with self._stats_lock:
+            stats = dict(self.stats)
+            namespaces = {name: dict(counts) for name, counts in self.namespace_stats.items()}
+            tier_hits = dict(self.tier_hits)
+            down_until = dict(self._down_until)
+        tiers = {}
+        now = time.time()
+        for backend in self.backends:
+            tier = {"hits": tier_hits[backend.name]}
+            if backend.name in down_until:
+                tier["skipped_for"] = round(max(0.0, down_until[backend.name] - now), 1)
+            try:
+                tiers[backend.name] = {**tier, **backend.usage()}
+            except Exception as e:
+                tiers[backend.name] = {**tier, "error": str(e)}
+        return {
+            **stats,
+            "hit_ratio": ratio(stats),
+            "namespaces": {name: {**counts, "hit_ratio": ratio(counts)} for name, counts in sorted(namespaces.items())},
+            "tiers": tiers,
+        }
+
+
+def build_backends() -> List:
+    backends: List = [MemoryBackend()]
+    if CACHE_SQLITE_PATH:
+        try:
+            backends.append(SQLiteBackend(Path(CACHE_SQLITE_PATH)))
+        except (OSError, sqlite3.Error) as e:
+            log.warning("disk cache disabled", extra={"path": CACHE_SQLITE_PATH, "error": str(e)})
+    if REDIS_URL:
+        backends.append(RespBackend(REDIS_URL))
+    return backends
+
+
+_cache: Optional[TieredCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TieredCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TieredCache(build_backends())
+    return _cache
+
+
+def serve_resp(port: int = 6380) -> None:
+    """Minimal single-process RESP server (GET, SET [PX ms], DEL, PING, SELECT, AUTH) for local testing."""
+    import socketserver
+
+    store = {}
+    lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def read_command(self):
+            line = self.rfile.readline()
+            if not line.startswith(b"*"):
+                return None
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            return args
+
+        def handle(self):
+            while True:
+                args = self.read_command()
+                if not args:
+                    return
+                command = args[0].upper()
+                with lock:
+                    if command == b"GET":
+                        item = store.get(args[1])
+                        if item and item[0] is not None and item[0] <= time.time():
+                            store.pop(args[1], None)
+                            item = None
+                        reply = b"$-1\r\n" if item is None else b"$%d\r\n%s\r\n" % (len(item[1]), item[1])
+                    elif command == b"SET":
+                        expires = time.time() + int(args[4]) / 1000 if len(args) >= 5 and args[3].upper() == b"PX" else None
+                        store[args[1]] = (expires, args[2])
+                        reply = b"+OK\r\n"
+                    elif command == b"DEL":
+                        reply = b":%d\r\n" % sum(1 for key in args[1:] if store.pop(key, None) is not None)
+                    elif command in (b"PING", b"SELECT", b"AUTH"):
+                        reply = b"+PONG\r\n" if command == b"PING" else b"+OK\r\n"
+                    else:
+                        reply = b"-ERR unknown command\r\n"
+                self.wfile.write(reply)
+
+    class Server(socketserver.ThreadingTCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+
+    with Server(("127.0.0.1", port), Handler) as server:
+        print(f"✅ RESP stand-in listening on 127.0.0.1:{port} (REDIS_URL=redis://127.0.0.1:{port})")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "resp-server":
+        serve_resp(int(sys.argv[2]) if len(sys.argv) > 2 else 6380)
+    else:
+        sys.exit("usage: python cache.py resp-server [port]")
@@ -0,0 +1,89 @@
+"""
+Background hot reload of the Food/, Places/ and Events/ data files.
+
+A daemon thread waits for filesystem events (inotify via watchfiles, when installed) or
+polls file signatures every DATA_POLL_INTERVAL seconds, and hands the changed .txt files
+to dataset.reload_files(), which reparses only those files and publishes a new data
+version. While the watcher runs, get_dataset() serves the current version without
+touching the filesystem.
+"""
+import logging
+import os
+import threading
+from pathlib import Path
+
+import dataset
+
+try:
+    import watchfiles  # installed with uvicorn[standard]
+except ImportError:
+    watchfiles = None
+
+log = logging.getLogger(__name__)
+
+# Set DATA_WATCH=0 to disable the watcher (requests then stat the data files instead).
+DATA_WATCH_ENABLED = os.getenv("DATA_WATCH", "1").lower() not in ("0", "false", "no")
+# Seconds between scans when watchfiles is unavailable.
+DATA_POLL_INTERVAL = float(os.getenv("DATA_POLL_INTERVAL") or 2.0)
+
+_stop = threading.Event()
+_thread = None
+
+
+def _watch_with_watchfiles() -> None:
+    directories = [str(d) for d in dataset.DATA_DIRS.values() if d.exists()]
+    if not directories:
+        return
+    for changes in watchfiles.watch(*directories, stop_event=_stop, recursive=False):
+        changed = {Path(path) for _, path in changes if path.endswith(".txt")}
+        if changed:
+            dataset.reload_files(changed)
+
+
+def _watch_with_polling() -> None:
+    while not _stop.wait(DATA_POLL_INTERVAL):
+        current = dataset.get_dataset()
+        data_files = dataset.scan_data_files()
+        seen = {(file_type, p.name): p for file_type, paths in data_files.items() for p in paths}
+        signatures = dataset.file_signatures(data_files)
+        changed = [p for key, p in seen.items() if signatures.get(key) != current.signatures.get(key)]
+        # Removed files: loaded before, gone now
+        changed += [dataset.DATA_DIRS[file_type] / name for file_type, name in current.signatures if (file_type, name) not in seen]
+        if changed:
+            dataset.reload_files(changed)
+
+
+def _run() -> None:
+    try:
+        if watchfiles is not None:
+            _watch_with_watchfiles()
+        else:
+            _watch_with_polling()
+    except Exception:
+        log.exception("data watcher stopped")
+    finally:
+        # Fall back to per-request change detection
+        dataset.set_watched(False)
+
+
+def start_watcher() -> bool:
+    """Load the dataset and start the watcher thread. Returns False if disabled or already running."""
+    global _thread
+    if not DATA_WATCH_ENABLED or (_thread is not None and _thread.is_alive()):
+        return False
+    dataset.get_dataset()
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="data-watcher", daemon=True)
+    _thread.start()
+    dataset.set_watched(True)
+    log.info("data watcher started", extra={"mode": "inotify" if watchfiles is not None else "polling"})
+    return True
+
+
+def stop_watcher() -> None:
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
+    dataset.set_watched(False)
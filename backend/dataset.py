@@ -0,0 +1,460 @@
+"""
+Parsed Kingston data kept in memory between requests.
+
+Files under Food/, Places/ and Events/ are parsed once and reused until one of them
+changes. The data version is a fingerprint of every file's name, size and mtime; it
+changes whenever a file is edited, added or removed, and doubles as the HTTP validator
+for the discovery endpoints. Each file also gets a router.FileIndex (keyword search
+text and certification ordering), its entries' prompt fragments (router.render_fragments)
+their geocoded positions (geo.locate_entries), their parsed opening hours
+(hours.HoursIndex) and bitmap facet indexes (facets.FacetIndex), built at load time.
+
+Everything a request reads lives in one immutable DatasetSnapshot. Reloads and appends
+build a new snapshot (copying only the per-file structures they change) and publish it
+with a single reference assignment, so readers take the current snapshot once per
+request and never lock or see a half-rebuilt dataset.
+
+With SHARED_DATASET_PATH set, entries and the per-file structures derived from them are
+instead served from a read-only memory-mapped image shared by every worker process (see
+shared_dataset.py); any change then rebuilds the image once and every worker remaps it.
+"""
+import base64
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from facets import FACET_TYPES, FacetIndex
+from geo import SpatialIndex, locate_entries
+from hours import HoursIndex, positions
+from router import EVENTS_DIR, FOOD_DIR, PLACES_DIR, FileIndex, parse_data_file, parse_date_from_text, parse_food_entry, parse_shop_entry, render_fragments
+from tracing import traced
+
+log = logging.getLogger(__name__)
+
+DATA_TYPES = ("food", "places", "events")
+DATA_DIRS = {"food": FOOD_DIR, "places": PLACES_DIR, "events": EVENTS_DIR}
+# Per-file structures derived from a file's entries (snapshot fields shaped like all_data)
+DERIVED_MAPS = ("indexes", "fragments", "locations", "hours", "facets")
+# Image file shared by all workers (e.g. /dev/shm/anang-dataset.img); unset = per-process data.
+SHARED_DATASET_PATH = Path(os.environ["SHARED_DATASET_PATH"]) if os.getenv("SHARED_DATASET_PATH") else None
+
+
+@dataclass(frozen=True)
+class DatasetSnapshot:
+    """
+    One published version of the parsed data.
+    all_data maps type ("food", "places", "events") -> {stem: entries}; indexes mirrors it with a
+    FileIndex per file, fragments with the pre-rendered prompt blocks of each file's entries
+    and locations with their projected positions (None where not geocoded); spatial indexes
+    those positions; hours and facets have an HoursIndex and a FacetIndex per file; files maps
+    type -> {stem: Path}. The maps are read-only views and the entry lists are never mutated
+    after publication.
+    """
+    version: Optional[str]
+    signatures: Mapping[Tuple[str, str], Tuple[int, int]]
+    all_data: Mapping[str, Mapping[str, List[Dict]]]
+    indexes: Mapping[str, Mapping[str, FileIndex]]
+    fragments: Mapping[str, Mapping[str, Dict[int, Tuple[str, ...]]]]
+    locations: Mapping[str, Mapping[str, List[Optional[Tuple[float, float]]]]]
+    hours: Mapping[str, Mapping[str, HoursIndex]]
+    facets: Mapping[str, Mapping[str, FacetIndex]]
+    files: Mapping[str, Mapping[str, Path]]
+    spatial: SpatialIndex
+
+    @classmethod
+    def build(cls, signatures: Dict, all_data: Dict, indexes: Dict, fragments: Dict, locations: Dict, hours: Dict, facets: Dict, files: Dict) -> "DatasetSnapshot":
+        def freeze(by_type: Dict) -> Mapping:
+            return MappingProxyType({file_type: MappingProxyType(dict(by_type[file_type])) for file_type in DATA_TYPES})
+        return cls(
+            version=fingerprint(signatures),
+            signatures=MappingProxyType(dict(signatures)),
+            all_data=freeze(all_data),
+            indexes=freeze(indexes),
+            fragments=freeze(fragments),
+            locations=freeze(locations),
+            hours=freeze(hours),
+            facets=freeze(facets),
+            files=freeze(files),
+            spatial=SpatialIndex.build(all_data, locations),
+        )
+
+    def thaw(self) -> Dict[str, Dict]:
+        """Mutable shallow copies of the maps, as keyword arguments for build(), to derive the next snapshot from."""
+        draft = {
+            name: {file_type: dict(getattr(self, name)[file_type]) for file_type in DATA_TYPES}
+            for name in ("all_data", *DERIVED_MAPS, "files")
+        }
+        draft["signatures"] = dict(self.signatures)
+        return draft
+
+
+EMPTY_SNAPSHOT = DatasetSnapshot(
+    version=None,
+    signatures=MappingProxyType({}),
+    all_data=MappingProxyType({file_type: MappingProxyType({}) for file_type in DATA_TYPES}),
+    indexes=MappingProxyType({file_type: MappingProxyType({}) for file_type in DATA_TYPES}),
+    fragments=MappingProxyType({file_type: MappingProxyType({}) for file_type in DATA_TYPES}),
+    locations=MappingProxyType({file_type: MappingProxyType({}) for file_type in DATA_TYPES}),
+    hours=MappingProxyType({file_type: MappingProxyType({}) for file_type in DATA_TYPES}),
+    facets=MappingProxyType({file_type: MappingProxyType({}) for file_type in DATA_TYPES}),
+    files=MappingProxyType({file_type: MappingProxyType({}) for file_type in DATA_TYPES}),
+    spatial=SpatialIndex({}),
+)
+
+# Writers serialize on _lock; readers only ever read _current.
+_lock = threading.Lock()
+_current = EMPTY_SNAPSHOT
+# Set while data_watcher keeps the dataset current; requests then skip the per-request stat check.
+_watched = False
+
+
+def scan_data_files() -> Dict[str, List[Path]]:
+    """The .txt files in each data folder, per type, in directory order."""
+    return {
+        file_type: list(directory.glob("*.txt")) if directory.exists() else []
+        for file_type, directory in DATA_DIRS.items()
+    }
+
+
+def file_type_for(file_path: Path) -> Optional[str]:
+    """"food"/"places"/"events" for a .txt file directly inside one of the data folders, else None."""
+    if file_path.suffix != ".txt":
+        return None
+    for file_type, directory in DATA_DIRS.items():
+        if file_path.parent == directory:
+            return file_type
+    return None
+
+
+def _signature(file_path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = file_path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def file_signatures(data_files: Dict[str, List[Path]]) -> Dict[Tuple[str, str], Tuple[int, int]]:
+    signatures = {}
+    for file_type in DATA_TYPES:
+        for file_path in data_files[file_type]:
+            signature = _signature(file_path)
+            if signature is not None:
+                signatures[(file_type, file_path.name)] = signature
+    return signatures
+
+
+def fingerprint(signatures: Dict[Tuple[str, str], Tuple[int, int]]) -> str:
+    """Stable short hash of the file signatures - the data version."""
+    h = hashlib.sha1()
+    for (file_type, name), (mtime_ns, size) in sorted(signatures.items()):
+        h.update(f"{file_type}/{name}:{mtime_ns}:{size}\n".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _parse_all(data_files: Dict[str, List[Path]]) -> Tuple[Dict, Dict, Dict]:
+    all_data = {file_type: {} for file_type in DATA_TYPES}
+    indexes = {file_type: {} for file_type in DATA_TYPES}
+    files = {file_type: {} for file_type in DATA_TYPES}
+    for file_type in DATA_TYPES:
+        for file_path in data_files[file_type]:
+            files[file_type][file_path.stem] = file_path
+            parsed_entries = parse_data_file(file_type, file_path)
+            if parsed_entries is not None:
+                all_data[file_type][file_path.stem] = parsed_entries
+                indexes[file_type][file_path.stem] = FileIndex(parsed_entries)
+    return all_data, indexes, files
+
+
+def _files_by_stem(data_files: Dict[str, List[Path]]) -> Dict:
+    return {file_type: {p.stem: p for p in data_files[file_type]} for file_type in DATA_TYPES}
+
+
+def build_shared_image(path: Path, data_files: Dict[str, List[Path]], signatures: Dict):
+    """Map the shared image for these signatures, building it first if no worker has yet. Returns (image, built)."""
+    import shared_dataset
+
+    def build():
+        all_data, indexes, _ = _parse_all(data_files)
+        draft = EMPTY_SNAPSHOT.thaw()
+        for file_type in DATA_TYPES:
+            for stem, entries in all_data[file_type].items():
+                _set_file(draft, file_type, stem, entries, indexes[file_type][stem])
+        return draft
+    return shared_dataset.open_or_build(path, signatures, build)
+
+
+def _set_file(draft: Dict, file_type: str, stem: str, entries: List[Dict], index: Optional[FileIndex] = None) -> None:
+    """Put a file's entries, and everything derived from them, into a thawed snapshot."""
+    draft["all_data"][file_type][stem] = entries
+    draft["indexes"][file_type][stem] = index if index is not None else FileIndex(entries)
+    draft["fragments"][file_type][stem] = render_fragments(file_type, entries)
+    draft["locations"][file_type][stem] = locate_entries(entries)
+    draft["hours"][file_type][stem] = HoursIndex(entries)
+    draft["facets"][file_type][stem] = FacetIndex(entries)
+
+
+def _drop_file(draft: Dict, file_type: str, stem: str) -> None:
+    for name in ("all_data", *DERIVED_MAPS):
+        draft[name][file_type].pop(stem, None)
+
+
+@traced("dataset.load")
+def _load_all(data_files: Dict[str, List[Path]], signatures: Dict) -> DatasetSnapshot:
+    draft = EMPTY_SNAPSHOT.thaw()
+    if SHARED_DATASET_PATH is not None:
+        image, _ = build_shared_image(SHARED_DATASET_PATH, data_files, signatures)
+        # Files that failed to parse have no section in the image; they still count as categories.
+        for name in ("all_data", *DERIVED_MAPS):
+            for file_type in DATA_TYPES:
+                draft[name][file_type] = dict(getattr(image, name).get(file_type, {}))
+        draft["signatures"], draft["files"] = dict(image.signatures), _files_by_stem(data_files)
+        return DatasetSnapshot.build(**draft)
+    all_data, indexes, files = _parse_all(data_files)
+    draft["signatures"], draft["files"] = dict(signatures), files
+    for file_type in DATA_TYPES:
+        for stem, entries in all_data[file_type].items():
+            _set_file(draft, file_type, stem, entries, indexes[file_type][stem])
+    return DatasetSnapshot.build(**draft)
+
+
+def get_dataset() -> DatasetSnapshot:
+    """
+    Return the current DatasetSnapshot. Take it once per request and use it throughout.
+    While the file watcher runs this is a plain read; otherwise every call stats the data
+    files and reloads when one changed.
+    """
+    global _current
+    current = _current
+    if _watched and current.version is not None:
+        return current
+    data_files = scan_data_files()
+    signatures = file_signatures(data_files)
+    if signatures == current.signatures:
+        return current
+    with _lock:
+        if signatures == _current.signatures:
+            return _current
+        _current = _load_all(data_files, signatures)
+        log.info("dataset loaded", extra={"version": _current.version, "files": len(signatures)})
+        return _current
+
+
+@traced("dataset.reload")
+def reload_files(file_paths) -> bool:
+    """
+    Reparse only the given data files (changed, added or removed) and publish a new version.
+    Files whose size and mtime already match the loaded version are skipped.
+    Returns True if a new version was published.
+    """
+    global _current
+    with _lock:
+        current = _current
+        if current.version is None or SHARED_DATASET_PATH is not None:
+            # The shared image is rebuilt as a whole (once, by whichever worker notices first)
+            data_files = scan_data_files()
+            signatures = file_signatures(data_files)
+            if signatures == current.signatures:
+                return False
+            _current = _load_all(data_files, signatures)
+            return True
+        draft = current.thaw()
+        signatures, files = draft["signatures"], draft["files"]
+        changed = False
+        for file_path in file_paths:
+            file_path = Path(file_path)
+            file_type = file_type_for(file_path)
+            if file_type is None:
+                continue
+            key = (file_type, file_path.name)
+            signature = _signature(file_path)
+            if signature == signatures.get(key):
+                continue
+            changed = True
+            if signature is None:
+                signatures.pop(key, None)
+                files[file_type].pop(file_path.stem, None)
+                _drop_file(draft, file_type, file_path.stem)
+                log.info("data file removed", extra={"file": file_path.name})
+                continue
+            signatures[key] = signature
+            files[file_type][file_path.stem] = file_path
+            parsed_entries = parse_data_file(file_type, file_path)
+            if parsed_entries is None:
+                _drop_file(draft, file_type, file_path.stem)
+            else:
+                _set_file(draft, file_type, file_path.stem, parsed_entries)
+            log.info("data file reloaded", extra={"file": file_path.name})
+        if not changed:
+            return False
+        _current = DatasetSnapshot.build(**draft)
+        return True
+
+
+def set_watched(watched: bool) -> None:
+    global _watched
+    _watched = watched
+
+
+@traced("dataset.append_entries")
+def append_food_entries(blocks: Iterable[Tuple[Path, str]]) -> None:
+    """
+    Append entry blocks to Food/*.txt files and index them, without a reparse, publishing one
+    new version for the whole batch. Each block is parsed with its file's parser and added to
+    copies of that file's entries and derived structures - FileIndex, fragments, locations,
+    hours and facet bitmaps all extend by the new entries only (other files are shared with
+    the previous snapshot); in shared mode the image is rebuilt once. The file writes and the snapshot
+    swap happen under the dataset lock so a concurrent reload cannot interleave with them.
+    """
+    global _current
+    by_file: Dict[Path, List[str]] = {}
+    for file_path, block in blocks:
+        by_file.setdefault(Path(file_path), []).append(block)
+    if not by_file:
+        return
+    with _lock:
+        for file_path, file_blocks in by_file.items():
+            with open(file_path, "a", encoding="utf-8") as f:
+                f.write("".join(file_blocks))
+        current = _current
+        if current.version is None:
+            # Nothing loaded yet: the first load picks the entries up
+            return
+        if SHARED_DATASET_PATH is not None:
+            # Other workers map the same image: rebuild it so they pick the entries up too
+            data_files = scan_data_files()
+            _current = _load_all(data_files, file_signatures(data_files))
+            return
+        draft = current.thaw()
+        changed = False
+        for file_path, file_blocks in by_file.items():
+            stem = file_path.stem
+            if stem not in current.files["food"]:
+                # A file we have not seen: the next reload picks it up
+                continue
+            changed = True
+            parse = parse_shop_entry if stem == "shops" else parse_food_entry
+            added = [parse(block) for block in file_blocks]
+            entries = list(draft["all_data"]["food"].get(stem, [])) + added
+            index = draft["indexes"]["food"].get(stem)
+            draft["all_data"]["food"][stem] = entries
+            draft["indexes"]["food"][stem] = index.extended(*added) if index is not None else FileIndex(added)
+            draft["fragments"]["food"][stem] = {**draft["fragments"]["food"].get(stem, {}), **render_fragments("food", added)}
+            draft["locations"]["food"][stem] = list(draft["locations"]["food"].get(stem, [])) + locate_entries(added)
+            hours, facets = draft["hours"]["food"].get(stem), draft["facets"]["food"].get(stem)
+            draft["hours"]["food"][stem] = hours.extended(*added) if hours is not None else HoursIndex(entries)
+            draft["facets"]["food"][stem] = facets.extended(*added) if facets is not None else FacetIndex(entries)
+            draft["signatures"][("food", file_path.name)] = _signature(file_path)
+        if changed:
+            _current = DatasetSnapshot.build(**draft)
+
+
+def open_masks(snapshot: DatasetSnapshot, minute_of_week: int) -> Dict[str, Dict[str, int]]:
+    """Bitmask of the entry positions open at a minute of the week, per food and places file."""
+    return {
+        file_type: {stem: index.open_at(minute_of_week) for stem, index in snapshot.hours[file_type].items()}
+        for file_type in ("food", "places")
+    }
+
+
+def facet_masks(snapshot: DatasetSnapshot, facets: Dict[str, List[str]]) -> Dict[str, Dict[str, int]]:
+    """Bitmask of the entry positions matching the facet filters, per file of each type that carries those facets."""
+    masks = {}
+    for file_type in DATA_TYPES:
+        applicable = {field: values for field, values in facets.items() if file_type in FACET_TYPES.get(field, ())}
+        if applicable:
+            masks[file_type] = {stem: index.select(applicable) for stem, index in snapshot.facets[file_type].items()}
+    return masks
+
+
+def find_category(snapshot: DatasetSnapshot, category_id: str) -> Tuple[Optional[str], Optional[List[Dict]]]:
+    """Return (file_type, entries) for a category id (file stem), or (None, None) if unknown."""
+    for file_type in DATA_TYPES:
+        if category_id in snapshot.files[file_type]:
+            return file_type, snapshot.all_data[file_type].get(category_id) or []
+    return None, None
+
+
+# Query-string filters for /api/discovery/data -> entry field they match (case-insensitive, comma = OR).
+FACET_FILTERS = {
+    "accessibility": "accessibility",
+    "washrooms": "washrooms",
+    "veg_vegan": "veg_vegan",
+    "certification": "certification",
+    "local_sourcing": "local_sourcing",
+}
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """Offset encoded in a cursor; raises ValueError for a malformed cursor."""
+    if not cursor:
+        return 0
+    padded = cursor + "=" * (-len(cursor) % 4)
+    offset = int(base64.urlsafe_b64decode(padded.encode()).decode())
+    if offset < 0:
+        raise ValueError("negative offset")
+    return offset
+
+
+def _event_overlaps(entry: Dict, date_from: Optional[datetime], date_to: Optional[datetime]) -> bool:
+    start = parse_date_from_text(entry.get("start_date") or "")
+    end = parse_date_from_text(entry.get("end_date") or "") or start
+    if not start:
+        return False
+    if date_from and end < date_from:
+        return False
+    if date_to and start > date_to:
+        return False
+    return True
+
+
+def filter_mask(
+    entries: List[Dict],
+    facets: Dict[str, List[str]],
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    index: Optional[FacetIndex] = None,
+) -> int:
+    """
+    Bitmask of the entry positions matching every facet filter (field -> accepted values) and,
+    for events, overlapping the [date_from, date_to] range. Entries without a name never match.
+    index (the file's FacetIndex) answers the facet filters from its bitmaps instead of a scan.
+    """
+    if index is None:
+        index = FacetIndex(entries)
+    mask = index.select(facets) & index.named
+    if date_from or date_to:
+        kept = 0
+        for i in positions(mask):
+            if _event_overlaps(entries[i], date_from, date_to):
+                kept |= 1 << i
+        mask = kept
+    return mask
+
+
+def filter_entries(
+    entries: List[Dict],
+    facets: Dict[str, List[str]],
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    index: Optional[FacetIndex] = None,
+) -> List[Dict]:
+    """The entries of filter_mask, in file order."""
+    return [entries[i] for i in positions(filter_mask(entries, facets, date_from, date_to, index))]
+
+
+def project_entries(entries: List[Dict], fields: Optional[List[str]]) -> List[Dict]:
+    """Keep only the requested fields of each entry (all fields when fields is empty). Always returns plain dicts."""
+    if not fields:
+        return [entry if isinstance(entry, dict) else dict(entry) for entry in entries]
+    return [{f: entry[f] for f in fields if f in entry} for entry in entries]
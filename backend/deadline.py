@@ -0,0 +1,108 @@
+"""
+Per-request time budgets for chat answers.
+
+A Deadline is created when a chat request arrives and handed down through retrieval and
+the OpenRouter call: each stage checks how much of the budget is left, the upstream call
+gets the remainder as its timeout, and when too little is left for the model the request
+is answered from the retrieved entries directly. The endpoint cancels the deadline when the
+client disconnects; cancellation callbacks (abort_on_cancel shuts down the upstream socket)
+abort the in-flight OpenRouter request so no worker time or tokens are spent on an answer
+nobody reads.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+log = logging.getLogger(__name__)
+
+# Total time a chat request may take, retrieval and model call included
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "60"))
+# Below this much remaining budget the model is not called and a listing answer is returned
+LLM_MIN_BUDGET_SECONDS = float(os.getenv("LLM_MIN_BUDGET_SECONDS", "5"))
+
+
+class RequestCancelled(Exception):
+    """The client went away; the answer is no longer wanted."""
+
+
+class Deadline:
+    """Time budget for one request plus a cancellation flag, safe to share between threads."""
+
+    def __init__(self, budget_seconds: float = CHAT_DEADLINE_SECONDS):
+        self.expires_at = time.monotonic() + budget_seconds
+        self._cancelled = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self) -> None:
+        """Raise RequestCancelled if the request was cancelled (call between stages)."""
+        if self._cancelled.is_set():
+            raise RequestCancelled()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Run callback when the request is cancelled (immediately if it already was)."""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                log.exception("cancel callback failed")
+
+
+def abort_on_cancel(deadline: Deadline) -> Callable[[str, Dict[str, Any]], None]:
+    """
+    httpx/httpcore "trace" request extension that registers each new upstream connection with
+    the deadline: cancelling it shuts the socket down, which fails a blocking read at once
+    (closing the client from another thread would only take effect after the response).
+    """
+    def trace(event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            sock = info["return_value"].get_extra_info("socket")
+            if sock is not None:
+                deadline.on_cancel(lambda: _shutdown(sock))
+    return trace
+
+
+def abort_response_on_cancel(deadline: Deadline, response) -> None:
+    """
+    Register the connection a (streamed) response arrived on, which may be a pooled one that
+    abort_on_cancel never saw connect: cancelling shuts it down under the reading thread.
+    """
+    stream = response.extensions.get("network_stream")
+    sock = stream.get_extra_info("socket") if stream is not None else None
+    if sock is not None:
+        deadline.on_cancel(lambda: _shutdown(sock))
+
+
+def _shutdown(sock: socket.socket) -> None:
+    try:
+        # socket.socket.shutdown, not SSLSocket.shutdown: shut the TCP connection down without
+        # tearing the TLS object out from under the thread still reading from it
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+    except OSError:
+        pass  # already closed
@@ -0,0 +1,155 @@
+"""
+Facet indexes: accessibility, washrooms, dietary and certification values as bitmaps.
+
+For each data file a FacetIndex maps facet field -> normalized value -> bitmask of the entry
+positions carrying that value, built at load time. A filter ("accessibility in {full access,
+partial access} and washrooms = available") is an OR of bitmaps within a field and an AND
+across fields, so it costs a few integer operations instead of a scan over the entries, and
+the per-value counts the discovery UI shows are popcounts.
+"""
+import re
+from typing import Dict, Iterable, List, Optional
+
+# Facet fields and the data types that carry them
+FACET_TYPES = {
+    "accessibility": ("places",),
+    "washrooms": ("places",),
+    "veg_vegan": ("food",),
+    "certification": ("food",),
+    "local_sourcing": ("food",),
+}
+# Missing and "null" values index as this (the discovery API has always matched them as "null")
+NULL_VALUE = "null"
+_NOT_SOURCED = {"", "null", "none", "no", "not publicly listed"}
+
+
+def facet_value(field: str, entry) -> str:
+    """Normalized (lowercased) facet value of an entry. local_sourcing is free text, indexed as yes/null."""
+    value = str(entry.get(field) or NULL_VALUE).strip().lower()
+    if field == "local_sourcing":
+        return NULL_VALUE if value in _NOT_SOURCED else "yes"
+    return value or NULL_VALUE
+
+
+def popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+class FacetIndex:
+    """
+    Bitmaps of one file's entries: bitmaps[field][value] has bit i set when entry i has that
+    value; labels[field][value] is the value as first written in the data (for display);
+    named marks entries that have a name.
+    """
+    __slots__ = ("size", "named", "bitmaps", "labels")
+
+    def __init__(self, entries: Iterable[Dict]):
+        self.bitmaps: Dict[str, Dict[str, int]] = {field: {} for field in FACET_TYPES}
+        self.labels: Dict[str, Dict[str, str]] = {field: {} for field in FACET_TYPES}
+        self.named = 0
+        self.size = 0
+        for entry in entries:
+            self._add(entry)
+
+    def _add(self, entry: Dict) -> None:
+        bit = 1 << self.size
+        if entry.get("name"):
+            self.named |= bit
+        for field, by_value in self.bitmaps.items():
+            value = facet_value(field, entry)
+            by_value[value] = by_value.get(value, 0) | bit
+            if value not in self.labels[field]:
+                raw = entry.get(field)
+                self.labels[field][value] = str(raw).strip() if raw and field != "local_sourcing" else value.title()
+        self.size += 1
+
+    def extended(self, *entries: Dict) -> "FacetIndex":
+        """A new index with entries appended at the next positions (this one is left unchanged)."""
+        grown = FacetIndex(())
+        grown.bitmaps = {field: dict(by_value) for field, by_value in self.bitmaps.items()}
+        grown.labels = {field: dict(labels) for field, labels in self.labels.items()}
+        grown.named, grown.size = self.named, self.size
+        for entry in entries:
+            grown._add(entry)
+        return grown
+
+    @property
+    def everything(self) -> int:
+        return (1 << self.size) - 1
+
+    def select(self, facets: Dict[str, Iterable[str]]) -> int:
+        """Bitmask of the entries matching every field's filter (field -> accepted values, any of them)."""
+        mask = self.everything
+        for field, values in facets.items():
+            values = [v.strip().lower() for v in values if v.strip()]
+            if not values:
+                continue
+            by_value = self.bitmaps.get(field, {})
+            accepted = 0
+            for value in values:
+                accepted |= by_value.get(value, 0)
+            mask &= accepted
+            if not mask:
+                break
+        return mask
+
+    def counts(self, mask: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+        """Per field, the number of entries (within mask, default all) with each non-null value."""
+        mask = self.everything if mask is None else mask
+        result = {}
+        for field, by_value in self.bitmaps.items():
+            field_counts = {}
+            for value, bits in by_value.items():
+                count = popcount(bits & mask)
+                if value != NULL_VALUE and count:
+                    field_counts[self.labels[field][value]] = count
+            if field_counts:
+                result[field] = field_counts
+        return result
+
+
+# Question wording -> facet filter. Specific rules (a tier, "fully accessible") are unioned
+# within a field; a generic rule ("certified", "accessible") only applies when no specific
+# rule set that field.
+_ACCESSIBLE = ["full access", "partial access", "accessible with assistance"]
+QUESTION_FACET_RULES = [
+    (r"fully accessible|full access|entièrement accessible", "accessibility", ["full access"], False),
+    (r"wheelchair|accessible|accessibility|mobility|fauteuil roulant|accessibilité", "accessibility", _ACCESSIBLE, True),
+    (r"washrooms?|restrooms?|bathrooms?|toilets?|toilettes", "washrooms", ["available", "partial available"], True),
+    (r"vegan|vegetarian|veggie|plant[- ]based|végétarien(?:ne)?s?|végan(?:e)?s?|végétalien(?:ne)?s?", "veg_vegan", ["yes", "limited"], True),
+    (r"gold", "certification", ["gold"], False),
+    (r"silver", "certification", ["silver"], False),
+    (r"bronze", "certification", ["bronze"], False),
+    (r"green plate|certified|certification|certifié(?:e)?s?", "certification", ["gold", "silver", "bronze"], True),
+    (r"locally sourced|local sourcing|local ingredients|local produce|produits locaux", "local_sourcing", ["yes"], True),
+]
+_QUESTION_FACET_RES = [(re.compile(rf"\b(?:{pattern})\b"), field, values, generic) for pattern, field, values, generic in QUESTION_FACET_RULES]
+
+
+def question_facets(question: str) -> Dict[str, List[str]]:
+    """Facet filters a question asks for ("wheelchair accessible museums", "gold certified vegan restaurants")."""
+    question_lower = question.lower()
+    specific: Dict[str, List[str]] = {}
+    generic: Dict[str, List[str]] = {}
+    for pattern, field, values, is_generic in _QUESTION_FACET_RES:
+        if pattern.search(question_lower):
+            target = generic if is_generic else specific
+            target.setdefault(field, [])
+            target[field].extend(v for v in values if v not in target[field])
+    return {**generic, **specific}
+
+
+def intersect_masks(*mask_maps: Optional[Dict[str, Dict[str, int]]]) -> Optional[Dict[str, Dict[str, int]]]:
+    """AND of type -> file -> bitmask maps; a type or file missing from a map is not restricted by it."""
+    result: Optional[Dict[str, Dict[str, int]]] = None
+    for masks in mask_maps:
+        if masks is None:
+            continue
+        if result is None:
+            result = {file_type: dict(by_stem) for file_type, by_stem in masks.items()}
+            continue
+        for file_type, by_stem in masks.items():
+            merged = result.setdefault(file_type, {})
+            for stem, mask in by_stem.items():
+                merged[stem] = merged[stem] & mask if stem in merged else mask
+    return result
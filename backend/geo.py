@@ -0,0 +1,233 @@
+"""
+Offline geocoding and nearest-neighbour search for "near X" questions.
+
+Addresses in the data files and places named in questions are resolved against a local
+gazetteer (Geo/kingston_gazetteer.tsv): landmark coordinates plus numbered street anchors
+that civic numbers are interpolated between. Geocoded entries go into one KD-tree per data
+type so the k nearest entries to a point are found in logarithmic time.
+"""
+import heapq
+import math
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent
+GAZETTEER_PATH = BASE_DIR / "Geo" / "kingston_gazetteer.tsv"
+
+# Entries further than this from the requested place are not offered as "nearby".
+NEARBY_MAX_KM = 5.0
+
+# Equirectangular projection around Kingston: (lat, lon) -> planar km. Accurate to well under
+# 1% over the city, which is all the ranking needs.
+_ORIGIN_LAT = 44.23
+_KM_PER_DEG_LAT = 110.574
+_KM_PER_DEG_LON = 111.320 * math.cos(math.radians(_ORIGIN_LAT))
+
+_STREET_ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "road": "rd", "drive": "dr", "crescent": "cres",
+    "boulevard": "blvd", "place": "pl", "court": "crt", "east": "e", "west": "w",
+}
+_ADDRESS_RE = re.compile(r"\b(\d+)[a-z]?\s+([a-z][a-z' \-]*)")
+
+
+def project(lat: float, lon: float) -> Tuple[float, float]:
+    return (lon * _KM_PER_DEG_LON, lat * _KM_PER_DEG_LAT)
+
+
+def normalize_place_text(text: str) -> str:
+    """Lowercase, drop punctuation (keeping apostrophes and hyphens) and abbreviate street words."""
+    words = re.sub(r"[^\w\s'\-]", " ", text.lower().replace("’", "'")).split()
+    return " ".join(_STREET_ABBREVIATIONS.get(w, w) for w in words)
+
+
+class Gazetteer:
+    """Landmarks (alias -> point) and streets (name -> sorted numbered anchors)."""
+
+    def __init__(self, landmarks: Dict[str, Tuple[str, float, float]], streets: Dict[str, List[Tuple[int, float, float]]]):
+        self.landmarks = landmarks
+        self.streets = {name: sorted(anchors) for name, anchors in streets.items()}
+        # Longest names first so "king st w" wins over a shorter name that is also a prefix
+        self._aliases = sorted(landmarks, key=len, reverse=True)
+        self._street_names = sorted(self.streets, key=len, reverse=True)
+
+    @classmethod
+    def load(cls, path: Path) -> "Gazetteer":
+        landmarks, streets = {}, {}
+        if not path.exists():
+            return cls(landmarks, streets)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                cols = line.rstrip("\n").split("\t")
+                names = [n for n in cols[1].split("|") if n]
+                if cols[0] == "landmark":
+                    lat, lon = float(cols[2]), float(cols[3])
+                    for name in names:
+                        landmarks[normalize_place_text(name)] = (names[0], lat, lon)
+                elif cols[0] == "street":
+                    anchor = (int(cols[2]), float(cols[3]), float(cols[4]))
+                    for name in names:
+                        streets.setdefault(normalize_place_text(name), []).append(anchor)
+        return cls(landmarks, streets)
+
+    def find_landmark(self, normalized: str) -> Optional[Tuple[str, float, float]]:
+        padded = f" {normalized} "
+        for alias in self._aliases:
+            if f" {alias} " in padded:
+                return self.landmarks[alias]
+        return None
+
+    def find_address(self, normalized: str) -> Optional[Tuple[str, float, float]]:
+        """"<number> <street> ..." -> interpolated point, if the street is in the gazetteer."""
+        for match in _ADDRESS_RE.finditer(normalized):
+            number, tail = int(match.group(1)), match.group(2) + " "
+            for street in self._street_names:
+                if tail.startswith(street + " "):
+                    lat, lon = self._interpolate(self.streets[street], number)
+                    return (f"{number} {street.title()}", lat, lon)
+        return None
+
+    @staticmethod
+    def _interpolate(anchors: List[Tuple[int, float, float]], number: int) -> Tuple[float, float]:
+        i = bisect_right([a[0] for a in anchors], number)
+        if i == 0:
+            return anchors[0][1], anchors[0][2]
+        if i == len(anchors):
+            return anchors[-1][1], anchors[-1][2]
+        (n0, lat0, lon0), (n1, lat1, lon1) = anchors[i - 1], anchors[i]
+        t = (number - n0) / (n1 - n0)
+        return lat0 + t * (lat1 - lat0), lon0 + t * (lon1 - lon0)
+
+    def geocode(self, location: str) -> Optional[Tuple[float, float]]:
+        """(lat, lon) for a data-file location: a street address first, else a landmark it names."""
+        if not location:
+            return None
+        normalized = normalize_place_text(location)
+        found = self.find_address(normalized) or self.find_landmark(normalized)
+        return (found[1], found[2]) if found else None
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer() -> Gazetteer:
+    return Gazetteer.load(GAZETTEER_PATH)
+
+
+# Words that introduce a place in a question ("cafes near fort henry", "pubs around 200 princess st")
+_NEAR_RE = re.compile(r"\b(?:near|nearby|around|close to|next to|by|at|on)\s+(.+)")
+
+
+class Place(NamedTuple):
+    label: str
+    lat: float
+    lon: float
+    start: int  # where the "near ..." phrase begins in the question
+
+
+def resolve_place(question: str) -> Optional[Place]:
+    """The place a "near X" question refers to, or None if it names no known landmark or address."""
+    gazetteer = get_gazetteer()
+    for match in _NEAR_RE.finditer(question.lower()):
+        phrase = normalize_place_text(match.group(1))
+        found = gazetteer.find_landmark(phrase) or gazetteer.find_address(phrase)
+        if found:
+            return Place(*found, match.start())
+    return None
+
+
+class KDTree:
+    """Static 2-d tree over projected points; k-nearest queries in O(log n) on average."""
+    __slots__ = ("points", "payloads", "_nodes", "_root")
+
+    def __init__(self, items: Iterable[Tuple[Tuple[float, float], Any]]):
+        items = list(items)
+        self.points = [p for p, _ in items]
+        self.payloads = [payload for _, payload in items]
+        # _nodes[i] = (point index, axis, left node, right node); -1 = no child
+        self._nodes: List[Tuple[int, int, int, int]] = []
+        self._root = self._build(list(range(len(items))), 0)
+
+    def _build(self, indices: List[int], depth: int) -> int:
+        if not indices:
+            return -1
+        axis = depth % 2
+        indices.sort(key=lambda i: self.points[i][axis])
+        mid = len(indices) // 2
+        node = len(self._nodes)
+        self._nodes.append(None)
+        left = self._build(indices[:mid], depth + 1)
+        right = self._build(indices[mid + 1:], depth + 1)
+        self._nodes[node] = (indices[mid], axis, left, right)
+        return node
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, point: Tuple[float, float], k: int, max_distance: float = math.inf) -> List[Tuple[float, Any]]:
+        """Up to k (distance, payload) pairs within max_distance, closest first."""
+        heap: List[Tuple[float, int]] = []  # max-heap of (-distance, point index)
+        def bound() -> float:
+            return -heap[0][0] if len(heap) == k else max_distance
+
+        # (node, lower bound on the distance from point to anything in its subtree)
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, min_distance = stack.pop()
+            if node < 0 or min_distance > bound():
+                continue
+            index, axis, left, right = self._nodes[node]
+            px, py = self.points[index]
+            distance = math.hypot(px - point[0], py - point[1])
+            if distance <= bound():
+                heapq.heappush(heap, (-distance, index))
+                if len(heap) > k:
+                    heapq.heappop(heap)
+            delta = point[axis] - self.points[index][axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+            # Far side goes on the stack first so the near side is searched (and tightens the bound) first
+            stack.append((far, abs(delta)))
+            stack.append((near, min_distance))
+        return [(-d, self.payloads[i]) for d, i in sorted(heap, reverse=True)]
+
+
+class SpatialIndex:
+    """One KDTree per data type over geocoded entries; payloads are (file stem, entry position)."""
+
+    def __init__(self, trees: Dict[str, KDTree]):
+        self.trees = trees
+
+    @classmethod
+    def build(cls, all_data, locations) -> "SpatialIndex":
+        """locations mirrors all_data with a list of projected points (or None) per file, aligned with its entries."""
+        trees = {}
+        for file_type, by_stem in all_data.items():
+            items = []
+            for stem, entries in by_stem.items():
+                for position, point in enumerate(locations.get(file_type, {}).get(stem) or ()):
+                    if point is not None:
+                        items.append((point, (stem, position)))
+            trees[file_type] = KDTree(items)
+        return cls(trees)
+
+    def size(self, file_type: str) -> int:
+        tree = self.trees.get(file_type)
+        return len(tree) if tree is not None else 0
+
+    def nearest(self, file_type: str, lat: float, lon: float, k: int, max_km: float = NEARBY_MAX_KM) -> List[Tuple[float, Tuple[str, int]]]:
+        tree = self.trees.get(file_type)
+        if tree is None or not len(tree):
+            return []
+        return tree.nearest(project(lat, lon), k, max_km)
+
+
+def locate_entries(entries: Iterable[Dict]) -> List[Optional[Tuple[float, float]]]:
+    """Projected point per entry (None when its location cannot be geocoded)."""
+    gazetteer = get_gazetteer()
+    points = []
+    for entry in entries:
+        found = gazetteer.geocode(entry.get("location") or "") or gazetteer.geocode(entry.get("name") or "")
+        points.append(project(*found) if found else None)
+    return points
@@ -0,0 +1,221 @@
+"""
+Opening hours as data: free-text `hours` fields parsed into weekly minute intervals.
+
+"Mon-Sat: 11:30am-2am, Sun: 3pm-9pm" becomes a list of [start, end) intervals in minutes
+since Monday 00:00 (a week is 10080 minutes; intervals past midnight carry into the next
+day, and past Sunday into Monday). Seasonal/"varies"/"by appointment" texts parse to None
+(unknown). A per-file HoursIndex turns the intervals into sorted breakpoints with the set
+of open entries between each pair, so "which entries are open at minute m" is a bisect.
+"""
+import os
+import re
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+WEEK_MINUTES = 7 * 24 * 60
+# Opening hours in the data are Kingston local time.
+LOCAL_TIMEZONE = os.getenv("LOCAL_TIMEZONE", "America/Toronto")
+# "Open late tonight" means open at this hour (or now, if it is already later).
+LATE_NIGHT_HOUR = 22
+
+_DAYS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+_DAY = r"(?:mon(?:day)?|tue(?:s|sday)?|wed(?:nesday)?|thu(?:rs|rsday)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?)\b\.?"
+_DAY_SPEC_RE = re.compile(rf"\b(?:(?P<first>{_DAY})(?:\s*-\s*(?P<last>{_DAY}))?|(?P<word>daily|weekends?|weekdays?))\b\s*:?")
+_TIME = r"(\d{1,2})(?::(\d{2}))?\s*(am|pm)?"
+_RANGE_RE = re.compile(rf"{_TIME}\s*(?:-|to)\s*{_TIME}")
+
+
+def _days(match: re.Match) -> List[int]:
+    word = match.group("word")
+    if word:
+        if word.startswith("daily"):
+            return list(range(7))
+        return [5, 6] if word.startswith("weekend") else [0, 1, 2, 3, 4]
+    first = _DAYS[match.group("first")[:3]]
+    last = _DAYS[match.group("last")[:3]] if match.group("last") else first
+    return [(first + i) % 7 for i in range((last - first) % 7 + 1)]
+
+
+def _minutes(hour: str, minute: Optional[str], meridiem: Optional[str]) -> Optional[int]:
+    h, m = int(hour), int(minute or 0)
+    if h > 24 or m > 59:
+        return None
+    if meridiem == "pm" and h != 12:
+        h += 12
+    elif meridiem == "am" and h == 12:
+        h = 0
+    return h * 60 + m
+
+
+def _time_ranges(text: str) -> List[Tuple[int, int]]:
+    """(start, end) minutes within a day for each "11:30am-2pm" style range; end > start (past midnight = +1440)."""
+    ranges = []
+    for h1, m1, ap1, h2, m2, ap2 in _RANGE_RE.findall(text):
+        if not (ap1 or ap2):
+            continue  # bare numbers ("2-4") are too ambiguous to be hours
+        end = _minutes(h2, m2, ap2 or ap1)
+        start = _minutes(h1, m1, ap1 or ap2)
+        if start is None or end is None:
+            continue
+        if not ap1 and start > end:
+            # "11-2pm": an unmarked start later than the end is in the morning
+            start = _minutes(h1, m1, "am")
+        if end <= start:
+            end += 24 * 60
+        ranges.append((start, end))
+    return ranges
+
+
+def _normalize_intervals(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Wrap into [0, WEEK_MINUTES) and merge overlapping/adjacent intervals."""
+    pieces = []
+    for start, end in intervals:
+        length = min(end - start, WEEK_MINUTES)
+        start %= WEEK_MINUTES
+        end = start + length
+        if end > WEEK_MINUTES:
+            pieces.append((start, WEEK_MINUTES))
+            pieces.append((0, end - WEEK_MINUTES))
+        elif end > start:
+            pieces.append((start, end))
+    merged = []
+    for start, end in sorted(pieces):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def parse_hours(text: Optional[str]) -> Optional[List[Tuple[int, int]]]:
+    """Weekly [start, end) minute intervals for an hours text, or None when no times can be read."""
+    if not text:
+        return None
+    text = text.lower().replace("–", "-").replace("—", "-")
+    # Remarks such as "(Kitchen till 10pm)" or "(Seasonal)" are not opening times
+    text = re.sub(r"\([^)]*\)", " ", text)
+    specs = list(_DAY_SPEC_RE.finditer(text))
+    if not specs:
+        return None
+    # Times before the first day spec apply to a spec with no times of its own ("12pm-10pm daily")
+    leading = _time_ranges(text[:specs[0].start()])
+    intervals = []
+    for i, spec in enumerate(specs):
+        end = specs[i + 1].start() if i + 1 < len(specs) else len(text)
+        ranges = _time_ranges(text[spec.end():end]) or leading
+        for day in _days(spec):
+            intervals.extend((day * 1440 + start, day * 1440 + stop) for start, stop in ranges)
+    return _normalize_intervals(intervals) or None
+
+
+class HoursIndex:
+    """
+    Open entries of one file by minute of the week. breakpoints are the sorted interval
+    boundaries; masks[i] is a bitmask of entry positions open from breakpoints[i] up to the
+    next breakpoint. Entries whose hours cannot be parsed are never open.
+    """
+    __slots__ = ("intervals", "breakpoints", "masks", "known")
+
+    def __init__(self, entries: Iterable[Dict]):
+        self.intervals: List[Optional[List[Tuple[int, int]]]] = [parse_hours(entry.get("hours")) for entry in entries]
+        self.known = sum(1 << i for i, parsed in enumerate(self.intervals) if parsed)
+        changes: Dict[int, List[Tuple[int, int]]] = {}
+        for position, parsed in enumerate(self.intervals):
+            for start, end in parsed or ():
+                changes.setdefault(start, []).append((position, 1))
+                changes.setdefault(end, []).append((position, -1))
+        self.breakpoints = [0]
+        self.masks = [0]
+        mask = 0
+        for minute in sorted(changes):
+            for position, delta in changes[minute]:
+                mask = mask | (1 << position) if delta > 0 else mask & ~(1 << position)
+            if minute == self.breakpoints[-1]:
+                self.masks[-1] = mask
+            else:
+                self.breakpoints.append(minute)
+                self.masks.append(mask)
+
+    def extended(self, *entries: Dict) -> "HoursIndex":
+        """
+        A new index with entries appended at the next positions (this one is left unchanged):
+        each new entry's bit is set between its own boundaries, splitting at most two ranges
+        per interval, instead of rebuilding the masks from every entry's intervals.
+        """
+        grown = HoursIndex(())
+        grown.intervals = list(self.intervals)
+        grown.breakpoints, grown.masks, grown.known = list(self.breakpoints), list(self.masks), self.known
+        for entry in entries:
+            parsed = parse_hours(entry.get("hours"))
+            bit = 1 << len(grown.intervals)
+            grown.intervals.append(parsed)
+            if not parsed:
+                continue
+            grown.known |= bit
+            for start, end in parsed:
+                first, last = grown._split(start), grown._split(end)
+                for i in range(first, last):
+                    grown.masks[i] |= bit
+        return grown
+
+    def _split(self, minute: int) -> int:
+        """Index of the breakpoint at minute, adding one (with the mask in force there) if there is none."""
+        i = bisect_right(self.breakpoints, minute) - 1
+        if self.breakpoints[i] == minute:
+            return i
+        self.breakpoints.insert(i + 1, minute)
+        self.masks.insert(i + 1, self.masks[i])
+        return i + 1
+
+    def open_at(self, minute_of_week: int) -> int:
+        """Bitmask of the positions open at the given minute of the week (0 = Monday 00:00)."""
+        return self.masks[bisect_right(self.breakpoints, minute_of_week % WEEK_MINUTES) - 1]
+
+
+def local_now() -> datetime:
+    if ZoneInfo is not None:
+        try:
+            return datetime.now(ZoneInfo(LOCAL_TIMEZONE))
+        except Exception:  # no tz database on this machine
+            pass
+    return datetime.now()
+
+
+def minute_of_week(moment: datetime) -> int:
+    return moment.weekday() * 1440 + moment.hour * 60 + moment.minute
+
+
+_OPEN_NOW_PHRASES = ["open now", "open right now", "currently open", "still open", "open at the moment", "ouvert maintenant", "ouverts maintenant", "ouvert en ce moment"]
+_OPEN_LATE_PHRASES = ["open late", "late tonight", "late night", "late-night", "open tonight", "ouvert tard", "ouverts tard", "ouvert ce soir"]
+
+
+def requested_opening_time(question: str, now: Optional[datetime] = None) -> Optional[Tuple[int, datetime]]:
+    """
+    (minute of week, local time) an "open now" / "open late tonight" question asks about, or None.
+    "Late tonight" is LATE_NIGHT_HOUR today, or now if that has passed.
+    """
+    question_lower = question.lower()
+    now = now or local_now()
+    if any(phrase in question_lower for phrase in _OPEN_LATE_PHRASES):
+        late = now.replace(hour=LATE_NIGHT_HOUR, minute=0, second=0, microsecond=0)
+        moment = max(now, late) if now.hour >= 6 else now  # after midnight, "late" is already now
+        return minute_of_week(moment), moment
+    if any(phrase in question_lower for phrase in _OPEN_NOW_PHRASES):
+        return minute_of_week(now), now
+    return None
+
+
+def positions(mask: int) -> List[int]:
+    """Set bit positions of a mask, ascending."""
+    result = []
+    while mask:
+        low = mask & -mask
+        result.append(low.bit_length() - 1)
+        mask ^= low
+    return result
@@ -0,0 +1,118 @@
+"""
+HTTP validators, cache headers and compression for cacheable JSON payloads.
+
+A payload is identified by an ETag derived from the data version (plus any query
+parameters that shape it), sent weak since it covers every encoding of the payload. Conditional requests are answered with 304 before the payload
+is built, and encoded/compressed bodies are kept per (ETag, encoding) in the tiered cache
+(cache.py: memory, disk, optional Redis) so repeat requests - in any worker, and after a
+restart - skip both JSON encoding and compression.
+"""
+import gzip
+import hashlib
+from typing import Any, Callable, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from cache import get_cache
+from json_codec import dumps
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Browsers revalidate after a minute; shared caches (Vercel CDN) keep it for five and may
+# serve a stale copy for a day while they revalidate in the background.
+DISCOVERY_CACHE_CONTROL = "public, max-age=60, s-maxage=300, stale-while-revalidate=86400"
+# Bodies smaller than this are sent uncompressed.
+COMPRESS_MIN_BYTES = 1024
+# An ETag pins the payload, so an encoded body stays valid; the TTL only bounds cache growth.
+BODY_CACHE_TTL = 24 * 3600
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag from the given parts (data version, category, query params...)."""
+    raw = "\x1f".join(str(p) for p in parts)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag, as required for GET/HEAD."""
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick "br" (when brotli is installed) or "gzip" from an Accept-Encoding header, honouring q=0."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def _cached_body(etag: str, encoding: Optional[str], build_payload: Callable[[], Any]) -> tuple:
+    """Return (body, encoding_used) for the payload identified by etag."""
+    cache = get_cache()
+    key = (etag, encoding)
+    cached = cache.get_bytes("http-body", key)
+    if cached is not None:
+        used, _, body = cached.partition(b"\n")
+        return body, used.decode() or None
+    raw = dumps(build_payload())
+    if encoding is None or len(raw) < COMPRESS_MIN_BYTES:
+        result = (raw, None)
+    else:
+        result = (_compress(raw, encoding), encoding)
+    cache.set_bytes("http-body", key, (result[1] or "").encode() + b"\n" + result[0], BODY_CACHE_TTL)
+    return result
+
+
+def cached_json_response(
+    request: Request,
+    etag: str,
+    build_payload: Callable[[], Any],
+    cache_control: str = DISCOVERY_CACHE_CONTROL,
+) -> Response:
+    """
+    JSON response for a payload that is fully determined by `etag`.
+    build_payload() is only called when neither the client nor the body cache has it.
+    The ETag goes out weak: the identity, gzip and br bodies are different bytes of the same payload.
+    """
+    weak_etag = etag if etag.startswith("W/") else "W/" + etag
+    headers = {"ETag": weak_etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    body, used = _cached_body(etag, encoding, build_payload)
+    if used:
+        headers["Content-Encoding"] = used
+    return Response(content=body, media_type="application/json", headers=headers)
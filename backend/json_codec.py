@@ -0,0 +1,44 @@
+"""
+JSON encoding for API responses and the JSON stores (database.txt, applications.txt).
+
+Uses orjson when it is installed and falls back to the stdlib json module otherwise;
+both produce compact UTF-8 output. Payloads passed here must already be plain
+dicts/lists/strings/numbers - that is what lets callers skip FastAPI's jsonable_encoder.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson  # optional: pip install orjson
+except ImportError:
+    orjson = None
+
+# Opt-in: make ORJSONResponse the default response class of the app (needs orjson).
+USE_ORJSON_RESPONSES = os.getenv("ORJSON_RESPONSES", "").lower() in ("1", "true", "yes") and orjson is not None
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def read_json_file(path: Path) -> Any:
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def raw_json_response(payload: Any, status_code: int = 200, headers: dict | None = None) -> Response:
+    """Response for plain-JSON payloads that bypasses FastAPI's jsonable_encoder round trip."""
+    return Response(content=dumps(payload), status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,317 @@
+"""
+Journaled JSON stores: database.txt (users) and applications.txt (applications).
+
+Each store file holds {"<collection>": [record, ...], "version": n, "versions": [n, ...]}. A JsonStore keeps the authoritative
+copy in memory and changes it only through transactions:
+
+    with USERS.transaction() as tx:
+        i, user = tx.find(lambda u: u.get("email") == email)
+        tx.update(i, status="approved", is_verified=True)
+
+A transaction makes its changes on its own copy of the record list and appends them to
+<file>.journal as one line per change - "append record at i" or "set these fields of record
+i" - so a write costs the size of the change, not of the file. Only once the lines are
+written is the copy published as the store's list. A published list is never changed
+(catching up on other workers' changes publishes a new one too), so a reader can iterate
+what records() returned without a lock and never sees uncommitted or rolled-back changes.
+Journal writes are made durable by one shared fsync: transactions that finish while
+another's fsync is running are covered by the next one (group commit).
+
+Every committed transaction takes the next value of the store's change counter (`version`)
+and stamps it on its journal lines and, in a list kept beside the records ("versions" in the
+file), on the records it touched; records changed after a version a client has seen are
+those with a higher one. The records themselves carry no bookkeeping fields, so they can be
+returned to clients as they are.
+
+Compaction rewrites the file from memory (temp file, fsync, rename), then renames an empty
+journal over the old one, once the journal passes STORE_COMPACT_BYTES or has been growing for
+STORE_COMPACT_SECONDS, and at shutdown. Replay skips journal lines whose version the file
+already includes, so a crash between the two renames is harmless; a torn last line (crash
+mid-append) is discarded.
+
+Worker processes share the files: writers serialize on an flock of <file>.lock and each
+store catches up on the other workers' journal lines (or their compaction) before a
+transaction and, by a stat check, before a read. A reader keeps its journal offset together
+with the journal's inode, so a journal replaced under it is read from the start, never from
+an offset into different contents.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from json_codec import dumps, loads, read_json_file
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process per store, the thread lock is enough
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# Compact once the journal is this large...
+STORE_COMPACT_BYTES = int(os.getenv("STORE_COMPACT_BYTES", str(256 * 1024)))
+# ...or has had changes this long
+STORE_COMPACT_SECONDS = float(os.getenv("STORE_COMPACT_SECONDS", "300"))
+# Set STORE_FSYNC=0 to skip fsync (tests, throwaway environments)
+STORE_FSYNC = os.getenv("STORE_FSYNC", "1").lower() not in ("0", "false", "no")
+
+
+def _unstamped(record: Dict) -> Dict:
+    """A record or field set without the "version" field earlier releases stored in the records."""
+    return {k: v for k, v in record.items() if k != "version"} if "version" in record else record
+
+
+def _fsync_dir(path: Path) -> None:
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Transaction:
+    """Changes to one store, made on a copy of its records that is published only if the block completes."""
+
+    def __init__(self, store: "JsonStore"):
+        self.store = store
+        self.records = list(store._records)
+        self.versions = list(store._versions)
+        self.version = store.version + 1
+        self.ops: List[Dict] = []
+
+    def find(self, predicate: Callable[[Dict], bool]) -> Tuple[Optional[int], Optional[Dict]]:
+        for i, record in enumerate(self.records):
+            if predicate(record):
+                return i, record
+        return None, None
+
+    def append(self, record: Dict) -> int:
+        i = len(self.records)
+        record = dict(record)
+        self.records.append(record)
+        self.versions.append(self.version)
+        self.ops.append({"op": "append", "i": i, "v": self.version, "record": record})
+        return i
+
+    def update(self, i: int, **fields) -> Dict:
+        old = self.records[i]
+        self.records[i] = {**old, **fields}
+        self.versions[i] = self.version
+        self.ops.append({"op": "set", "i": i, "v": self.version, "fields": fields})
+        return self.records[i]
+
+
+class JsonStore:
+    def __init__(self, path: Path, collection: str):
+        self.path = Path(path)
+        self.collection = collection
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self._records: List[Dict] = []
+        # Version of the transaction that last changed each record
+        self._versions: List[int] = []
+        self.version = 0
+        # Version of the file as loaded; journal lines up to it are already in the records
+        self._file_version = 0
+        self._loaded = False
+        self._snapshot_id = None
+        # The journal file (inode) _journal_offset is a position in
+        self._journal_ino: Optional[int] = None
+        self._journal_offset = 0
+        self._journal_since: Optional[float] = None
+        self._lock = threading.RLock()
+        # Group commit: journal bytes written so far, and how many of them are fsynced
+        self._written = 0
+        self._durable = 0
+        self._sync_lock = threading.Lock()
+        self.stats = {"transactions": 0, "journal_writes": 0, "fsyncs": 0, "compactions": 0}
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _stat_id(self, path: Path):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _reload(self) -> None:
+        self._snapshot_id = self._stat_id(self.path)
+        data = read_json_file(self.path) if self._snapshot_id is not None else {}
+        records = data.get(self.collection, [])
+        versions = data.get("versions")
+        if not isinstance(versions, list) or len(versions) != len(records):
+            versions = [record.get("version", 0) for record in records]
+        self._records = [_unstamped(record) for record in records]
+        self._versions = list(versions)
+        self.version = self._file_version = data.get("version", 0)
+        self._journal_ino = None
+        self._journal_offset = 0
+        self._journal_since = None
+        self._loaded = True
+
+    def _catch_up(self, repair: bool = False) -> None:
+        """Pick up changes other processes made: a compaction (new file and journal) or journal lines past our offset."""
+        if not self._loaded or self._stat_id(self.path) != self._snapshot_id:
+            self._reload()
+        try:
+            f = open(self.journal_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self._journal_ino:
+                # A new journal: a compaction renamed its file into place first, so look for that
+                if self._stat_id(self.path) != self._snapshot_id:
+                    self._reload()
+                self._journal_ino = st.st_ino
+                self._journal_offset = 0
+            if st.st_size <= self._journal_offset:
+                return
+            f.seek(self._journal_offset)
+            tail = f.read(st.st_size - self._journal_offset)
+        complete, _, torn = tail.rpartition(b"\n")
+        ops = [loads(line) for line in complete.split(b"\n") if line.strip()] if complete else []
+        if ops:
+            records, versions = list(self._records), list(self._versions)
+            for op in ops:
+                self._replay(records, versions, op)
+            self._records, self._versions = records, versions
+        self._journal_offset += len(complete) + (1 if complete else 0)
+        self._journal_since = self._journal_since or time.time()
+        if torn and repair:
+            # A writer died mid-append; drop the partial line before appending after it
+            log.warning("discarding torn journal line", extra={"store": self.path.name, "bytes": len(torn)})
+            os.truncate(self.journal_path, self._journal_offset)
+
+    def _replay(self, records: List[Dict], versions: List[int], op: Dict) -> None:
+        v = op.get("v")
+        if v is not None and v <= self._file_version:
+            # Left over from before the compaction that wrote the file
+            return
+        i = op["i"]
+        self.version = max(self.version, v or 0)
+        if op["op"] == "append":
+            if i == len(records):
+                records.append(_unstamped(op["record"]))
+                versions.append(v or 0)
+        elif op["op"] == "set" and i < len(records):
+            records[i] = {**records[i], **_unstamped(op["fields"])}
+            versions[i] = v or 0
+
+    def records(self) -> List[Dict]:
+        """Current committed records, a list no transaction changes; treat it as read-only."""
+        with self._lock:
+            self._catch_up()
+            return self._records
+
+    def view(self) -> Tuple[int, List[Dict], List[int]]:
+        """
+        (version, records, versions): every change up to that version is in the records (later
+        ones may be too), and versions[i] is the version that last changed records[i].
+        """
+        with self._lock:
+            self._catch_up()
+            return self.version, self._records, self._versions
+
+    def find(self, predicate: Callable[[Dict], bool]) -> Tuple[Optional[int], Optional[Dict]]:
+        for i, record in enumerate(self.records()):
+            if predicate(record):
+                return i, record
+        return None, None
+
+    def document(self) -> Dict:
+        """The store as its file shape, {collection: records}."""
+        return {self.collection: self.records()}
+
+    @contextmanager
+    def transaction(self) -> Iterator[Transaction]:
+        """Serialized read-modify-write; the changes are journaled, and durable, when the block exits."""
+        with self._lock:
+            with self._file_lock():
+                self._catch_up(repair=True)
+                tx = Transaction(self)
+                # If the block raises, its copy is dropped and nothing was journaled
+                yield tx
+                if not tx.ops:
+                    return
+                data = b"".join(dumps(op) + b"\n" for op in tx.ops)
+                with open(self.journal_path, "ab") as f:
+                    f.write(data)
+                    ino = os.fstat(f.fileno()).st_ino
+                if ino != self._journal_ino:
+                    # The first write created the journal
+                    self._journal_ino, self._journal_offset = ino, 0
+                self._records, self._versions = tx.records, tx.versions
+                self._journal_offset += len(data)
+                self._journal_since = self._journal_since or time.time()
+                self._written += len(data)
+                written = self._written
+                self.version = tx.version
+                self.stats["transactions"] += 1
+                self.stats["journal_writes"] += 1
+        self._sync(written)
+        if self._journal_offset >= STORE_COMPACT_BYTES or time.time() - (self._journal_since or time.time()) >= STORE_COMPACT_SECONDS:
+            self.compact()
+
+    def _sync(self, written: int) -> None:
+        """Make the journal durable up to `written` bytes, sharing one fsync with concurrent writers."""
+        if not STORE_FSYNC:
+            return
+        with self._sync_lock:
+            if self._durable >= written:
+                return
+            target = self._written
+            with open(self.journal_path, "ab") as f:
+                os.fsync(f.fileno())
+            self._durable = max(self._durable, target)
+            self.stats["fsyncs"] += 1
+
+    def compact(self) -> bool:
+        """Rewrite the file from memory and start an empty journal. Returns False if there was nothing to fold in."""
+        with self._lock:
+            with self._file_lock():
+                self._catch_up(repair=True)
+                if self._journal_offset == 0:
+                    return False
+                tmp_path = self.path.with_name(self.path.name + ".tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(dumps({self.collection: self._records, "version": self.version, "versions": self._versions}))
+                    f.flush()
+                    if STORE_FSYNC:
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                if STORE_FSYNC:
+                    _fsync_dir(self.path.parent)
+                # Every journaled change is in the file now. A new (renamed) journal rather than a
+                # truncated one, so readers holding an offset into the old one notice the change
+                journal_tmp = self.journal_path.with_name(self.journal_path.name + ".tmp")
+                with open(journal_tmp, "wb"):
+                    pass
+                os.replace(journal_tmp, self.journal_path)
+                if STORE_FSYNC:
+                    _fsync_dir(self.path.parent)
+                self._snapshot_id = self._stat_id(self.path)
+                self._file_version = self.version
+                self._journal_ino = self.journal_path.stat().st_ino
+                self._journal_offset = 0
+                self._journal_since = None
+                self.stats["compactions"] += 1
+        log.info("store compacted", extra={"store": self.path.name, "records": len(self._records)})
+        return True
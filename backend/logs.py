@@ -0,0 +1,201 @@
+"""
+Logging setup: leveled, structured records written off the request thread.
+
+Modules log through the standard library (`log = logging.getLogger(__name__)`) with a fixed
+message and the variable parts as fields:
+
+    log.info("chat answered", extra={"stage": "chat", "retrieval_ms": 3.1, "entries": 12})
+
+setup_logging(), called once by each entry point (the API app, the CLIs), sends every record
+through a bounded queue to a listener thread that formats and writes it, so a request thread
+never blocks on stdout. Records come out as one JSON object per line (LOG_FORMAT=json, the
+default: ts, level, logger, msg, trace_id, the fields, exc) or as plain text for local
+development (LOG_FORMAT=text). A full queue drops records instead of waiting.
+
+Repetitive low-level lines are sampled: per logger and message, at most LOG_SAMPLE_BURST
+records at or below LOG_SAMPLE_MAX_LEVEL (default DEBUG) are written per
+LOG_SAMPLE_WINDOW_SECONDS; the next one written carries the number suppressed meanwhile.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from tracing import current_trace_id
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Set LOG_ASYNC=0 to write records on the calling thread (e.g. when debugging a crash)
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1").lower() not in ("0", "false", "no")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_MAX_LEVEL = logging.getLevelName(os.getenv("LOG_SAMPLE_MAX_LEVEL", "DEBUG").upper())
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "5"))
+LOG_SAMPLE_WINDOW_SECONDS = float(os.getenv("LOG_SAMPLE_WINDOW_SECONDS", "10"))
+# Libraries that log a line per HTTP call; the upstream call has its own record and span
+QUIET_LOGGERS = ("httpx", "httpcore")
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "trace_id", "suppressed"}
+
+
+def record_fields(record: logging.LogRecord) -> Dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS and not key.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            payload["trace_id"] = trace_id
+        payload.update(record_fields(record))
+        if getattr(record, "suppressed", 0):
+            payload["suppressed"] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = record_fields(record)
+        if getattr(record, "suppressed", 0):
+            fields["suppressed"] = record.suppressed
+        if fields:
+            first, newline, rest = line.partition("\n")
+            line = first + " " + " ".join(f"{key}={value}" for key, value in fields.items()) + newline + rest
+        return line
+
+
+class SampleFilter(logging.Filter):
+    """Let through at most LOG_SAMPLE_BURST records per (logger, message) and window, at or below the sampled level."""
+
+    def __init__(self, burst: int = LOG_SAMPLE_BURST, window: float = LOG_SAMPLE_WINDOW_SECONDS, max_level: int = LOG_SAMPLE_MAX_LEVEL):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.max_level = max_level
+        # (logger, message template) -> [window start, written in window, suppressed since last written]
+        self._seen: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._seen.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state is not None else 0
+                self._seen[key] = state = [now, 0, suppressed]
+            if state[1] >= self.burst:
+                state[2] += 1
+                return False
+            state[1] += 1
+            if state[2]:
+                record.suppressed, state[2] = state[2], 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks: a full queue drops the record. The message, traceback
+    text and trace id are resolved here, on the logging thread, since the listener thread
+    cannot see the request's context or safely format its arguments later.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if not hasattr(record, "trace_id"):
+            record.trace_id = current_trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _TraceIdFilter(logging.Filter):
+    """Synchronous mode: attach the trace id on the calling thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "trace_id"):
+            record.trace_id = current_trace_id()
+        return True
+
+
+_handler: Optional[logging.Handler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Route the root logger through the queue (or straight to stdout with LOG_ASYNC=0). Idempotent."""
+    global _handler, _listener
+    with _setup_lock:
+        if _handler is not None:
+            return
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+        if LOG_ASYNC:
+            _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+            _listener = logging.handlers.QueueListener(_handler.queue, output)
+            _listener.start()
+            atexit.register(shutdown_logging)
+        else:
+            _handler = output
+            _handler.addFilter(_TraceIdFilter())
+        _handler.addFilter(SampleFilter())
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(level)
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def shutdown_logging() -> None:
+    """Write out what is queued and stop the listener thread; later records are written synchronously."""
+    global _handler, _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+        if listener is None:
+            return
+        listener.stop()
+        output = listener.handlers[0]
+        output.addFilter(_TraceIdFilter())
+        output.addFilter(SampleFilter())
+        root = logging.getLogger()
+        root.removeHandler(_handler)
+        root.addHandler(output)
+        _handler = output
@@ -0,0 +1,318 @@
+"""
+Memory accounting: what the dataset, its indexes and the caches cost a worker.
+
+report() sizes the live structures of this process:
+    process   - current and peak RSS
+    dataset   - per data file, the deep size of its parsed entries and of each index built
+                over them (search texts, prompt fragments, locations, hours, facets), plus the
+                spatial index and, with SHARED_DATASET_PATH, the mapped image (shared pages,
+                counted once per machine rather than per worker)
+    caches    - the tiered cache (entries, bytes, hit ratios per namespace and tier) and the
+                in-process ones (gazetteer, upload index, kept profiles)
+Deep sizes follow references (gc.get_referents) and count each object once per structure;
+objects two structures share (the entry dicts the search texts were built from, interned
+strings) are counted in both.
+
+Allocation sites come from tracemalloc, which must be tracing before the allocations it is
+to see: set MEMORY_TRACE_FRAMES to start it with the app, or start it from the admin API.
+take_snapshot() keeps a labelled snapshot; top_allocations() and compare_snapshots() report
+the largest sites and the growth between two points in time.
+
+    python memory.py report [--json]     load the dataset and print the report
+    python memory.py trace [--limit N]   allocation sites of loading the dataset
+"""
+import gc
+import os
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from types import BuiltinFunctionType, CodeType, FrameType, FunctionType, MethodType, ModuleType
+from typing import Dict, List, Optional, Set
+
+import dataset
+from dataset import DATA_TYPES, DERIVED_MAPS
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+# Start tracemalloc with this many frames per allocation when the app starts; 0 = off
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "0"))
+# tracemalloc snapshots kept for comparison (each holds every live trace)
+MEMORY_SNAPSHOTS_KEEP = int(os.getenv("MEMORY_SNAPSHOTS_KEEP", "5"))
+
+# Shared, immortal or code objects a deep size should not walk into
+_NOT_OWNED = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType, CodeType, FrameType)
+# Index sizes reported per file, by snapshot map name
+_INDEX_NAMES = {"indexes": "search", "fragments": "fragments", "locations": "locations", "hours": "hours", "facets": "facets"}
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_STDLIB_DIR = sysconfig.get_paths()["stdlib"]
+
+
+def deep_size(obj, exclude: Optional[Set[int]] = None) -> int:
+    """Bytes of obj and everything reachable from it (each object once; ids in exclude are not entered)."""
+    seen = set(exclude or ())
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _NOT_OWNED):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        stack.extend(gc.get_referents(current))
+    return total
+
+
+def process_memory() -> Dict:
+    result = {}
+    try:
+        with open("/proc/self/statm") as f:
+            result["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    result["gc_objects"] = len(gc.get_objects())
+    return result
+
+
+def dataset_report(snapshot: Optional[dataset.DatasetSnapshot] = None) -> Dict:
+    """Per data file: entry count, entries bytes and bytes of each index; totals; the shared image."""
+    snapshot = snapshot or dataset.get_dataset()
+    image = None
+    files: List[Dict] = []
+    totals = {"entries_bytes": 0, **{name: 0 for name in _INDEX_NAMES.values()}}
+    for file_type in DATA_TYPES:
+        for stem, entries in snapshot.all_data[file_type].items():
+            image = image or getattr(entries, "image", None)
+            # The mapped image is reported once below, not inside every file that views it
+            exclude = {id(image)} if image is not None else None
+            row = {"type": file_type, "file": stem, "entries": len(entries), "entries_bytes": deep_size(entries, exclude)}
+            for map_name in DERIVED_MAPS:
+                structure = getattr(snapshot, map_name)[file_type].get(stem)
+                row[_INDEX_NAMES[map_name]] = deep_size(structure, exclude) if structure is not None else 0
+            for key in totals:
+                totals[key] += row[key]
+            row["total_bytes"] = sum(row[key] for key in totals)
+            files.append(row)
+    files.sort(key=lambda row: row["total_bytes"], reverse=True)
+    totals["spatial"] = deep_size(snapshot.spatial)
+    report = {
+        "version": snapshot.version,
+        "files": files,
+        "totals": totals,
+        "total_bytes": sum(totals.values()),
+    }
+    if image is not None:
+        report["shared_image"] = {
+            "path": str(image.path),
+            "mapped_bytes": len(image._mmap),
+            "header_bytes": deep_size(image, {id(image._mmap)}),
+        }
+    return report
+
+
+def cache_report() -> Dict:
+    """The tiered cache's usage and the sizes of the in-process caches."""
+    from cache import get_cache
+    from geo import get_gazetteer
+    import profiler
+    import upload_store
+
+    report = {"tiered": get_cache().usage()}
+    # Only size the gazetteer if something already loaded it
+    gazetteer_loaded = get_gazetteer.cache_info().currsize > 0
+    report["gazetteer"] = {"loaded": gazetteer_loaded, "bytes": deep_size(get_gazetteer()) if gazetteer_loaded else 0}
+    index = upload_store._index_cache["index"]
+    report["upload_index"] = {"entries": len(index), "bytes": deep_size(index)}
+    with profiler._profiles_lock:
+        kept = list(profiler._profiles.values())
+    report["profiles"] = {"entries": len(kept), "bytes": deep_size(kept)}
+    sampler = profiler.continuous_sampler()
+    if sampler is not None:
+        report["continuous_profile"] = {"stacks": len(sampler.stacks), "bytes": deep_size(sampler.stacks)}
+    return report
+
+
+def report() -> Dict:
+    started = time.perf_counter()
+    result = {
+        "process": process_memory(),
+        "dataset": dataset_report(),
+        "caches": cache_report(),
+        "tracing": tracing_status(),
+    }
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+# tracemalloc snapshots by id, oldest first
+_snapshots: "OrderedDict[str, Dict]" = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+def start_tracing(frames: int = 1) -> None:
+    """Start tracing allocations (a restart with a different depth drops the existing traces)."""
+    if tracemalloc.is_tracing():
+        if tracemalloc.get_traceback_limit() == frames:
+            return
+        tracemalloc.stop()
+    tracemalloc.start(frames)
+
+
+def stop_tracing() -> None:
+    """Stop tracing; kept snapshots stay readable."""
+    tracemalloc.stop()
+
+
+def tracing_status() -> Dict:
+    status = {"tracing": tracemalloc.is_tracing()}
+    if status["tracing"]:
+        current, peak = tracemalloc.get_traced_memory()
+        status.update({
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        })
+    with _snapshots_lock:
+        status["snapshots"] = [{"id": snapshot_id, "label": item["label"], "taken_at": item["taken_at"]} for snapshot_id, item in _snapshots.items()]
+    return status
+
+
+def _take() -> tracemalloc.Snapshot:
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not tracing; start it first")
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ])
+
+
+def take_snapshot(label: str = "") -> str:
+    """Keep a snapshot of the live traced allocations; returns its id."""
+    snapshot = _take()
+    snapshot_id = uuid.uuid4().hex[:12]
+    with _snapshots_lock:
+        _snapshots[snapshot_id] = {"label": label, "taken_at": time.time(), "snapshot": snapshot}
+        while len(_snapshots) > MEMORY_SNAPSHOTS_KEEP:
+            _snapshots.popitem(last=False)
+    return snapshot_id
+
+
+def get_snapshot(snapshot_id: str) -> Optional[tracemalloc.Snapshot]:
+    with _snapshots_lock:
+        item = _snapshots.get(snapshot_id)
+    return item["snapshot"] if item is not None else None
+
+
+def _where(traceback: tracemalloc.Traceback) -> List[str]:
+    lines = []
+    for frame in traceback:
+        filename = frame.filename
+        if filename.startswith(_BACKEND_DIR):
+            filename = os.path.relpath(filename, _BACKEND_DIR)
+        elif filename.startswith(_STDLIB_DIR):
+            filename = os.path.relpath(filename, _STDLIB_DIR)
+        elif "site-packages" in filename:
+            filename = filename.split("site-packages" + os.sep, 1)[-1]
+        lines.append(f"{filename}:{frame.lineno}")
+    return lines
+
+
+def top_allocations(snapshot: tracemalloc.Snapshot, limit: int = 25, group_by: str = "lineno") -> Dict:
+    """Largest allocation sites ("lineno", "filename" or "traceback") of a snapshot."""
+    stats = snapshot.statistics(group_by)
+    return {
+        "traced_bytes": sum(stat.size for stat in stats),
+        "sites": [{"where": _where(stat.traceback), "bytes": stat.size, "blocks": stat.count} for stat in stats[:limit]],
+    }
+
+
+def compare_snapshots(old: tracemalloc.Snapshot, new: tracemalloc.Snapshot, limit: int = 25, group_by: str = "lineno") -> Dict:
+    """Sites whose live allocations changed most from old to new, largest growth first."""
+    stats = new.compare_to(old, group_by)
+    return {
+        "growth_bytes": sum(stat.size_diff for stat in stats),
+        "sites": [
+            {"where": _where(stat.traceback), "bytes": stat.size, "bytes_diff": stat.size_diff, "blocks": stat.count, "blocks_diff": stat.count_diff}
+            for stat in stats[:limit]
+        ],
+    }
+
+
+def current_snapshot() -> tracemalloc.Snapshot:
+    """An unkept snapshot of now, to compare a kept one against."""
+    return _take()
+
+
+def _format_bytes(n: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GiB"
+
+
+def print_report(result: Dict) -> None:
+    process = result["process"]
+    print(f"RSS {_format_bytes(process.get('rss_bytes', 0))}, peak {_format_bytes(process.get('peak_rss_bytes', 0))}")
+    data = result["dataset"]
+    print(f"\nDataset {data['version']}: {_format_bytes(data['total_bytes'])}")
+    columns = ["entries_bytes", *_INDEX_NAMES.values()]
+    print(f"{'file':<36}{'entries':>8}" + "".join(f"{name.replace('_bytes', ''):>12}" for name in columns))
+    for row in data["files"]:
+        print(f"{row['type'] + '/' + row['file']:<36}{row['entries']:>8}" + "".join(f"{_format_bytes(row[name]):>12}" for name in columns))
+    print(f"{'total':<44}" + "".join(f"{_format_bytes(data['totals'][name]):>12}" for name in columns))
+    print(f"spatial index {_format_bytes(data['totals']['spatial'])}")
+    if "shared_image" in data:
+        image = data["shared_image"]
+        print(f"shared image {image['path']}: {_format_bytes(image['mapped_bytes'])} mapped")
+    caches = result["caches"]
+    tiered = caches["tiered"]
+    print(f"\nTiered cache: hit ratio {tiered['hit_ratio']} ({tiered['hits']} hits, {tiered['misses']} misses)")
+    for name, tier in tiered["tiers"].items():
+        print(f"  {name}: " + ", ".join(f"{key} {value}" for key, value in tier.items()))
+    for name in ("gazetteer", "upload_index", "profiles"):
+        print(f"{name}: {_format_bytes(caches[name]['bytes'])}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Memory accounting for the dataset, its indexes and the caches.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report_parser = commands.add_parser("report", help="load the dataset and print what each structure costs")
+    report_parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    trace_parser = commands.add_parser("trace", help="top allocation sites of loading the dataset and gazetteer")
+    trace_parser.add_argument("--limit", type=int, default=25)
+    trace_parser.add_argument("--group-by", default="lineno", choices=["lineno", "filename", "traceback"])
+    args = parser.parse_args()
+
+    if args.command == "trace":
+        start_tracing(25 if args.group_by == "traceback" else 1)
+        before = current_snapshot()
+        dataset.get_dataset()
+        from geo import get_gazetteer
+        get_gazetteer()
+        diff = compare_snapshots(before, current_snapshot(), args.limit, args.group_by)
+        print(f"Loading allocated {_format_bytes(diff['growth_bytes'])} (live)")
+        for site in diff["sites"]:
+            print(f"{_format_bytes(site['bytes_diff']):>12}  {site['blocks_diff']:>8} blocks  {' <- '.join(site['where'])}")
+    else:
+        dataset.get_dataset()
+        result = report()
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            print_report(result)
@@ -0,0 +1,243 @@
+"""
+Sampling CPU profiler for the API: where a slow request's Python time goes.
+
+A StackSampler thread reads every thread's current stack (sys._current_frames) at a fixed
+interval and counts identical stacks. Threads that are merely waiting (event-loop select,
+idle threadpool workers, lock and queue waits) are skipped, so the counts are time spent
+running or blocked in a call made by the app. Profiles export as collapsed stacks (one
+"frame;frame;frame count" line per stack, for flamegraph.pl / speedscope / inferno) or as
+speedscope JSON.
+
+Two modes:
+    per request  - an admin request with "X-Profile: 1" runs under a sampler; the profile
+                   is kept in memory and its id returned in the X-Profile-Id header
+    continuous   - one low-rate sampler aggregating hot stacks across all traffic
+                   (PROFILE_CONTINUOUS_INTERVAL_MS, or started from the admin API)
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Sampling interval for a profiled request
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+# Continuous sampling interval; 0 = off at startup
+PROFILE_CONTINUOUS_INTERVAL_MS = float(os.getenv("PROFILE_CONTINUOUS_INTERVAL_MS", "0"))
+# Per-request profiles kept for retrieval
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+# Deepest stack recorded (outermost frames are dropped beyond this)
+MAX_STACK_DEPTH = 128
+
+# (module, function) of leaf frames where a thread is waiting rather than working
+_IDLE_LEAVES = {
+    ("selectors", "select"),
+    ("threading", "wait"),
+    ("threading", "_wait_for_tstate_lock"),
+    ("queue", "get"),
+    ("socket", "accept"),
+    ("socketserver", "serve_forever"),
+    ("watchfiles.main", "watch"),
+}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Background thread counting the collapsed stacks of all busy threads."""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = max(interval_ms, 0.1) / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "StackSampler":
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.stopped_at = time.time()
+        return self
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(skip=own)
+
+    def sample(self, skip: Optional[int] = None) -> None:
+        taken = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == skip:
+                continue
+            if (frame.f_globals.get("__name__"), frame.f_code.co_name) in _IDLE_LEAVES:
+                continue
+            labels = []
+            while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            taken.append(";".join(reversed(labels)))
+        with self._lock:
+            self.samples += 1
+            self.stacks.update(taken)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.started_at = time.time()
+
+    def snapshot(self) -> Tuple[Counter, int]:
+        with self._lock:
+            return Counter(self.stacks), self.samples
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format, heaviest stacks first."""
+        stacks, _ = self.snapshot()
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+    def speedscope(self, name: str = "profile") -> Dict:
+        """speedscope "sampled" profile (https://www.speedscope.app/file-format-schema.json), weights in ms."""
+        stacks, _ = self.snapshot()
+        frames, frame_ids, samples, weights = [], {}, [], []
+        for stack, count in stacks.most_common():
+            ids = []
+            for label in stack.split(";"):
+                if label not in frame_ids:
+                    frame_ids[label] = len(frames)
+                    function, _, where = label.rpartition(" (")
+                    file, _, line = where.rstrip(")").rpartition(":")
+                    frames.append({"name": function, "file": file, "line": int(line) if line.isdigit() else None})
+                ids.append(frame_ids[label])
+            samples.append(ids)
+            weights.append(round(count * self.interval * 1000, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": name,
+            "exporter": "anangai-profiler",
+        }
+
+    def summary(self) -> Dict:
+        stacks, samples = self.snapshot()
+        end = self.stopped_at or time.time()
+        return {
+            "samples": samples,
+            "interval_ms": self.interval * 1000,
+            "duration_ms": round((end - (self.started_at or end)) * 1000, 1),
+            "distinct_stacks": len(stacks),
+        }
+
+
+def render(sampler: StackSampler, fmt: str, name: str = "profile") -> Tuple[str, str]:
+    """(body, media type) of a profile in "collapsed" or "speedscope" format."""
+    if fmt == "speedscope":
+        return json.dumps(sampler.speedscope(name)), "application/json"
+    return sampler.collapsed(), "text/plain; charset=utf-8"
+
+
+# Per-request profiles, newest last
+_profiles: "OrderedDict[str, Tuple[str, StackSampler]]" = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+_switch_lock = threading.Lock()
+_switch_users = 0
+_saved_switch_interval = sys.getswitchinterval()
+
+
+def start_request_profile() -> StackSampler:
+    """
+    Start a fine-grained sampler for one request. While any request is profiled the
+    interpreter's GIL switch interval is lowered to the sampling interval; otherwise a busy
+    worker thread would only let the sampler run every 5 ms.
+    """
+    global _switch_users, _saved_switch_interval
+    with _switch_lock:
+        if _switch_users == 0:
+            _saved_switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(_saved_switch_interval, PROFILE_INTERVAL_MS / 1000))
+        _switch_users += 1
+    return StackSampler(PROFILE_INTERVAL_MS).start()
+
+
+def finish_request_profile(sampler: StackSampler) -> None:
+    global _switch_users
+    sampler.stop()
+    with _switch_lock:
+        _switch_users -= 1
+        if _switch_users == 0:
+            sys.setswitchinterval(_saved_switch_interval)
+
+
+def store_request_profile(label: str, sampler: StackSampler) -> str:
+    profile_id = uuid.uuid4().hex[:12]
+    with _profiles_lock:
+        _profiles[profile_id] = (label, sampler)
+        while len(_profiles) > PROFILE_KEEP:
+            _profiles.popitem(last=False)
+    return profile_id
+
+
+def get_request_profile(profile_id: str) -> Optional[Tuple[str, StackSampler]]:
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+def list_request_profiles() -> Dict[str, Dict]:
+    with _profiles_lock:
+        items = list(_profiles.items())
+    return {profile_id: {"request": label, **sampler.summary()} for profile_id, (label, sampler) in reversed(items)}
+
+
+_continuous: Optional[StackSampler] = None
+_continuous_lock = threading.Lock()
+
+
+def start_continuous(interval_ms: float = PROFILE_CONTINUOUS_INTERVAL_MS or 10) -> StackSampler:
+    """Start (or restart at a new rate) the traffic-wide sampler."""
+    global _continuous
+    with _continuous_lock:
+        if _continuous is not None:
+            _continuous.stop()
+        _continuous = StackSampler(interval_ms).start()
+        return _continuous
+
+
+def stop_continuous() -> Optional[StackSampler]:
+    """Stop the traffic-wide sampler; its aggregate stays readable until the next start."""
+    with _continuous_lock:
+        if _continuous is not None and _continuous.running:
+            _continuous.stop()
+        return _continuous
+
+
+def continuous_sampler() -> Optional[StackSampler]:
+    return _continuous
@@ -1,16 +1,37 @@
+import codecs
 import httpx
+import itertools
+import json
+import logging
 import os
 import re
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional
 from datetime import datetime
 
+from cache import get_cache
+from deadline import LLM_MIN_BUDGET_SECONDS, Deadline, RequestCancelled, abort_on_cancel, abort_response_on_cancel
+from facets import intersect_masks, question_facets
+from geo import resolve_place
+from hours import positions, requested_opening_time
+from tracing import annotate, span, traced
+
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 BASE_DIR = Path(__file__).resolve().parent
 # Get API key from environment variable, fallback to hardcoded (for development only)
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY") or "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"
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "openai/gpt-4o-mini")
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+# Keep-alive connections to OpenRouter held by the pooled client
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+# Answers are cached per (language, question) for this long, tagged with the data version and model
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", str(6 * 3600)))
 
 # Define folder paths
 FOOD_DIR = BASE_DIR / "Food"
@@ -132,11 +153,16 @@ def _best_fuzzy_keyword(word: str, candidates: List[str], max_edits: int = 2) ->
     return best
 
 
+# Fuzzy-match vocabularies, built once at import rather than on every question
+_FOOD_MAP_KEYS = list(FOOD_KEYWORD_MAP.keys())
+_SEARCH_CANONICALS = list(set(FOOD_KEYWORD_MAP.keys()) | set(PLACE_KEYWORDS) | set(EVENT_KEYWORDS))
+
+
 def normalize_question_for_keywords(question: str) -> str:
     """Normalize question for keyword lookup: replace known typos so intent is detected correctly."""
     words = question.lower().split()
     normalized = []
-    all_map_keys = list(FOOD_KEYWORD_MAP.keys())
+    all_map_keys = _FOOD_MAP_KEYS
     for w in re.sub(r"[^\w\s]", " ", question.lower()).split():
         if len(w) < 2:
             continue
@@ -152,7 +178,6 @@ def normalize_question_for_keywords(question: str) -> str:
 def expand_keywords_for_search(keywords: List[str]) -> List[str]:
     """Expand keywords with canonical forms so search matches despite typos. Used for entry text matching."""
     expanded = set()
-    all_canonicals = set(FOOD_KEYWORD_MAP.keys()) | set(PLACE_KEYWORDS) | set(EVENT_KEYWORDS)
     for kw in keywords:
         if not kw or len(kw) < 2:
             continue
@@ -161,68 +186,12 @@ def expand_keywords_for_search(keywords: List[str]) -> List[str]:
         canonical = TYPO_TO_CANONICAL.get(k, k)
         expanded.add(canonical)
         if len(k) >= 4:
-            fuzzy = _best_fuzzy_keyword(k, list(all_canonicals), max_edits=2)
+            fuzzy = _best_fuzzy_keyword(k, _SEARCH_CANONICALS, max_edits=2)
             if fuzzy:
                 expanded.add(fuzzy)
     return [x for x in expanded if len(x) > 2]
 
 
-def load_data(file_path: Path) -> str:
-    """Load data from file with multiple encoding attempts"""
-    if not file_path.exists():
-        print(f"⚠️ File '{file_path}' not found, skipping...")
-        return None
-    
-    try:
-        for encoding in ['utf-8', 'utf-8-sig', 'latin-1']:
-            try:
-                with open(file_path, "r", encoding=encoding) as f:
-                    content = f.read()
-                    if content.strip():
-                        return content.strip()
-            except UnicodeDecodeError:
-                continue
-        
-        with open(file_path, "rb") as f:
-            content = f.read()
-            if content:
-                return content.decode('utf-8', errors='ignore').strip()
-        
-        return None
-    except Exception as e:
-        print(f"❌ Error reading '{file_path}': {e}")
-        return None
-
-
-def discover_data_files() -> Dict[str, List[Path]]:
-    """Dynamically discover all data files in Food, Places, and Events folders"""
-    data_files = {
-        "food": [],
-        "places": [],
-        "events": []
-    }
-    
-    # Discover Food files
-    if FOOD_DIR.exists():
-        for file_path in FOOD_DIR.glob("*.txt"):
-            data_files["food"].append(file_path)
-            print(f"✅ Discovered food file: {file_path.name}")
-    
-    # Discover Places files
-    if PLACES_DIR.exists():
-        for file_path in PLACES_DIR.glob("*.txt"):
-            data_files["places"].append(file_path)
-            print(f"✅ Discovered place file: {file_path.name}")
-    
-    # Discover Events files
-    if EVENTS_DIR.exists():
-        for file_path in EVENTS_DIR.glob("*.txt"):
-            data_files["events"].append(file_path)
-            print(f"✅ Discovered event file: {file_path.name}")
-    
-    return data_files
-
-
 def generate_google_maps_url(location: str, name: str = "", city: str = "Kingston, ON") -> str:
     """Generate Google Maps URL from location address"""
     if not location:
@@ -238,32 +207,95 @@ def generate_google_maps_url(location: str, name: str = "", city: str = "Kingsto
     return f"https://www.google.com/maps/search/?api=1&query={encoded_query}"
 
 
-def parse_food_entry(entry_text: str) -> Dict:
-    """Parse a food entry (restaurant, bakery, cafe, pub, etc.)"""
+def _normalize_accessibility(accessibility: str) -> str:
+    """Normalize an Accessibility: value to Full Access / Partial Access / Accessible with Assistance / Limited / "null"."""
+    accessibility_lower = accessibility.lower()
+    # Check for NULL (uppercase) first
+    if accessibility.upper() == "NULL" or accessibility_lower in ["null", "none", ""]:
+        return "null"  # Keep as string for consistency
+    if "full access" in accessibility_lower or accessibility_lower == "yes":
+        return "Full Access"
+    if "partial access" in accessibility_lower or "partial" in accessibility_lower:
+        return "Partial Access"
+    if "accessible with assistance" in accessibility_lower:
+        return "Accessible with Assistance"
+    if "limited" in accessibility_lower:
+        return "Limited"
+    # Try to extract key phrase from longer descriptions
+    if "full" in accessibility_lower and "access" in accessibility_lower:
+        return "Full Access"
+    return "null"  # Default to null if can't determine
+
+
+def _normalize_washrooms(washrooms: str) -> str:
+    """Normalize a Washrooms: value to Available / Partial Available / Not Available / "null"."""
+    washrooms_lower = washrooms.lower()
+    # Check for NULL (uppercase) first
+    if washrooms.upper() == "NULL" or washrooms_lower in ["null", "none", ""]:
+        return "null"
+    if "accessible washrooms available" in washrooms_lower or "washrooms available" in washrooms_lower or washrooms_lower in ["available", "yes"]:
+        return "Available"
+    if "partial" in washrooms_lower or "partially accessible" in washrooms_lower:
+        return "Partial Available"
+    if "not available" in washrooms_lower or "not accessible" in washrooms_lower or washrooms_lower in ["no"]:
+        return "Not Available"
+    # Try to determine availability from description
+    if "available" in washrooms_lower:
+        return "Available"
+    if "not" in washrooms_lower:
+        return "Not Available"
+    return "null"  # Default to null if can't determine
+
+
+# Field label (text before the first ":") -> (entry key, value normalizer or None), per file schema
+FOOD_FIELDS = {
+    "Business Name": ("name", None),
+    "Location": ("location", None),
+    "Location URL": ("url", None),
+    "Hours": ("hours", None),
+    "Local Sourcing": ("local_sourcing", None),
+    "Veg/Vegan Options": ("veg_vegan", None),
+    "Green Plate Certification": ("certification", None),
+    "Notes": ("notes", None),
+}
+PLACE_FIELDS = {
+    "Place Name": ("name", None),
+    "Location": ("location", None),
+    "Location URL": ("url", None),
+    "About": ("about", None),
+    "Hours": ("hours", None),
+    "Fees": ("fees", None),
+    "Accessibility": ("accessibility", _normalize_accessibility),
+    "Washrooms": ("washrooms", _normalize_washrooms),
+}
+SHOP_FIELDS = {
+    "Store Name": ("name", None),
+    "Business Name": ("name", None),
+    "Location": ("location", None),
+    "Location URL": ("url", None),
+    "Hours of Operation": ("hours", None),
+    "Hours": ("hours", None),
+    "Info": ("notes", None),
+    "Notes": ("notes", None),
+    "Local Sourcing": ("local_sourcing", None),
+    "Category": ("category", None),
+}
+
+
+def parse_fields(lines: Iterable[str], fields: Dict[str, Tuple[str, Optional[Callable[[str], str]]]]) -> Dict:
+    """Parse "Label: value" lines in one pass: each line is dispatched on its label with a single dict lookup."""
     entry = {}
-    lines = entry_text.strip().split('\n')
-    
     for line in lines:
         line = line.strip()
         if not line:
             continue
-        
-        if line.startswith("Business Name:"):
-            entry["name"] = line.replace("Business Name:", "").strip()
-        elif line.startswith("Location:"):
-            entry["location"] = line.replace("Location:", "").strip()
-        elif line.startswith("Location URL:"):
-            entry["url"] = line.replace("Location URL:", "").strip()
-        elif line.startswith("Hours:"):
-            entry["hours"] = line.replace("Hours:", "").strip()
-        elif line.startswith("Local Sourcing:"):
-            entry["local_sourcing"] = line.replace("Local Sourcing:", "").strip()
-        elif line.startswith("Veg/Vegan Options:"):
-            entry["veg_vegan"] = line.replace("Veg/Vegan Options:", "").strip()
-        elif line.startswith("Green Plate Certification:"):
-            entry["certification"] = line.replace("Green Plate Certification:", "").strip()
-        elif line.startswith("Notes:"):
-            entry["notes"] = line.replace("Notes:", "").strip()
+        label, sep, value = line.partition(":")
+        spec = fields.get(label) if sep else None
+        if spec is None:
+            continue
+        key, normalize = spec
+        value = value.strip()
+        entry[key] = normalize(value) if normalize is not None else value
     
     # If no URL found but location exists, generate Google Maps URL
     if not entry.get("url") and entry.get("location") and entry.get("name"):
@@ -272,80 +304,19 @@ def parse_food_entry(entry_text: str) -> Dict:
     return entry
 
 
+def parse_food_entry(entry_text: str) -> Dict:
+    """Parse a food entry (restaurant, bakery, cafe, pub, etc.)"""
+    return parse_fields(entry_text.strip().split('\n'), FOOD_FIELDS)
+
+
 def parse_place_entry(entry_text: str) -> Dict:
     """Parse a place entry, including Accessibility and Washrooms."""
-    entry = {}
-    lines = entry_text.strip().split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        if line.startswith("Place Name:"):
-            entry["name"] = line.replace("Place Name:", "").strip()
-        elif line.startswith("Location:"):
-            entry["location"] = line.replace("Location:", "").strip()
-        elif line.startswith("Location URL:"):
-            entry["url"] = line.replace("Location URL:", "").strip()
-        elif line.startswith("About:"):
-            entry["about"] = line.replace("About:", "").strip()
-        elif line.startswith("Hours:"):
-            entry["hours"] = line.replace("Hours:", "").strip()
-        elif line.startswith("Fees:"):
-            entry["fees"] = line.replace("Fees:", "").strip()
-        elif line.startswith("Accessibility:"):
-            accessibility = line.replace("Accessibility:", "").strip()
-            # Normalize accessibility values
-            accessibility_lower = accessibility.lower()
-            # Check for NULL (uppercase) first
-            if accessibility.upper() == "NULL" or accessibility_lower in ["null", "none", ""]:
-                entry["accessibility"] = "null"  # Keep as string for consistency
-            elif "full access" in accessibility_lower or accessibility_lower == "yes":
-                entry["accessibility"] = "Full Access"
-            elif "partial access" in accessibility_lower or "partial" in accessibility_lower:
-                entry["accessibility"] = "Partial Access"
-            elif "accessible with assistance" in accessibility_lower:
-                entry["accessibility"] = "Accessible with Assistance"
-            elif "limited" in accessibility_lower:
-                entry["accessibility"] = "Limited"
-            else:
-                # Try to extract key phrase from longer descriptions
-                if "full" in accessibility_lower and "access" in accessibility_lower:
-                    entry["accessibility"] = "Full Access"
-                elif "partial" in accessibility_lower:
-                    entry["accessibility"] = "Partial Access"
-                elif "limited" in accessibility_lower:
-                    entry["accessibility"] = "Limited"
-                else:
-                    entry["accessibility"] = "null"  # Default to null if can't determine
-        elif line.startswith("Washrooms:"):
-            washrooms = line.replace("Washrooms:", "").strip()
-            # Normalize washroom values
-            washrooms_lower = washrooms.lower()
-            # Check for NULL (uppercase) first
-            if washrooms.upper() == "NULL" or washrooms_lower in ["null", "none", ""]:
-                entry["washrooms"] = "null"
-            elif "accessible washrooms available" in washrooms_lower or "washrooms available" in washrooms_lower or washrooms_lower in ["available", "yes"]:
-                entry["washrooms"] = "Available"
-            elif "partial" in washrooms_lower or "partially accessible" in washrooms_lower:
-                entry["washrooms"] = "Partial Available"
-            elif "not available" in washrooms_lower or "not accessible" in washrooms_lower or washrooms_lower in ["no"]:
-                entry["washrooms"] = "Not Available"
-            else:
-                # Try to determine availability from description
-                if "available" in washrooms_lower:
-                    entry["washrooms"] = "Available"
-                elif "not" in washrooms_lower:
-                    entry["washrooms"] = "Not Available"
-                else:
-                    entry["washrooms"] = "null"  # Default to null if can't determine
-    
-    # If no URL found but location exists, generate Google Maps URL
-    if not entry.get("url") and entry.get("location") and entry.get("name"):
-        entry["url"] = generate_google_maps_url(entry["location"], entry["name"])
-    
-    return entry
+    return parse_fields(entry_text.strip().split('\n'), PLACE_FIELDS)
+
+
+def parse_shop_entry(entry_text: str) -> Dict:
+    """Parse a shop/store entry (Store Name or Business Name, Location, Hours of Operation or Hours, Info or Notes, Category)."""
+    return parse_fields(entry_text.strip().split('\n'), SHOP_FIELDS)
 
 
 def parse_event_entry(line: str) -> Dict:
@@ -379,147 +350,151 @@ def parse_event_entry(line: str) -> Dict:
     return None
 
 
-def split_food_entries(content: str) -> List[str]:
-    """Split food file content into individual entries"""
-    # Entries are separated by double newlines or "Business Name:" markers
-    entries = []
-    current_entry = []
-    lines = content.split('\n')
+def detect_encoding(file_path: Path, chunk_size: int = 64 * 1024) -> str:
+    """"utf-8" if the whole file decodes as UTF-8, else "latin-1" otherwise, checked in fixed-size chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return "latin-1"
+    return "utf-8"
+
+
+def iter_lines(file_path: Path) -> Iterator[str]:
+    """
+    Stream a data file's lines (without newlines) from the file handle.
+    Leading blank lines and the first line's leading whitespace are skipped.
+    """
+    with open(file_path, "r", encoding=detect_encoding(file_path)) as f:
+        started = False
+        for line in f:
+            if line.endswith("\n"):
+                line = line[:-1]
+            if not started:
+                line = line.lstrip()
+                if not line:
+                    continue
+                started = True
+            yield line
+
+
+def iter_records(lines: Iterable[str], starts_record: Callable[[str], bool], header_prefix: str = "===") -> Iterator[List[str]]:
+    """
+    Group lines into records, a new record starting at each line where starts_record(line) is true.
+    Blank records and the file banner (a record starting with "KINGSTON" or header_prefix) are dropped.
+    """
+    def keep(record: List[str]) -> bool:
+        return not record[0].startswith("KINGSTON") and not record[0].startswith(header_prefix) and any(l.strip() for l in record)
     
+    current = []
     for line in lines:
-        if line.startswith("Business Name:") and current_entry:
-            # Save previous entry
-            entries.append('\n'.join(current_entry))
-            current_entry = [line]
+        if starts_record(line) and current:
+            if keep(current):
+                yield current
+            current = [line]
         else:
-            current_entry.append(line)
-    
-    if current_entry:
-        entries.append('\n'.join(current_entry))
-    
-    return [e.strip() for e in entries if e.strip() and not e.startswith("KINGSTON") and not e.startswith("===")]
+            current.append(line)
+    if current and keep(current):
+        yield current
 
 
-def split_shops_entries(content: str) -> List[str]:
-    """Split shops file content into individual entries (Store Name: or Business Name: ... separated by ---)."""
-    entries = []
-    current_entry = []
-    lines = content.split('\n')
+def iter_shop_records(lines: Iterable[str]) -> Iterator[List[str]]:
+    """Group shops.txt lines into records: Store Name:/Business Name: starts one, "---" and "END OF ..." end one."""
+    def keep(record: List[str]) -> bool:
+        return not record[0].startswith("KINGSTON") and not record[0].startswith("====") and any(l.strip() for l in record)
+    
+    current = []
     for line in lines:
-        is_new_entry = line.startswith("Store Name:") or line.startswith("Business Name:")
-        if is_new_entry and current_entry:
-            entries.append('\n'.join(current_entry))
-            current_entry = [line]
-        elif line.strip() == "---" or (line.strip().startswith("END OF") and current_entry):
-            if current_entry:
-                entries.append('\n'.join(current_entry))
-            current_entry = []
-        elif not (line.strip() == "---" or line.strip().startswith("END OF")):
-            current_entry.append(line)
-    if current_entry:
-        entries.append('\n'.join(current_entry))
-    return [e.strip() for e in entries if e.strip() and not e.startswith("KINGSTON") and not e.startswith("====")]
+        stripped = line.strip()
+        if (line.startswith("Store Name:") or line.startswith("Business Name:")) and current:
+            if keep(current):
+                yield current
+            current = [line]
+        elif stripped == "---" or stripped.startswith("END OF"):
+            if current and keep(current):
+                yield current
+            current = []
+        else:
+            current.append(line)
+    if current and keep(current):
+        yield current
+
+
+def _starts_food_record(line: str) -> bool:
+    return line.startswith("Business Name:")
+
+
+def _starts_place_record(line: str) -> bool:
+    return line.startswith("Place Name:")
+
+
+def iter_entries(file_type: str, file_stem: str, lines: Iterable[str]) -> Iterator[Dict]:
+    """Yield parsed entries from a data file's lines as they are read."""
+    if file_type == "food":
+        # shops.txt lives under Food/ but uses the shop schema
+        if file_stem == "shops":
+            for record in iter_shop_records(lines):
+                yield parse_fields(record, SHOP_FIELDS)
+            return
+        for record in iter_records(lines, _starts_food_record):
+            yield parse_fields(record, FOOD_FIELDS)
+        return
+    if file_type == "places":
+        for record in iter_records(lines, _starts_place_record):
+            yield parse_fields(record, PLACE_FIELDS)
+        return
+    # Events are one per line, pipe-separated
+    for line in lines:
+        if line.strip() and '|' in line:
+            entry = parse_event_entry(line)
+            if entry:
+                yield entry
 
 
-def parse_shop_entry(entry_text: str) -> Dict:
-    """Parse a shop/store entry (Store Name or Business Name, Location, Hours of Operation or Hours, Info or Notes, Category)."""
-    entry = {}
-    lines = entry_text.strip().split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line or line == "---":
-            continue
-        if line.startswith("Store Name:"):
-            entry["name"] = line.replace("Store Name:", "").strip()
-        elif line.startswith("Business Name:"):
-            entry["name"] = line.replace("Business Name:", "").strip()
-        elif line.startswith("Location:"):
-            entry["location"] = line.replace("Location:", "").strip()
-        elif line.startswith("Location URL:"):
-            entry["url"] = line.replace("Location URL:", "").strip()
-        elif line.startswith("Hours of Operation:") or line.startswith("Hours:"):
-            entry["hours"] = (line.replace("Hours of Operation:", "").replace("Hours:", "").strip())
-        elif line.startswith("Info:") or line.startswith("Notes:"):
-            entry["notes"] = (line.replace("Info:", "").replace("Notes:", "").strip())
-        elif line.startswith("Local Sourcing:"):
-            entry["local_sourcing"] = line.replace("Local Sourcing:", "").strip()
-        elif line.startswith("Category:"):
-            entry["category"] = line.replace("Category:", "").strip()
-    if not entry.get("url") and entry.get("location") and entry.get("name"):
-        entry["url"] = generate_google_maps_url(entry["location"], entry["name"])
-    return entry
+def _joined(records: Iterator[List[str]]) -> List[str]:
+    return ['\n'.join(record).strip() for record in records]
+
+
+def split_food_entries(content: str) -> List[str]:
+    """Split food file content into individual entries"""
+    return _joined(iter_records(content.split('\n'), _starts_food_record))
+
+
+def split_shops_entries(content: str) -> List[str]:
+    """Split shops file content into individual entries (Store Name: or Business Name: ... separated by ---)."""
+    return _joined(iter_shop_records(content.split('\n')))
 
 
 def split_place_entries(content: str) -> List[str]:
     """Split places file content into individual entries"""
-    entries = []
-    current_entry = []
-    lines = content.split('\n')
-    
-    for line in lines:
-        if line.startswith("Place Name:") and current_entry:
-            # Save previous entry
-            entries.append('\n'.join(current_entry))
-            current_entry = [line]
-        else:
-            current_entry.append(line)
-    
-    if current_entry:
-        entries.append('\n'.join(current_entry))
-    
-    return [e.strip() for e in entries if e.strip() and not e.startswith("KINGSTON") and not e.startswith("===")]
+    return _joined(iter_records(content.split('\n'), _starts_place_record))
 
 
-def load_all_data() -> Dict[str, Dict[str, List[Dict]]]:
-    """Load all data from discovered files and organize by category"""
-    data_files = discover_data_files()
-    all_data = {
-        "food": {},
-        "places": {},
-        "events": {}
-    }
-    
-    # Load Food files (and shops.txt with shop parser)
-    for file_path in data_files["food"]:
-        file_name = file_path.stem
-        content = load_data(file_path)
-        if content:
-            if file_name == "shops":
-                entries = split_shops_entries(content)
-                parsed_entries = [parse_shop_entry(e) for e in entries if e]
-            else:
-                entries = split_food_entries(content)
-                parsed_entries = [parse_food_entry(e) for e in entries if e]
-            all_data["food"][file_name] = parsed_entries
-            print(f"✅ Loaded {len(parsed_entries)} entries from {file_name}")
-    
-    # Load Places files
-    for file_path in data_files["places"]:
-        file_name = file_path.stem
-        content = load_data(file_path)
-        if content:
-            entries = split_place_entries(content)
-            parsed_entries = [parse_place_entry(e) for e in entries if e]
-            all_data["places"][file_name] = parsed_entries
-            print(f"✅ Loaded {len(parsed_entries)} entries from {file_name}")
-    
-    # Load Events files
-    for file_path in data_files["events"]:
-        file_name = file_path.stem
-        content = load_data(file_path)
-        if content:
-            # Events are one per line, pipe-separated
-            lines = content.strip().split('\n')
-            parsed_entries = []
-            for line in lines:
-                if line.strip() and '|' in line:
-                    entry = parse_event_entry(line)
-                    if entry:
-                        parsed_entries.append(entry)
-            all_data["events"][file_name] = parsed_entries
-            print(f"✅ Loaded {len(parsed_entries)} entries from {file_name}")
-    
-    return all_data
+@traced("dataset.parse_file")
+def parse_data_file(file_type: str, file_path: Path) -> Optional[List[Dict]]:
+    """
+    Load and parse one data file. file_type is "food", "places" or "events". Returns None if the file is missing or empty.
+    The file is streamed: lines are read from the handle and entries parsed as each record completes.
+    """
+    if not file_path.exists():
+        log.warning("data file not found, skipping", extra={"path": str(file_path)})
+        return None
+    annotate(file=file_path.name)
+    try:
+        lines = iter_lines(file_path)
+        first = next(lines, None)
+        if first is None:
+            return None
+        entries = list(iter_entries(file_type, file_path.stem, itertools.chain([first], lines)))
+        annotate(entries=len(entries))
+        log.debug("data file parsed", extra={"file": file_path.name, "entries": len(entries)})
+        return entries
+    except Exception:
+        log.exception("could not read data file", extra={"path": str(file_path)})
+        return None
 
 
 def detect_query_specificity(question: str) -> Tuple[bool, List[str]]:
@@ -681,10 +656,56 @@ def sort_food_entries_by_certification(entries: List[Dict]) -> List[Dict]:
     return sorted(entries, key=lambda e: get_certification_priority(e.get('certification', '')), reverse=True)
 
 
+def entry_search_text(entry: Dict) -> str:
+    """Lowercased text of all entry fields - what keyword search matches against."""
+    return ' '.join(str(v).lower() for v in entry.values() if v)
+
+
+class FileIndex:
+    """
+    Search structures for one data file, built once per load and kept next to its entries.
+    texts[i] is the keyword-search text of entries[i]; cert_buckets groups entry positions by
+    certification priority (file order within a bucket), so certification ordering needs no sort.
+    add() is only used while building; a published index is extended with extended().
+    """
+    __slots__ = ("texts", "cert_buckets")
+
+    def __init__(self, entries: List[Dict]):
+        self.texts: List[str] = []
+        self.cert_buckets: Dict[int, List[int]] = {3: [], 2: [], 1: [], 0: []}
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry: Dict) -> None:
+        """Index the entry that was just appended to the file's entry list."""
+        position = len(self.texts)
+        self.texts.append(entry_search_text(entry))
+        self.cert_buckets[get_certification_priority(entry.get('certification', ''))].append(position)
+
+    def extended(self, *entries: Dict) -> "FileIndex":
+        """Copy of this index with the entries appended; the original is left untouched."""
+        index = FileIndex([])
+        index.texts = list(self.texts)
+        index.cert_buckets = {priority: list(positions) for priority, positions in self.cert_buckets.items()}
+        for entry in entries:
+            index.add(entry)
+        return index
+
+    def cert_order(self) -> List[int]:
+        """Entry positions, Gold > Silver > Bronze > null, file order within each level."""
+        return self.cert_buckets[3] + self.cert_buckets[2] + self.cert_buckets[1] + self.cert_buckets[0]
+
+    def sorted_by_certification(self, entries: List[Dict]) -> List[Dict]:
+        """Same result as sort_food_entries_by_certification(entries), without sorting."""
+        return [entries[i] for i in self.cert_order()]
+
+
 def search_in_entries(entries: List[Dict], keywords: List[str], location_keywords: List[str] = None, 
                      target_date: Optional[datetime] = None, target_month: Optional[int] = None,
-                     return_all_if_no_keywords: bool = False, is_food: bool = False) -> List[Dict]:
-    """Search entries for matching keywords, with optional date filtering for events"""
+                     return_all_if_no_keywords: bool = False, is_food: bool = False,
+                     index: Optional[FileIndex] = None) -> List[Dict]:
+    """Search entries for matching keywords, with optional date filtering for events.
+    With a FileIndex for these entries, precomputed search text and certification order are used."""
     matches = []
     
     # If no keywords and no location keywords and no date filter, and return_all flag is set, return all entries
@@ -692,10 +713,17 @@ def search_in_entries(entries: List[Dict], keywords: List[str], location_keyword
         return entries
     
     # Filter out stop words (caller may pass expanded/typo-corrected keywords)
-    meaningful_keywords = [kw for kw in keywords if kw and kw.lower() not in STOP_WORDS and len(kw) > 2]
+    meaningful_keywords = [kw.lower() for kw in keywords if kw and kw.lower() not in STOP_WORDS and len(kw) > 2]
     
-    for entry in entries:
-        entry_text = ' '.join(str(v).lower() for v in entry.values() if v)
+    if index is not None:
+        # Visiting entries in certification order makes the matches come out already sorted
+        positions = index.cert_order() if is_food else range(len(index.texts))
+    else:
+        positions = range(len(entries))
+    
+    for position in positions:
+        entry = entries[position]
+        entry_text = index.texts[position] if index is not None else entry_search_text(entry)
         
         # For events, check date filtering first
         if target_date and "start_date" in entry:
@@ -706,7 +734,7 @@ def search_in_entries(entries: List[Dict], keywords: List[str], location_keyword
                 continue
         
         # Match if any keyword appears in name, description, category, location, etc.
-        if meaningful_keywords and any(kw.lower() in entry_text for kw in meaningful_keywords):
+        if meaningful_keywords and any(kw in entry_text for kw in meaningful_keywords):
             matches.append(entry)
         # Check location if provided
         elif location_keywords:
@@ -721,15 +749,22 @@ def search_in_entries(entries: List[Dict], keywords: List[str], location_keyword
             matches.append(entry)
     
     # Sort food entries by certification priority if this is a food search
-    if is_food and matches:
+    if is_food and matches and index is None:
         matches = sort_food_entries_by_certification(matches)
     
     return matches
 
 
-def find_relevant_context(question: str, all_data: Dict) -> Dict:
+def _sorted_by_certification(entries: List[Dict], index: Optional[FileIndex]) -> List[Dict]:
+    return index.sorted_by_certification(entries) if index is not None else sort_food_entries_by_certification(entries)
+
+
+@traced("retrieval.find_relevant_context")
+def find_relevant_context(question: str, all_data: Dict, indexes: Optional[Dict] = None) -> Dict:
     """Find relevant context based on question specificity, with date filtering for events.
-    Uses expanded keywords (typo-corrected + fuzzy) so descriptions/categories match even with misspellings."""
+    Uses expanded keywords (typo-corrected + fuzzy) so descriptions/categories match even with misspellings.
+    indexes (same shape as all_data, FileIndex values) lets searches reuse precomputed search structures."""
+    indexes = indexes or {"food": {}, "places": {}, "events": {}}
     question_lower = question.lower()
     # Extract words (allow hyphenated and apostrophes for "ice-cream", "don't")
     words = re.findall(r"\b[\w']+\b", question_lower)
@@ -787,13 +822,14 @@ def find_relevant_context(question: str, all_data: Dict) -> Dict:
             file_key = file_name.replace(".txt", "")
             if file_key in all_data["food"]:
                 entries = all_data["food"][file_key]
-                matches = search_in_entries(entries, search_keywords, location_keywords, is_food=True)
+                index = indexes["food"].get(file_key)
+                matches = search_in_entries(entries, search_keywords, location_keywords, is_food=True, index=index)
                 if matches:
                     # Already sorted by certification in search_in_entries
                     relevant_context["food"][file_key] = matches if wants_full_list else matches[:10]
                 else:
                     # If no matches, return entries based on full_list preference, sorted by certification
-                    sorted_entries = sort_food_entries_by_certification(entries) if entries else []
+                    sorted_entries = _sorted_by_certification(entries, index) if entries else []
                     relevant_context["food"][file_key] = sorted_entries if wants_full_list else sorted_entries[:1] if sorted_entries else []
     
     # Handle vague queries or queries without specific file matches
@@ -840,13 +876,14 @@ def find_relevant_context(question: str, all_data: Dict) -> Dict:
                     # Try to find matches first
                     # Use return_all_if_no_keywords for very vague queries
                     is_vague_food_query = len(meaningful_keywords) <= 3 and not location_keywords
-                    matches = search_in_entries(entries, search_keywords, location_keywords, return_all_if_no_keywords=is_vague_food_query, is_food=True)
+                    index = indexes["food"].get(file_key)
+                    matches = search_in_entries(entries, search_keywords, location_keywords, return_all_if_no_keywords=is_vague_food_query, is_food=True, index=index)
                     if matches:
                         # Already sorted by certification in search_in_entries
                         relevant_context["food"][file_key] = matches if wants_full_list else matches[:10]
                     else:
                         # If no keyword matches but it's a food query, return sample entries sorted by certification
-                        sorted_entries = sort_food_entries_by_certification(entries)
+                        sorted_entries = _sorted_by_certification(entries, index)
                         relevant_context["food"][file_key] = sorted_entries if wants_full_list else sorted_entries[:10]
         
         # Places: Return entries based on full_list preference
@@ -856,7 +893,7 @@ def find_relevant_context(question: str, all_data: Dict) -> Dict:
                     # For vague place queries, be more lenient - try keyword matching first
                     # Use return_all_if_no_keywords for very vague queries (like "good places to visit")
                     is_vague_place_query = (len(meaningful_keywords) <= 3 and not location_keywords) or any(word in question_lower for word in ["good", "best", "recommend", "some", "tell me about", "places to visit"])
-                    matches = search_in_entries(entries, search_keywords, location_keywords, return_all_if_no_keywords=is_vague_place_query)
+                    matches = search_in_entries(entries, search_keywords, location_keywords, return_all_if_no_keywords=is_vague_place_query, index=indexes["places"].get(file_key))
                     if matches:
                         relevant_context["places"][file_key] = matches if wants_full_list else matches[:5]
                     else:
@@ -868,7 +905,8 @@ def find_relevant_context(question: str, all_data: Dict) -> Dict:
             for file_key, entries in all_data["events"].items():
                 if entries:
                     # Apply date filtering if date/month specified
-                    matches = search_in_entries(entries, keywords, location_keywords, target_date, target_month)
+                    index = indexes["events"].get(file_key)
+                    matches = search_in_entries(entries, keywords, location_keywords, target_date, target_month, index=index)
                     if matches:
                         # If full list requested, return all matches; otherwise limit
                         relevant_context["events"][file_key] = matches if wants_full_list else matches[:5]
@@ -877,7 +915,7 @@ def find_relevant_context(question: str, all_data: Dict) -> Dict:
                         relevant_context["events"][file_key] = []
                     else:
                         # No date filter, return based on full_list preference
-                        all_matches = search_in_entries(entries, keywords, location_keywords)
+                        all_matches = search_in_entries(entries, keywords, location_keywords, index=index)
                         if all_matches:
                             relevant_context["events"][file_key] = all_matches if wants_full_list else all_matches[:3]
                         else:
@@ -886,6 +924,100 @@ def find_relevant_context(question: str, all_data: Dict) -> Dict:
     return relevant_context
 
 
+# "Near X" questions: results per type, ranked by distance (more when a full list is asked for)
+NEARBY_LIMITS = {"food": 10, "places": 5, "events": 5}
+NEARBY_FULL_LIST_LIMIT = 50
+NEARBY_FOOD_WORDS = {"food", "eat", "restaurant", "restaurants", "cafe", "cafes", "coffee", "bakery", "bakeries", "pub", "pubs", "dining", "lunch", "dinner", "breakfast", "brunch", "drink", "drinks"}
+NEARBY_GENERIC_WORDS = {"good", "best", "see", "recommend", "recommendation", "place", "places", "near", "nearby", "around", "close", "next"}
+NEARBY_PLACE_WORDS = (set(PLACE_KEYWORDS) | {"museums", "parks", "landmarks", "monuments"}) - NEARBY_GENERIC_WORDS
+
+
+@traced("retrieval.find_nearby_context")
+def find_nearby_context(question: str, all_data: Dict, indexes: Dict, spatial,
+                        open_masks: Optional[Dict[str, Dict[str, int]]] = None) -> Optional[Tuple[Dict, str, Dict[int, float]]]:
+    """
+    For questions like "cafes near Fort Henry" or "pubs around 200 Princess St": the entries of the
+    asked-for types closest to the named place, ranked by distance, from the spatial index.
+    open_masks (type -> file -> bitmask of entry positions, from dataset.open_masks) keeps only open entries.
+    Returns (context_dict, place label, {id(entry): km}) or None when no known place is named or
+    nothing geocoded lies within geo.NEARBY_MAX_KM - callers then use find_relevant_context.
+    """
+    place = resolve_place(question)
+    if place is None or spatial is None:
+        return None
+    # Intent and keywords come from the words before "near ...", so the place name does not count
+    asked = question[:place.start].lower()
+    words = set(re.findall(r"\b[\w']+\b", asked))
+    is_specific, specific_files = detect_query_specificity(asked)
+    # detect_query_specificity fuzzy-matches words ("what" -> "eat"); only trust it when a food word is really there
+    names_food = bool(words & (set(FOOD_KEYWORD_MAP) | set(TYPO_TO_CANONICAL) | NEARBY_FOOD_WORDS))
+    food_files = {f.replace(".txt", "") for f in specific_files} if is_specific and specific_files and names_food else None
+    wanted = [
+        file_type for file_type, asked_for in (
+            ("food", bool(food_files) or bool(words & NEARBY_FOOD_WORDS)),
+            ("places", bool(words & NEARBY_PLACE_WORDS)),
+            ("events", bool(words & set(EVENT_KEYWORDS))),
+        ) if asked_for
+    ] or ["food", "places", "events"]
+    category_words = NEARBY_FOOD_WORDS | set(FOOD_KEYWORD_MAP) | set(PLACE_KEYWORDS) | set(EVENT_KEYWORDS) | NEARBY_GENERIC_WORDS
+    keywords = expand_keywords_for_search([w for w in words if w not in STOP_WORDS and w not in category_words and len(w) > 2])
+    wants_full_list = any(phrase in question.lower() for phrase in ["full list", "all", "complete list", "everything", "entire list"])
+    
+    context = {"food": {}, "places": {}, "events": {}}
+    distances = {}
+    for file_type in wanted:
+        limit = NEARBY_FULL_LIST_LIMIT if wants_full_list else NEARBY_LIMITS[file_type]
+        masks = open_masks.get(file_type) if open_masks else None
+        filtered = (file_type == "food" and food_files) or keywords or masks is not None
+        # Filtering needs every candidate in range; otherwise the k nearest are enough
+        hits = spatial.nearest(file_type, place.lat, place.lon, spatial.size(file_type) if filtered else limit)
+        if file_type == "food" and food_files:
+            hits = [hit for hit in hits if hit[1][0] in food_files]
+        if masks is not None:
+            hits = [hit for hit in hits if masks.get(hit[1][0], 0) >> hit[1][1] & 1]
+        if keywords:
+            # Entries mentioning the keywords first (each group still closest first), then the rest nearby
+            hits.sort(key=lambda hit: not any(kw in indexes[file_type][hit[1][0]].texts[hit[1][1]] for kw in keywords))
+        for distance, (stem, position) in hits[:limit]:
+            entry = all_data[file_type][stem][position]
+            context[file_type].setdefault(stem, []).append(entry)
+            distances[id(entry)] = distance
+    if not distances:
+        return None
+    return context, place.label, distances
+
+
+def restrict_to_masks(all_data: Dict, indexes: Dict, masks: Dict[str, Dict[str, int]]) -> Tuple[Dict, Dict]:
+    """
+    all_data and indexes narrowed to the entries selected by masks (type -> file -> bitmask of
+    positions, e.g. from dataset.open_masks or dataset.facet_masks). Narrowed files drop their
+    search index, whose positions no longer line up; types without masks pass through unchanged.
+    """
+    data = dict(all_data)
+    narrowed_indexes = dict(indexes)
+    for file_type, by_stem in masks.items():
+        data[file_type] = {stem: [entries[i] for i in positions(by_stem.get(stem, 0))] for stem, entries in all_data[file_type].items()}
+        narrowed_indexes[file_type] = {}
+    return data, narrowed_indexes
+
+
+def describe_opening_time(moment: datetime, language: str = "en") -> str:
+    """Prompt note saying which moment the listed entries are open at."""
+    if language == "fr":
+        day = ("lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche")[moment.weekday()]
+        return f"(Restaurants et lieux ouverts le {day} à {moment:%H}h{moment:%M}, heure de Kingston. Les établissements aux heures inconnues ou saisonnières ne sont pas listés.)"
+    return f"(Restaurants and places open on {moment:%A} at {moment:%H:%M}, Kingston time. Places with unknown or seasonal hours are not listed.)"
+
+
+def describe_facets(facets: Dict[str, List[str]], language: str = "en") -> str:
+    """Prompt note naming the facet filters the listed entries were selected by."""
+    slot = _language_slot(language)
+    filters = "; ".join(f"{PROMPT_LABELS[field][slot]}: {' / '.join(v.title() for v in values)}" for field, values in facets.items())
+    if language == "fr":
+        return f"(Seuls les établissements correspondant à ces critères sont listés - {filters}.)"
+    return f"(Only entries matching these filters are listed - {filters}.)"
+
+
 def clean_response_formatting(text: str) -> str:
     """Clean up response formatting by removing excessive blank lines, numbered lists, and fixing spacing"""
     if not text:
@@ -933,113 +1065,502 @@ def clean_response_formatting(text: str) -> str:
     return result
 
 
-def format_context_for_prompt(context_dict: Dict) -> str:
-    """Format context dictionary into a readable string for the prompt"""
+# Languages entry fragments are pre-rendered in; a fragment tuple is indexed in this order.
+FRAGMENT_LANGUAGES = ("en", "fr")
+# Prompt field labels (en, fr) and, per data type, the fields rendered for an entry in prompt order
+PROMPT_LABELS = {
+    "location": ("Location", "Emplacement"),
+    "url": ("Find Location", "Trouver l'emplacement"),
+    "hours": ("Hours", "Heures"),
+    "notes": ("Notes", "Notes"),
+    "category": ("Category", "Catégorie"),
+    "local_sourcing": ("Local Sourcing", "Approvisionnement local"),
+    "veg_vegan": ("Veg/Vegan", "Végétarien/Végan"),
+    "certification": ("Green Plate Certification", "Certification Green Plate"),
+    "about": ("About", "À propos"),
+    "fees": ("Fees", "Frais"),
+    "accessibility": ("Accessibility", "Accessibilité"),
+    "washrooms": ("Washrooms", "Toilettes"),
+    "date": ("Date", "Date"),
+    "venue": ("Venue", "Lieu"),
+    "distance": ("Distance", "Distance"),
+}
+PROMPT_FIELDS = {
+    "food": ("location", "url", "hours", "notes", "category", "local_sourcing", "veg_vegan", "certification"),
+    "places": ("location", "url", "about", "hours", "fees", "accessibility", "washrooms"),
+    "events": ("date", "venue", "location", "url"),
+}
+# Section headers for places and events (food sections are named after their file)
+PROMPT_SECTION_HEADERS = {
+    "places": ("PLACES TO VISIT", "LIEUX À VISITER"),
+    "events": ("EVENTS", "ÉVÉNEMENTS"),
+}
+
+
+def _language_slot(language: str) -> int:
+    return FRAGMENT_LANGUAGES.index(language) if language in FRAGMENT_LANGUAGES else 0
+
+
+def _shown_in_prompt(field: str, value) -> bool:
+    if not value:
+        return False
+    if field == "certification":
+        return value != "null"
+    if field in ("accessibility", "washrooms"):
+        return value.lower() not in ["null", "none", ""]
+    return True
+
+
+def render_entry_fragment(file_type: str, entry: Dict, language: str = "en") -> str:
+    """An entry's prompt block (name line plus indented field lines), without its list number."""
+    slot = _language_slot(language)
+    lines = [f"{entry.get('name', 'N/A')}"]
+    for field in PROMPT_FIELDS[file_type]:
+        value = entry.get(field)
+        if _shown_in_prompt(field, value):
+            lines.append(f"   {PROMPT_LABELS[field][slot]}: {value}")
+    return '\n'.join(lines)
+
+
+def render_fragments(file_type: str, entries: Iterable[Dict]) -> Dict[int, Tuple[str, ...]]:
+    """
+    Pre-rendered prompt fragments for a file's entries, one per FRAGMENT_LANGUAGES, keyed by id(entry).
+    Built when the dataset is loaded and kept with it, so the ids stay valid for its lifetime.
+    """
+    return {
+        id(entry): tuple(render_entry_fragment(file_type, entry, language) for language in FRAGMENT_LANGUAGES)
+        for entry in entries
+    }
+
+
+# Reference token a URL is replaced with in the prompt ("[L12]")
+LINK_REF_RE = re.compile(r"\[L(\d+)\]")
+
+
+class LinkRefs:
+    """
+    The URLs of one prompt, each replaced by a short [L<n>] token. Maps URLs run to 100+
+    characters of percent-encoding, so the model reads and echoes a few tokens instead;
+    expand() puts the URLs back into its answer.
+    """
+
+    def __init__(self):
+        self.urls: List[str] = []
+        self._refs: Dict[str, str] = {}
+
+    def ref(self, url: str) -> str:
+        token = self._refs.get(url)
+        if token is None:
+            self.urls.append(url)
+            token = self._refs[url] = f"[L{len(self.urls)}]"
+        return token
+
+    def expand(self, text: str) -> str:
+        def url_for(match: re.Match) -> str:
+            n = int(match.group(1))
+            return self.urls[n - 1] if 0 < n <= len(self.urls) else match.group(0)
+        return LINK_REF_RE.sub(url_for, text) if text else text
+
+
+@traced("prompt.format_context_for_prompt")
+def format_context_for_prompt(context_dict: Dict, language: str = "en", fragments: Optional[Dict] = None,
+                              distances: Optional[Dict[int, float]] = None, place: Optional[str] = None,
+                              links: Optional[LinkRefs] = None) -> str:
+    """Format context dictionary into a readable string for the prompt.
+    fragments (type -> file -> render_fragments() result) supplies pre-rendered entry blocks; entries
+    without one are rendered on the fly. distances ({id(entry): km}, from find_nearby_context) adds a
+    distance line to each entry. links replaces each entry's URL with its [L<n>] reference token."""
+    slot = _language_slot(language)
+    fragments = fragments or {}
     parts = []
     
-    # Format Food entries
-    if context_dict["food"]:
-        food_parts = []
-        for file_key, entries in context_dict["food"].items():
-            if entries:
+    for file_type in ("food", "places", "events"):
+        if not context_dict[file_type]:
+            continue
+        section_parts = []
+        for file_key, entries in context_dict[file_type].items():
+            if not entries:
+                continue
+            if file_type == "food":
                 category_name = file_key.replace("_", " ").title()
-                food_parts.append(f"\n=== {category_name.upper()} ===")
-                for i, entry in enumerate(entries, 1):
-                    food_parts.append(f"\n{i}. {entry.get('name', 'N/A')}")
-                    if entry.get('location'):
-                        food_parts.append(f"   Location: {entry['location']}")
-                    if entry.get('url'):
-                        food_parts.append(f"   Find Location: {entry['url']}")
-                    if entry.get('hours'):
-                        food_parts.append(f"   Hours: {entry['hours']}")
-                    if entry.get('notes'):
-                        food_parts.append(f"   Notes: {entry['notes']}")
-                    if entry.get('category'):
-                        food_parts.append(f"   Category: {entry['category']}")
-                    if entry.get('local_sourcing'):
-                        food_parts.append(f"   Local Sourcing: {entry['local_sourcing']}")
-                    if entry.get('veg_vegan'):
-                        food_parts.append(f"   Veg/Vegan: {entry['veg_vegan']}")
-                    if entry.get('certification') and entry.get('certification') != 'null':
-                        food_parts.append(f"   Green Plate Certification: {entry['certification']}")
-        if food_parts:
-            parts.append('\n'.join(food_parts))
-    
-    # Format Places entries
-    if context_dict["places"]:
-        place_parts = []
-        for file_key, entries in context_dict["places"].items():
-            if entries:
-                place_parts.append(f"\n=== PLACES TO VISIT ===")
-                for i, entry in enumerate(entries, 1):
-                    place_parts.append(f"\n{i}. {entry.get('name', 'N/A')}")
-                    if entry.get('location'):
-                        place_parts.append(f"   Location: {entry['location']}")
-                    if entry.get('url'):
-                        place_parts.append(f"   Find Location: {entry['url']}")
-                    if entry.get('about'):
-                        place_parts.append(f"   About: {entry['about']}")
-                    if entry.get('hours'):
-                        place_parts.append(f"   Hours: {entry['hours']}")
-                    if entry.get('fees'):
-                        place_parts.append(f"   Fees: {entry['fees']}")
-                    if entry.get('accessibility') and entry.get('accessibility').lower() not in ['null', 'none', '']:
-                        place_parts.append(f"   Accessibility: {entry['accessibility']}")
-                    if entry.get('washrooms') and entry.get('washrooms').lower() not in ['null', 'none', '']:
-                        place_parts.append(f"   Washrooms: {entry['washrooms']}")
-        if place_parts:
-            parts.append('\n'.join(place_parts))
-    
-    # Format Events entries
-    if context_dict["events"]:
-        event_parts = []
-        for file_key, entries in context_dict["events"].items():
-            if entries:
-                event_parts.append(f"\n=== EVENTS ===")
-                for i, entry in enumerate(entries, 1):
-                    event_parts.append(f"\n{i}. {entry.get('name', 'N/A')}")
-                    if entry.get('date'):
-                        event_parts.append(f"   Date: {entry['date']}")
-                    if entry.get('venue'):
-                        event_parts.append(f"   Venue: {entry['venue']}")
-                    if entry.get('location'):
-                        event_parts.append(f"   Location: {entry['location']}")
-                    if entry.get('url'):
-                        event_parts.append(f"   Find Location: {entry['url']}")
-        if event_parts:
-            parts.append('\n'.join(event_parts))
+                section_parts.append(f"\n=== {category_name.upper()} ===")
+            else:
+                section_parts.append(f"\n=== {PROMPT_SECTION_HEADERS[file_type][slot]} ===")
+            file_fragments = fragments.get(file_type, {}).get(file_key) or {}
+            for i, entry in enumerate(entries, 1):
+                fragment = file_fragments.get(id(entry))
+                text = fragment[slot] if fragment is not None else render_entry_fragment(file_type, entry, language)
+                if links is not None and entry.get("url"):
+                    text = text.replace(entry["url"], links.ref(entry["url"]))
+                if distances and id(entry) in distances:
+                    text += f"\n   {PROMPT_LABELS['distance'][slot]}: {distances[id(entry)]:.1f} km ({('from', 'de')[slot]} {place})"
+                section_parts.append(f"\n{i}. {text}")
+        if section_parts:
+            parts.append('\n'.join(section_parts))
     
     return '\n\n'.join(parts) if parts else "No relevant data found."
 
 
-def ask(question: str, language: str = "en"):
+# Section titles of a listing answer (food sections are named after their file)
+LISTING_INTROS = {
+    "en": "Here is what I found in the Kingston guide:",
+    "fr": "Voici ce que j'ai trouvé dans le guide de Kingston :",
+}
+
+
+def listing_answer(context_dict: Dict, language: str = "en", fragments: Optional[Dict] = None,
+                   distances: Optional[Dict[int, float]] = None, place: Optional[str] = None) -> str:
+    """
+    Deterministic answer listing the retrieved entries in the chat's answer format (bold
+    section and entry names, one bullet per field). Used when there is no time left for the
+    model, so the user still gets the data the question matched.
+    """
+    slot = _language_slot(language)
+    fragments = fragments or {}
+    parts = [LISTING_INTROS.get(language, LISTING_INTROS["en"])]
+    for file_type in ("food", "places", "events"):
+        for file_key, entries in context_dict[file_type].items():
+            if not entries:
+                continue
+            title = file_key.replace("_", " ").upper() if file_type == "food" else PROMPT_SECTION_HEADERS[file_type][slot]
+            parts.append(f"**{title}**")
+            file_fragments = fragments.get(file_type, {}).get(file_key) or {}
+            for entry in entries:
+                fragment = file_fragments.get(id(entry))
+                text = fragment[slot] if fragment is not None else render_entry_fragment(file_type, entry, language)
+                name, *fields = text.split("\n")
+                lines = [f"**{name}**"] + [f"• {line.strip()}" for line in fields]
+                if distances and id(entry) in distances:
+                    lines.append(f"• {PROMPT_LABELS['distance'][slot]}: {distances[id(entry)]:.1f} km ({('from', 'de')[slot]} {place})")
+                parts.append("\n".join(lines))
+    return clean_response_formatting("\n\n".join(parts))
+
+
+# Per-language parts of the system prompt: (language instruction, section headers, example answer)
+PROMPT_LANGUAGE_PARTS = {
+    "en": (
+        "\n\nCRITICAL LANGUAGE INSTRUCTION: You MUST respond entirely in English. All text, including section headers, labels, and descriptions, must be in English.",
+        "**CAFÉS**, **RESTAURANTS**, **BAKERIES**, **PUBS**, **SHOPS**, **PLACES**, **EVENTS**",
+        """
+**CAFÉS**
+
+**Kingston Coffee House**
+• Location: 1046 Princess St
+• Hours: Mon-Sun: 7:00am - 6:00pm
+• Notes: A local coffee shop known for its cozy atmosphere
+• Veg/Vegan: Yes
+""",
+    ),
+    "fr": (
+        "\n\nCRITICAL LANGUAGE INSTRUCTION: You MUST respond entirely in French. All text, including section headers, labels, and descriptions, must be in French. Use French translations: 'Location' → 'Emplacement', 'Hours' → 'Heures', 'Find Location' → 'Trouver l'emplacement', 'About' → 'À propos', 'Fees' → 'Frais', 'Date' → 'Date', 'Venue' → 'Lieu', 'Notes' → 'Notes', 'Veg/Vegan' → 'Végétarien/Végan', 'Green Plate Certification' → 'Certification Green Plate'.",
+        "**CAFÉS**, **RESTAURANTS**, **BOULANGERIES**, **PUBS**, **MAGASINS**, **LIEUX**, **ÉVÉNEMENTS**",
+        """
+**CAFÉS**
+
+**Kingston Coffee House**
+• Emplacement: 1046 Princess St
+• Heures: Lun-Dim: 7h00 - 18h00
+• Notes: Un café local connu pour son atmosphère chaleureuse
+• Végétarien/Végan: Oui
+""",
+    ),
+}
+
+
+def build_system_prompt(language: str = "en") -> str:
+    """The static instructions for a language: everything in the prompt except the data and the question."""
+    language_instruction, section_headers, example_format = PROMPT_LANGUAGE_PARTS.get(language, PROMPT_LANGUAGE_PARTS["en"])
+    return f"""You are a friendly, helpful city guide assistant for Kingston, Ontario. Your goal is to give the user the best possible answer using ONLY the data in the user's message.
+
+INTERPRETATION & INTENT:
+- Interpret the user's question by intent, not just exact words. If they ask for "thrif stores", "cheap clothes", "secondhand shops", or "places to buy used stuff", use the SHOPS data (thrift, consignment, vintage) and answer helpfully.
+- Ignore minor typos and misspellings (e.g. resturant, cafee, thrif, cloths). Assume they mean the closest sensible category (restaurant, cafe, thrift, clothes) and answer from the relevant data.
+- If the question could match several types (e.g. "stores" = shops or places), prefer the category that has matching data and give a clear, concrete answer. Do not say "I don't have information" if the data clearly contains relevant entries—use them.
+- Be conversational and concise. Lead with the most relevant results; add a short friendly line if helpful (e.g. "Here are some thrift and consignment options in Kingston:").
+
+CRITICAL FORMATTING RULES - FOLLOW EXACTLY:
+
+1. Section Headers: Use {section_headers} as section headers (bold markdown)
+
+2. Item Format - Each business/place/event name should be a BOLD HEADER (not numbered):
+   
+   For Shops (stores, clothing, boutiques, etc.): When data includes "Category:" use section **SHOPS** and format as:
+   **Store Name**
+   • Location: [address]
+   • Find Location: [URL from data - ONLY if available]
+   • Hours: [hours]
+   • Notes: [description if available]
+   • Category: [e.g. WOMEN'S CLOTHING, FOOTWEAR]
+   • Local Sourcing: [if available]
+   
+   For Food Places:
+   **Business Name**
+   • Location: [address]
+   • Find Location: [URL from data - ONLY include if URL is available in the data]
+   • Hours: [hours]
+   • Notes: [description if available]
+   • Veg/Vegan: [options if applicable]
+   • Green Plate Certification: [Gold/Silver/Bronze - ONLY include if certification is available and not null]
+   
+   For Places:
+   **Place Name**
+   • Location: [address]
+   • Find Location: [URL from data - ONLY include if URL is available in the data]
+   • About: [description]
+   • Hours: [hours]
+   • Fees: [price]
+   • Accessibility: [Full Access / Partial Access / Limited / null - ONLY include if available in data]
+   • Washrooms: [Available / Partial Available / Not Available / null - ONLY include if available in data]
+   
+   For Events:
+   **Event Name**
+   • Date: [date or date range]
+   • Venue: [venue name]
+   • Location: [address]
+   • Find Location: [URL from data - ONLY include if URL is available in the data]
+
+3. DO NOT use numbered lists (no "1.", "2.", etc.)
+4. DO NOT use dashes (-) - ONLY use bullet points (•)
+5. Put exactly ONE blank line between each item
+6. Put exactly ONE blank line after section headers
+7. If information is missing, skip that line entirely (don't write "N/A", "TBD", or empty fields)
+7a. Links in the data are reference tokens like [L3]. Copy the token exactly as given (e.g. "• Find Location: [L3]"); it is replaced with the full link afterwards
+
+8. For Places, include: **Place Name**, Location, "Find Location: [URL]" if URL is available, About, Hours, Fees, Accessibility (if available), Washrooms (if available)
+9. For Events, include: **Event Name**, Date (or Date Range), Venue, Location, and "Find Location: [URL]" if URL is available in the data
+10. For Food Places, include: **Business Name**, Location, "Find Location: [URL]" if URL is available, Hours, Notes, Veg/Vegan options, Green Plate Certification (Gold/Silver/Bronze) if available
+10a. For Shops (stores, clothing, boutiques), include: **Store Name**, Location, "Find Location: [URL]" if available, Hours, Notes, Category, Local Sourcing if available
+
+11. Order items logically (alphabetically or by relevance)
+
+11. SMART QUERY HANDLING:
+    - If user asks for "full list", "all events", "complete list", "everything" - show ALL matching items
+    - If user asks for events on a specific date (e.g., "events on feb 8") - show ALL events that fall on that date (including events that start before and end after that date)
+    - If user asks for events in a month (e.g., "events in february") - show ALL events in that month
+    - For vague queries without "full list" - show a sample (3-5 items) from each category
+    - Apply similar logic for food, shops, and places: "all restaurants" = full list, vague query = sample
+    - Match by meaning: "thrift"/"secondhand"/"consignment"/"vintage" → use SHOPS data; "cheap clothes" or "used clothing" → SHOPS. Always prefer giving a helpful answer from the data over saying you don't have information.
+
+EXAMPLE FORMAT:
+{example_format}
+
+CRITICAL: Follow this format exactly. No numbering, no extra blank lines, clean and consistent.{language_instruction}"""
+
+
+# Compiled once: the system message is byte-identical across requests in a language, so the
+# upstream provider can serve it from its prompt cache
+SYSTEM_PROMPTS = {language: build_system_prompt(language) for language in PROMPT_LANGUAGE_PARTS}
+
+
+def build_user_message(combined_context: str, question: str) -> str:
+    """The per-request part of the prompt: retrieved data and the question."""
+    return f"""Available Data:
+{combined_context}
+
+User Question: {question}
+
+Answer:"""
+
+
+def build_messages(language: str, combined_context: str, question: str) -> List[Dict]:
+    """
+    Chat messages for OpenRouter: the precompiled system prompt first, marked as a cache
+    breakpoint (honoured by providers with explicit prompt caching, ignored by the rest;
+    OpenAI-hosted models cache long identical prefixes automatically), then the user message.
+    """
+    return [
+        {
+            "role": "system",
+            "content": [{"type": "text", "text": SYSTEM_PROMPTS.get(language, SYSTEM_PROMPTS["en"]), "cache_control": {"type": "ephemeral"}}],
+        },
+        {"role": "user", "content": build_user_message(combined_context, question)},
+    ]
+
+
+# Prompt-cache effectiveness since startup, from the usage OpenRouter reports per completion
+_prompt_usage = {"requests": 0, "cache_hits": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+_prompt_usage_lock = threading.Lock()
+
+
+def record_prompt_usage(usage: Optional[Dict]) -> None:
+    if not usage:
+        return
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    with _prompt_usage_lock:
+        _prompt_usage["requests"] += 1
+        _prompt_usage["cache_hits"] += 1 if cached else 0
+        _prompt_usage["prompt_tokens"] += usage.get("prompt_tokens") or 0
+        _prompt_usage["cached_tokens"] += cached
+        _prompt_usage["completion_tokens"] += usage.get("completion_tokens") or 0
+
+
+def prompt_cache_stats() -> Dict:
+    """Counters plus the share of requests that hit the prompt cache and the share of prompt tokens served from it."""
+    with _prompt_usage_lock:
+        stats = dict(_prompt_usage)
+    stats["cache_hit_rate"] = round(stats["cache_hits"] / stats["requests"], 3) if stats["requests"] else 0.0
+    stats["cached_token_share"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+    return stats
+
+
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """Process-wide pooled client for OpenRouter: connections and TLS sessions are reused across questions."""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(limits=httpx.Limits(
+                    max_connections=OPENROUTER_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENROUTER_MAX_CONNECTIONS,
+                    keepalive_expiry=120,
+                ))
+    return _http_client
+
+
+def close_http_client() -> None:
+    global _http_client
+    with _http_client_lock:
+        client, _http_client = _http_client, None
+    if client is not None:
+        client.close()
+
+
+def warm_up_upstream(timeout: float = 10) -> bool:
+    """Open a pooled connection to OpenRouter (DNS, TCP and TLS handshake) before the first question needs it."""
+    try:
+        get_http_client().head("https://openrouter.ai/api/v1/models", timeout=timeout)
+        return True
+    except httpx.HTTPError as e:
+        log.warning("could not pre-connect to OpenRouter", extra={"error": str(e)})
+        return False
+
+
+def read_completion_stream(response: httpx.Response, deadline: Deadline) -> Dict:
+    """
+    Collect a streamed (server-sent events) completion into the shape of a non-streamed one:
+    {"id": ..., "choices": [{"message": {"content": ...}}], "usage": {...}}. An error event is returned
+    as-is. Raises RequestCancelled / TimeoutError when the deadline is cancelled / runs out.
+    """
+    parts: List[str] = []
+    result: Dict = {}
+    for line in response.iter_lines():
+        deadline.check()
+        if deadline.expired:
+            raise TimeoutError("request budget ran out while the answer was streaming")
+        if not line.startswith("data:"):
+            continue  # blank separators and ": OPENROUTER PROCESSING" keep-alive comments
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        chunk = json.loads(data)
+        if "error" in chunk:
+            return chunk
+        if chunk.get("id"):
+            result.setdefault("id", chunk["id"])
+        for choice in chunk.get("choices") or ():
+            result.setdefault("choices", [{"message": {"role": "assistant"}}])
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                parts.append(content)
+        if chunk.get("usage"):
+            result["usage"] = chunk["usage"]
+    if "choices" in result:
+        result["choices"][0]["message"]["content"] = "".join(parts)
+    return result
+
+
+def _ms_since(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _count_entries(context_dict: Dict) -> int:
+    return sum(len(entries) for category in context_dict.values() for entries in category.values())
+
+
+def _with_filter_notes(context: str, language: str, opening, facets: Dict[str, List[str]]) -> str:
+    notes = ([describe_opening_time(opening[1], language)] if opening else []) + ([describe_facets(facets, language)] if facets else [])
+    return "\n".join(notes + [context])
+
+
+@traced("chat.ask")
+def ask(question: str, language: str = "en", deadline: Optional[Deadline] = None):
     """
     Ask a question using RAG with OpenRouter across multiple data types.
     
     Args:
         question: The user's question
         language: Language code ("en" for English, "fr" for French)
+        deadline: Time budget and cancellation flag for the request (default: a fresh
+            CHAT_DEADLINE_SECONDS budget). With less than LLM_MIN_BUDGET_SECONDS left after
+            retrieval the entries are listed without calling the model; raises
+            RequestCancelled once the deadline is cancelled.
     """
+    deadline = deadline or Deadline()
+    started = time.perf_counter()
     if not OPENROUTER_API_KEY or OPENROUTER_API_KEY == "your_api_key_here":
         return "❌ Error: OPENROUTER_API_KEY is not set. Please configure it in your .env file or update router.py. Get your key from https://openrouter.ai/keys"
     
-    # Load all data
-    print("Loading data from all files...")
-    all_data = load_all_data()
+    # Parsed data and search indexes stay in memory between requests; take one snapshot
+    # and use it for the whole request
+    from dataset import get_dataset
+    snapshot = get_dataset()
+    all_data = snapshot.all_data
     
     if not any(all_data.values()):
-        print("❌ No data loaded from any file")
+        log.error("no data loaded from any file")
         return None
     
-    total_entries = sum(len(entries) for category in all_data.values() for entries in category.values())
-    print(f"✅ Total entries loaded: {total_entries}")
+    annotate(language=language, dataset_version=snapshot.version)
+    
+    # "Open now" / "open late tonight": only food and places open at that moment are candidates
+    opening = requested_opening_time(question)
+    
+    # Same question, same data and model: reuse the answer (not for time-dependent questions)
+    cache = get_cache()
+    cache_key = (language, " ".join(question.lower().split()))
+    cache_version = f"{snapshot.version}:{OPENROUTER_MODEL}"
+    if opening is None:
+        cached_answer = cache.get("chat", cache_key, cache_version)
+        annotate(cache_hit=cached_answer is not None)
+        if cached_answer is not None:
+            log.info("chat answered", extra={"answered_by": "cache", "language": language, "total_ms": _ms_since(started)})
+            return cached_answer
+    
+    # "Open now" / "open late tonight" and facet wording ("wheelchair accessible", "gold certified",
+    # "vegan") narrow the candidates to the matching entries via the bitmap indexes
+    from dataset import facet_masks, open_masks
+    wanted_facets = question_facets(question)
+    masks = intersect_masks(
+        open_masks(snapshot, opening[0]) if opening else None,
+        facet_masks(snapshot, wanted_facets) if wanted_facets else None,
+    )
     
-    # Find relevant context
-    context_dict = find_relevant_context(question, all_data)
-    print(f"✅ Found relevant context")
+    # Find relevant context: distance-ranked for "near <landmark/address>" questions, else by keywords
+    nearby = find_nearby_context(question, all_data, snapshot.indexes, snapshot.spatial, masks)
+    if masks is not None:
+        all_data, indexes = restrict_to_masks(all_data, snapshot.indexes, masks)
+        if log.isEnabledFor(logging.DEBUG):
+            narrowed = sum(len(entries) for file_type in masks for entries in all_data[file_type].values())
+            log.debug("candidates narrowed", extra={"entries": narrowed, "open_at": f"{opening[1]:%a %H:%M}" if opening else None, "facets": wanted_facets or None})
+    else:
+        indexes = snapshot.indexes
+    if nearby is not None:
+        context_dict, place, distances = nearby
+    else:
+        context_dict = find_relevant_context(question, all_data, indexes)
+        place, distances = None, None
+    retrieval_ms = _ms_since(started)
     
-    # Format context for prompt
-    combined_context = format_context_for_prompt(context_dict)
+    # Format context for prompt (URLs become [L<n>] references, expanded again in the answer)
+    links = LinkRefs()
+    combined_context = format_context_for_prompt(context_dict, language, snapshot.fragments, distances, place, links)
+    if combined_context != "No relevant data found.":
+        combined_context = _with_filter_notes(combined_context, language, opening, wanted_facets)
+    log.debug("context retrieved", extra={"near": place, "entries": _count_entries(context_dict), "retrieval_ms": retrieval_ms, "prompt_chars": len(combined_context)})
     
     # Check if we have any data in context
     has_context_data = any(
@@ -1101,155 +1622,67 @@ def ask(question: str, language: str = "en"):
                 return "I don't have any places data available at the moment. However, I can help you with restaurants, cafes, or events. Would you like to see those instead?"
         
         # Format fallback context
-        fallback_combined = format_context_for_prompt(fallback_context)
+        fallback_links = LinkRefs()
+        fallback_combined = format_context_for_prompt(fallback_context, language, snapshot.fragments, links=fallback_links)
+        if fallback_combined != "No relevant data found.":
+            fallback_combined = _with_filter_notes(fallback_combined, language, opening, wanted_facets)
         
         if fallback_combined and fallback_combined != "No relevant data found.":
             combined_context = fallback_combined
+            links = fallback_links
             context_dict = fallback_context  # Update context_dict for prompt
         elif total_places == 0 and total_food == 0 and total_events == 0:
             return "I couldn't find any relevant information in the database. Please try rephrasing your question."
         else:
             return "I found some information, but it might not match your exact query. Try asking more specifically, for example: 'show me places to visit', 'what restaurants are there?', or 'events in February'."
     
-    # Determine response language and create language-specific instructions
-    if language == "fr":
-        language_instruction = "\n\nCRITICAL LANGUAGE INSTRUCTION: You MUST respond entirely in French. All text, including section headers, labels, and descriptions, must be in French. Use French translations: 'Location' → 'Emplacement', 'Hours' → 'Heures', 'Find Location' → 'Trouver l'emplacement', 'About' → 'À propos', 'Fees' → 'Frais', 'Date' → 'Date', 'Venue' → 'Lieu', 'Notes' → 'Notes', 'Veg/Vegan' → 'Végétarien/Végan', 'Green Plate Certification' → 'Certification Green Plate'."
-        section_headers = "**CAFÉS**, **RESTAURANTS**, **BOULANGERIES**, **PUBS**, **MAGASINS**, **LIEUX**, **ÉVÉNEMENTS**"
-        example_format = """
-**CAFÉS**
-
-**Kingston Coffee House**
-• Emplacement: 1046 Princess St
-• Heures: Lun-Dim: 7h00 - 18h00
-• Notes: Un café local connu pour son atmosphère chaleureuse
-• Végétarien/Végan: Oui
-"""
-    else:
-        language_instruction = "\n\nCRITICAL LANGUAGE INSTRUCTION: You MUST respond entirely in English. All text, including section headers, labels, and descriptions, must be in English."
-        section_headers = "**CAFÉS**, **RESTAURANTS**, **BAKERIES**, **PUBS**, **SHOPS**, **PLACES**, **EVENTS**"
-        example_format = """
-**CAFÉS**
-
-**Kingston Coffee House**
-• Location: 1046 Princess St
-• Hours: Mon-Sun: 7:00am - 6:00pm
-• Notes: A local coffee shop known for its cozy atmosphere
-• Veg/Vegan: Yes
-"""
+    # Retrieval is done: stop if the client has gone, list the entries if the model cannot answer in time
+    deadline.check()
+    if deadline.remaining() < LLM_MIN_BUDGET_SECONDS:
+        log.warning("request budget low, answering without the model", extra={"remaining_s": round(deadline.remaining(), 1), "answered_by": "listing"})
+        annotate(answered_by="listing", reason="budget")
+        return listing_answer(context_dict, language, snapshot.fragments, distances, place)
     
-    # Create intelligent prompt
-    prompt = f"""You are a friendly, helpful city guide assistant for Kingston, Ontario. Your goal is to give the user the best possible answer using ONLY the data below.
-
-INTERPRETATION & INTENT:
-- Interpret the user's question by intent, not just exact words. If they ask for "thrif stores", "cheap clothes", "secondhand shops", or "places to buy used stuff", use the SHOPS data (thrift, consignment, vintage) and answer helpfully.
-- Ignore minor typos and misspellings (e.g. resturant, cafee, thrif, cloths). Assume they mean the closest sensible category (restaurant, cafe, thrift, clothes) and answer from the relevant data.
-- If the question could match several types (e.g. "stores" = shops or places), prefer the category that has matching data and give a clear, concrete answer. Do not say "I don't have information" if the data below clearly contains relevant entries—use them.
-- Be conversational and concise. Lead with the most relevant results; add a short friendly line if helpful (e.g. "Here are some thrift and consignment options in Kingston:").
-
-Available Data:
-{combined_context}
-
-User Question: {question}
-
-CRITICAL FORMATTING RULES - FOLLOW EXACTLY:
-
-1. Section Headers: Use {section_headers} as section headers (bold markdown)
-
-2. Item Format - Each business/place/event name should be a BOLD HEADER (not numbered):
-   
-   For Shops (stores, clothing, boutiques, etc.): When data includes "Category:" use section **SHOPS** and format as:
-   **Store Name**
-   • Location: [address]
-   • Find Location: [URL from data - ONLY if available]
-   • Hours: [hours]
-   • Notes: [description if available]
-   • Category: [e.g. WOMEN'S CLOTHING, FOOTWEAR]
-   • Local Sourcing: [if available]
-   
-   For Food Places:
-   **Business Name**
-   • Location: [address]
-   • Find Location: [URL from data - ONLY include if URL is available in the data]
-   • Hours: [hours]
-   • Notes: [description if available]
-   • Veg/Vegan: [options if applicable]
-   • Green Plate Certification: [Gold/Silver/Bronze - ONLY include if certification is available and not null]
-   
-   For Places:
-   **Place Name**
-   • Location: [address]
-   • Find Location: [URL from data - ONLY include if URL is available in the data]
-   • About: [description]
-   • Hours: [hours]
-   • Fees: [price]
-   • Accessibility: [Full Access / Partial Access / Limited / null - ONLY include if available in data]
-   • Washrooms: [Available / Partial Available / Not Available / null - ONLY include if available in data]
-   
-   For Events:
-   **Event Name**
-   • Date: [date or date range]
-   • Venue: [venue name]
-   • Location: [address]
-   • Find Location: [URL from data - ONLY include if URL is available in the data]
-
-3. DO NOT use numbered lists (no "1.", "2.", etc.)
-4. DO NOT use dashes (-) - ONLY use bullet points (•)
-5. Put exactly ONE blank line between each item
-6. Put exactly ONE blank line after section headers
-7. If information is missing, skip that line entirely (don't write "N/A", "TBD", or empty fields)
-
-8. For Places, include: **Place Name**, Location, "Find Location: [URL]" if URL is available, About, Hours, Fees, Accessibility (if available), Washrooms (if available)
-9. For Events, include: **Event Name**, Date (or Date Range), Venue, Location, and "Find Location: [URL]" if URL is available in the data
-10. For Food Places, include: **Business Name**, Location, "Find Location: [URL]" if URL is available, Hours, Notes, Veg/Vegan options, Green Plate Certification (Gold/Silver/Bronze) if available
-10a. For Shops (stores, clothing, boutiques), include: **Store Name**, Location, "Find Location: [URL]" if available, Hours, Notes, Category, Local Sourcing if available
-
-11. Order items logically (alphabetically or by relevance)
-
-11. SMART QUERY HANDLING:
-    - If user asks for "full list", "all events", "complete list", "everything" - show ALL matching items
-    - If user asks for events on a specific date (e.g., "events on feb 8") - show ALL events that fall on that date (including events that start before and end after that date)
-    - If user asks for events in a month (e.g., "events in february") - show ALL events in that month
-    - For vague queries without "full list" - show a sample (3-5 items) from each category
-    - Apply similar logic for food, shops, and places: "all restaurants" = full list, vague query = sample
-    - Match by meaning: "thrift"/"secondhand"/"consignment"/"vintage" → use SHOPS data; "cheap clothes" or "used clothing" → SHOPS. Always prefer giving a helpful answer from the data over saying you don't have information.
-
-EXAMPLE FORMAT:
-{example_format}
-
-CRITICAL: Follow this format exactly. No numbering, no extra blank lines, clean and consistent.
-
-Answer:"""
+    # Static instructions go in the cached system message; only the data and question vary
+    messages = build_messages(language, combined_context, question)
     
-    # Call OpenRouter API
-    print("Calling OpenRouter API...")
+    # Call OpenRouter API (streamed, over the pooled client: the answer is collected as it is
+    # generated, and a cancelled request stops the generation upstream)
+    upstream_started = time.perf_counter()
     try:
-        with httpx.Client() as client:
-            response = client.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json",
-                    "HTTP-Referer": "https://github.com/your-repo",
-                    "X-Title": "Kingston City Guide RAG System"
-                },
-                json={
-                    "model": "openai/gpt-4o-mini",
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "temperature": 0.7
-                },
-                timeout=60
-            )
+        with span("openrouter.chat_completion", "client", **{"gen_ai.request.model": OPENROUTER_MODEL, "prompt_chars": len(combined_context)}) as upstream, get_http_client().stream(
+            "POST",
+            OPENROUTER_URL,
+            headers={
+                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+                "Content-Type": "application/json",
+                "HTTP-Referer": "https://github.com/your-repo",
+                "X-Title": "Kingston City Guide RAG System",
+                # Correlates this upstream call with the API request's trace
+                "traceparent": upstream.traceparent(),
+            },
+            json={
+                "model": OPENROUTER_MODEL,
+                "messages": messages,
+                "temperature": 0.7,
+                "stream": True,
+                # Ask OpenRouter to report token usage, including cached prompt tokens
+                "usage": {"include": True},
+            },
+            timeout=deadline.remaining(),
+            # A disconnecting client shuts the connection down under the in-flight request
+            extensions={"trace": abort_on_cancel(deadline)},
+        ) as response:
+            abort_response_on_cancel(deadline, response)
             
-            print(f"Response status: {response.status_code}")
+            upstream.set("http.response.status_code", response.status_code)
+            upstream.set("openrouter.request_id", response.headers.get("x-request-id") or response.headers.get("x-generation-id"))
             
             if response.status_code != 200:
-                print(f"❌ Error: {response.status_code}")
-                print(f"Response: {response.text}")
+                upstream.fail(f"HTTP {response.status_code}")
+                response.read()
+                # Bounded excerpt of the upstream body, not the whole of it
+                log.warning("OpenRouter error response", extra={"status": response.status_code, "body": response.text[:500], "upstream_ms": _ms_since(upstream_started)})
                 
                 # Provide helpful error messages
                 try:
@@ -1267,33 +1700,59 @@ Answer:"""
                 else:
                     return f"❌ API Error ({response.status_code}): {error_msg}"
             
-            result = response.json()
-            print(f"✅ API Response received")
+            result = read_completion_stream(response, deadline)
+            record_prompt_usage(result.get("usage"))
+            usage = result.get("usage") or {}
+            upstream.set("gen_ai.response.id", result.get("id"))
+            upstream.set("gen_ai.usage.input_tokens", usage.get("prompt_tokens"))
+            upstream.set("gen_ai.usage.output_tokens", usage.get("completion_tokens"))
+            upstream.set("gen_ai.usage.cached_tokens", (usage.get("prompt_tokens_details") or {}).get("cached_tokens"))
             
             if "choices" not in result:
-                print(f"⚠️ Unexpected response structure:")
-                print(result)
+                log.warning("unexpected OpenRouter response", extra={"keys": sorted(result), "error": str(result.get("error"))[:500] if "error" in result else None})
                 return None
             
             answer = result.get("choices", [{}])[0].get("message", {}).get("content", "")
             
             if not answer:
-                print("⚠️ No content in response:")
-                print(result)
+                log.warning("OpenRouter response has no content", extra={"generation_id": result.get("id")})
             
             # Clean up the response formatting
-            answer = clean_response_formatting(answer)
+            answer = links.expand(clean_response_formatting(answer))
+            if answer and opening is None:
+                cache.set("chat", cache_key, answer, CHAT_CACHE_TTL, cache_version)
             
+            log.info("chat answered", extra={
+                "answered_by": "model",
+                "language": language,
+                "entries": _count_entries(context_dict),
+                "prompt_chars": len(combined_context),
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "generation_id": result.get("id"),
+                "retrieval_ms": retrieval_ms,
+                "upstream_ms": _ms_since(upstream_started),
+                "total_ms": _ms_since(started),
+            })
             return answer
             
     except Exception as e:
-        print(f"❌ Exception occurred: {e}")
-        import traceback
-        traceback.print_exc()
+        if deadline.cancelled:
+            log.info("client disconnected, OpenRouter request abandoned", extra={"upstream_ms": _ms_since(upstream_started)})
+            raise RequestCancelled() from e
+        if isinstance(e, (httpx.TimeoutException, TimeoutError)):
+            log.warning("OpenRouter did not answer within the request budget, listing the entries instead",
+                        extra={"answered_by": "listing", "upstream_ms": _ms_since(upstream_started)})
+            annotate(answered_by="listing", reason="upstream timeout")
+            return listing_answer(context_dict, language, snapshot.fragments, distances, place)
+        log.exception("chat failed")
         return None
 
 
 if __name__ == "__main__":
+    from logs import setup_logging
+    setup_logging()
     question = "i wanna visit some place nearby water famous in this city and want to eat some japanese food"
     print(f"\n🔍 Question: {question}")
     print("=" * 50)
@@ -0,0 +1,452 @@
+"""
+Flat, pointer-free binary image of the parsed dataset for multi-worker deployments.
+
+With `uvicorn --workers N` (or gunicorn) every worker would otherwise hold its own parsed
+copy of the Kingston corpus and its indexes. When SHARED_DATASET_PATH is set (ideally a
+file under /dev/shm), the first worker that needs the data builds this image and every
+worker maps it read-only with mmap, so the pages are shared through the page cache and
+another worker adds almost no RSS. Rebuilt images are written to a temp file and renamed
+over the old one; workers still mapping the old inode keep a valid view until they remap.
+
+Everything derived per file is in the image too - search texts and certification buckets,
+the rendered prompt fragments, projected locations, opening-hours breakpoints and masks, and
+facet bitmaps - and is read through views, so a worker's own memory does not grow with the
+corpus. Only the header, the per-type KD-trees over the locations (built by
+DatasetSnapshot.build) and the entry views a worker has touched are per process.
+
+Layout (little-endian; arrays are uint32 unless noted):
+    b"ANANGDS2" | uint32 header_len | header JSON | sections, 8-byte aligned
+The header records the data file signatures, the field-name table, the string table
+(offsets + UTF-8 blob) and, per data file, the sections holding its entries, their
+keyword-search texts, certification buckets, fragment string ids (one per entry and
+language), locations (float64 x, y; NaN when not geocoded), hours breakpoints and masks,
+and facet bitmaps (with their display labels). An entry is a run of (field_id, string_id)
+pairs, in the entry's original key order. A bitmask is stored as `width` little-endian
+bytes, width being the file's entry count rounded up to whole bytes.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from facets import FacetIndex
+from hours import HoursIndex
+from router import FRAGMENT_LANGUAGES, FileIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: shared images are a Linux/macOS deployment feature
+    fcntl = None
+
+MAGIC = b"ANANGDS2"
+_UINT32 = "I" if array("I").itemsize == 4 else "L"
+
+
+def _aligned(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class _ImageWriter:
+    def __init__(self):
+        self.strings: Dict[str, int] = {}
+        self.sections: List[bytes] = []
+        self.offset = 0  # relative to the start of the sections area
+
+    def string_id(self, value: str) -> int:
+        sid = self.strings.get(value)
+        if sid is None:
+            sid = len(self.strings)
+            self.strings[value] = sid
+        return sid
+
+    def add_section(self, data: bytes) -> List[int]:
+        """Append a section; returns [relative_offset, byte_length]."""
+        start = self.offset
+        self.sections.append(data)
+        padding = _aligned(len(data)) - len(data)
+        if padding:
+            self.sections.append(b"\0" * padding)
+        self.offset += len(data) + padding
+        return [start, len(data)]
+
+    def add_uint32(self, values) -> List[int]:
+        return self.add_section(array(_UINT32, values).tobytes())
+
+    def add_masks(self, masks, width: int) -> List[int]:
+        return self.add_section(b"".join(mask.to_bytes(width, "little") for mask in masks))
+
+
+def _mask_width(count: int) -> int:
+    return max(1, (count + 7) // 8)
+
+
+def write_image(path: Path, signatures: Dict, maps: Dict) -> None:
+    """
+    Serialize parsed entries and their per-file structures into an image file at `path`
+    (atomic rename). maps holds all_data and the dataset's DERIVED_MAPS, shaped like the
+    fields of a DatasetSnapshot.
+    """
+    writer = _ImageWriter()
+    fields: Dict[str, int] = {}
+    files = []
+    for file_type, by_stem in maps["all_data"].items():
+        for stem, entries in by_stem.items():
+            index = maps["indexes"][file_type][stem]
+            fragments = maps["fragments"][file_type][stem]
+            hours = maps["hours"][file_type][stem]
+            facets = maps["facets"][file_type][stem]
+            width = _mask_width(len(entries))
+            starts, pairs, fragment_ids, points = [0], [], [], array("d")
+            for entry, point in zip(entries, maps["locations"][file_type][stem]):
+                for key, value in entry.items():
+                    fid = fields.setdefault(key, len(fields))
+                    pairs.extend((fid, writer.string_id(str(value))))
+                starts.append(len(pairs) // 2)
+                fragment_ids.extend(writer.string_id(text) for text in fragments[id(entry)])
+                points.extend(point if point is not None else (math.nan, math.nan))
+            files.append({
+                "type": file_type,
+                "stem": stem,
+                "count": len(entries),
+                "width": width,
+                "starts": writer.add_uint32(starts),
+                "pairs": writer.add_uint32(pairs),
+                "texts": writer.add_uint32([writer.string_id(t) for t in index.texts]),
+                "cert": {str(p): writer.add_uint32(positions) for p, positions in index.cert_buckets.items()},
+                "fragments": writer.add_uint32(fragment_ids),
+                "locations": writer.add_section(points.tobytes()),
+                "hours": {
+                    "breakpoints": writer.add_uint32(hours.breakpoints),
+                    "masks": writer.add_masks(hours.masks, width),
+                    "known": writer.add_masks([hours.known], width),
+                },
+                "facets": {
+                    "named": writer.add_masks([facets.named], width),
+                    "bitmaps": {
+                        field: {value: writer.add_masks([mask], width) for value, mask in by_value.items()}
+                        for field, by_value in facets.bitmaps.items()
+                    },
+                    "labels": facets.labels,
+                },
+            })
+    blob_parts, offsets, pos = [], [0], 0
+    for value in writer.strings:  # dict order == string id order
+        encoded = value.encode("utf-8")
+        blob_parts.append(encoded)
+        pos += len(encoded)
+        offsets.append(pos)
+    string_offsets = writer.add_uint32(offsets)
+    string_blob = writer.add_section(b"".join(blob_parts))
+    header = json.dumps({
+        "signatures": [[t, name, mtime_ns, size] for (t, name), (mtime_ns, size) in sorted(signatures.items())],
+        "fields": sorted(fields, key=fields.get),
+        "string_offsets": string_offsets,
+        "string_blob": string_blob,
+        "files": files,
+    }).encode("utf-8")
+    preamble = MAGIC + struct.pack("<I", len(header)) + header
+    base = _aligned(len(preamble))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(preamble + b"\0" * (base - len(preamble)))
+        for section in writer.sections:
+            f.write(section)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class MappedEntry(Mapping):
+    """Read-only dict-like view of one entry; values are decoded from the image on access."""
+    __slots__ = ("_file", "_row")
+
+    def __init__(self, mapped_file: "MappedEntries", row: int):
+        self._file = mapped_file
+        self._row = row
+
+    def _pairs(self):
+        f = self._file
+        start, end = f.starts[self._row], f.starts[self._row + 1]
+        return f.pairs[start * 2:end * 2]
+
+    def __getitem__(self, key):
+        fid = self._file.image.field_ids.get(key)
+        if fid is not None:
+            pairs = self._pairs()
+            for i in range(0, len(pairs), 2):
+                if pairs[i] == fid:
+                    return self._file.image.string(pairs[i + 1])
+        raise KeyError(key)
+
+    def __iter__(self):
+        names = self._file.image.fields
+        pairs = self._pairs()
+        for i in range(0, len(pairs), 2):
+            yield names[pairs[i]]
+
+    def __len__(self):
+        f = self._file
+        return f.starts[self._row + 1] - f.starts[self._row]
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class MappedEntries(Sequence):
+    """List-like sequence of MappedEntry views for one data file. Views are created on first access."""
+
+    def __init__(self, image: "MappedDataset", meta: Dict):
+        self.image = image
+        self.count = meta["count"]
+        self.starts = image.uint32(meta["starts"])
+        self.pairs = image.uint32(meta["pairs"])
+        self._views: List[Optional[MappedEntry]] = [None] * self.count
+        # id(view) -> row, for the structures keyed by id(entry) (prompt fragments)
+        self.rows: Dict[int, int] = {}
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        view = self._views[i]
+        if view is None:
+            view = self._views[i] = MappedEntry(self, i)
+            self.rows[id(view)] = i
+        return view
+
+
+class _MappedTexts(Sequence):
+    def __init__(self, image: "MappedDataset", ids):
+        self.image = image
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        return self.image.string(self.ids[i])
+
+
+class MappedFragments(Mapping):
+    """render_fragments() result for one file (id(entry) -> one fragment per language), read from the image."""
+
+    def __init__(self, entries: MappedEntries, ids):
+        self.entries = entries
+        self.ids = ids
+
+    def __getitem__(self, key):
+        row = self.entries.rows.get(key)
+        if row is None:
+            raise KeyError(key)
+        languages = len(FRAGMENT_LANGUAGES)
+        return tuple(self.entries.image.string(sid) for sid in self.ids[row * languages:(row + 1) * languages])
+
+    def __iter__(self):
+        for i in range(len(self.entries)):
+            yield id(self.entries[i])
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class MappedLocations(Sequence):
+    """locate_entries() result for one file: a projected point per entry, or None."""
+
+    def __init__(self, coords):
+        self.coords = coords
+
+    def __len__(self):
+        return len(self.coords) // 2
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        x, y = self.coords[2 * i], self.coords[2 * i + 1]
+        return None if math.isnan(x) else (x, y)
+
+
+class _Masks(Sequence):
+    """Bitmasks stored back to back, `width` bytes each, decoded to ints on access."""
+
+    def __init__(self, data, width: int):
+        self.data = data
+        self.width = width
+
+    def __len__(self):
+        return len(self.data) // self.width
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return int.from_bytes(self.data[i * self.width:(i + 1) * self.width], "little")
+
+
+class _MaskMap(Mapping):
+    """value -> bitmask of one facet field, decoded on access."""
+
+    def __init__(self, image: "MappedDataset", sections: Dict[str, List[int]]):
+        self.image = image
+        self.sections = sections
+
+    def __getitem__(self, value):
+        return int.from_bytes(self.image.bytes(self.sections[value]), "little")
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def __len__(self):
+        return len(self.sections)
+
+
+class MappedHoursIndex(HoursIndex):
+    """HoursIndex over the image. The parsed intervals stay with the process that built it (intervals is None)."""
+
+    def __init__(self, image: "MappedDataset", meta: Dict):
+        self.intervals = None
+        self.breakpoints = image.uint32(meta["hours"]["breakpoints"])
+        self.masks = _Masks(image.bytes(meta["hours"]["masks"]), meta["width"])
+        self.known = int.from_bytes(image.bytes(meta["hours"]["known"]), "little")
+
+
+class MappedFacetIndex(FacetIndex):
+    """FacetIndex over the image; bitmaps decode on access, labels come from the header."""
+
+    def __init__(self, image: "MappedDataset", meta: Dict):
+        self.size = meta["count"]
+        self.named = int.from_bytes(image.bytes(meta["facets"]["named"]), "little")
+        self.bitmaps = {field: _MaskMap(image, sections) for field, sections in meta["facets"]["bitmaps"].items()}
+        self.labels = meta["facets"]["labels"]
+
+
+class MappedFileIndex:
+    """FileIndex interface (texts, cert_buckets, cert_order, sorted_by_certification, extended) over the image."""
+
+    def __init__(self, image: "MappedDataset", meta: Dict):
+        self.texts = _MappedTexts(image, image.uint32(meta["texts"]))
+        self.cert_buckets = {int(p): image.uint32(section) for p, section in meta["cert"].items()}
+
+    def cert_order(self) -> List[int]:
+        return [pos for priority in (3, 2, 1, 0) for pos in self.cert_buckets.get(priority, ())]
+
+    def sorted_by_certification(self, entries) -> List:
+        return [entries[i] for i in self.cert_order()]
+
+    def extended(self, *entries: Dict) -> FileIndex:
+        index = FileIndex([])
+        index.texts = list(self.texts)
+        index.cert_buckets = {p: list(self.cert_buckets.get(p, ())) for p in (3, 2, 1, 0)}
+        for entry in entries:
+            index.add(entry)
+        return index
+
+
+class MappedDataset:
+    """A read-only mapping of an image file, exposing all_data and the derived maps in the dataset's shapes."""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if bytes(self._view[:8]) != MAGIC:
+            raise ValueError(f"{path} is not a dataset image")
+        (header_len,) = struct.unpack("<I", self._view[8:12])
+        header = json.loads(bytes(self._view[12:12 + header_len]))
+        self._base = _aligned(12 + header_len)
+        self.path = path
+        self.signatures = {(t, name): (mtime_ns, size) for t, name, mtime_ns, size in header["signatures"]}
+        self.fields: List[str] = header["fields"]
+        self.field_ids = {name: i for i, name in enumerate(self.fields)}
+        self._string_offsets = self.uint32(header["string_offsets"])
+        start, length = header["string_blob"]
+        self._blob = self._view[self._base + start:self._base + start + length]
+        self.all_data: Dict[str, Dict[str, MappedEntries]] = {}
+        self.indexes: Dict[str, Dict[str, MappedFileIndex]] = {}
+        self.fragments: Dict[str, Dict[str, MappedFragments]] = {}
+        self.locations: Dict[str, Dict[str, MappedLocations]] = {}
+        self.hours: Dict[str, Dict[str, MappedHoursIndex]] = {}
+        self.facets: Dict[str, Dict[str, MappedFacetIndex]] = {}
+        for meta in header["files"]:
+            file_type, stem = meta["type"], meta["stem"]
+            entries = MappedEntries(self, meta)
+            self.all_data.setdefault(file_type, {})[stem] = entries
+            self.indexes.setdefault(file_type, {})[stem] = MappedFileIndex(self, meta)
+            self.fragments.setdefault(file_type, {})[stem] = MappedFragments(entries, self.uint32(meta["fragments"]))
+            self.locations.setdefault(file_type, {})[stem] = MappedLocations(self.bytes(meta["locations"]).cast("d"))
+            self.hours.setdefault(file_type, {})[stem] = MappedHoursIndex(self, meta)
+            self.facets.setdefault(file_type, {})[stem] = MappedFacetIndex(self, meta)
+
+    def bytes(self, section: List[int]):
+        start, length = section
+        return self._view[self._base + start:self._base + start + length]
+
+    def uint32(self, section: List[int]):
+        return self.bytes(section).cast(_UINT32)
+
+    def string(self, sid: int) -> str:
+        return str(self._blob[self._string_offsets[sid]:self._string_offsets[sid + 1]], "utf-8")
+
+
+def _try_open(path: Path) -> Optional[MappedDataset]:
+    try:
+        return MappedDataset(path)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _build_lock(path: Path):
+    """Cross-process lock so exactly one worker builds a given image."""
+    if fcntl is None:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def open_or_build(path: Path, signatures: Dict, build) -> Tuple[MappedDataset, bool]:
+    """
+    Map the image at `path` if it matches `signatures`; otherwise build it (once across all
+    workers) from build() -> maps (see write_image) and map the result.
+    Returns (image, built_by_this_process).
+    """
+    image = _try_open(path)
+    if image is not None and image.signatures == signatures:
+        return image, False
+    with _build_lock(path):
+        image = _try_open(path)
+        if image is not None and image.signatures == signatures:
+            return image, False
+        write_image(path, signatures, build())
+    return MappedDataset(path), True
+
+
+if __name__ == "__main__":
+    # python shared_dataset.py [image_path]  - build the image up front (e.g. before forking workers)
+    import dataset
+
+    target = Path(sys.argv[1]) if len(sys.argv) > 1 else dataset.SHARED_DATASET_PATH
+    if target is None:
+        sys.exit("usage: python shared_dataset.py <image_path>  (or set SHARED_DATASET_PATH)")
+    data_files = dataset.scan_data_files()
+    _, built = dataset.build_shared_image(target, data_files, dataset.file_signatures(data_files))
+    print(f"✅ Dataset image {'built' if built else 'already current'}: {target} ({target.stat().st_size} bytes)")
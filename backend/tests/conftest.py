@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The backend modules import each other as top-level modules (see api/main.py)
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
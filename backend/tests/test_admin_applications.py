@@ -0,0 +1,169 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import json_store
+from api import main
+from json_store import JsonStore
+
+ADMIN = {"Authorization": f"Bearer {main.ADMIN_TOKEN}"}
+
+
+@pytest.fixture
+def applications(tmp_path, monkeypatch):
+    monkeypatch.setattr(json_store, "STORE_FSYNC", False)
+    path = tmp_path / "applications.txt"
+    path.write_text(json.dumps({"applications": [
+        {"id": f"app{n}", "email": f"owner{n}@example.com", "status": "pending"} for n in range(5)
+    ]}))
+    store = JsonStore(path, "applications")
+    monkeypatch.setattr(main, "APPLICATIONS", store)
+    return store
+
+
+@pytest.fixture
+def appended(monkeypatch):
+    """Batches handed to the dataset by approvals."""
+    batches = []
+    monkeypatch.setattr(main, "append_food_entries", lambda blocks: batches.append(list(blocks)))
+    return batches
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def _list(client, **params):
+    response = client.get("/api/admin/applications", params=params, headers=ADMIN)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _bulk(client, ids, status):
+    response = client.post("/api/admin/applications/bulk", json={"ids": ids, "status": status}, headers=ADMIN)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _ids(payload):
+    return [a["id"] for a in payload["applications"]]
+
+
+def test_requires_admin(client, applications):
+    assert client.get("/api/admin/applications").status_code == 401
+    assert client.post("/api/admin/applications/bulk", json={"ids": [], "status": "approved"}).status_code == 401
+
+
+def test_full_listing(client, applications):
+    payload = _list(client)
+    assert _ids(payload) == [f"app{n}" for n in range(5)]
+    assert payload["version"] == 0 and payload["total"] == 5 and payload["next_cursor"] is None
+    assert "removed" not in payload
+    assert all("version" not in a for a in payload["applications"])
+
+
+def test_pages_keep_the_first_pages_version(client, applications):
+    first = _list(client, limit=2)
+    assert _ids(first) == ["app0", "app1"] and first["total"] == 5
+    _bulk(client, ["app4"], "rejected")
+    second = _list(client, limit=2, cursor=first["next_cursor"])
+    third = _list(client, limit=2, cursor=second["next_cursor"])
+    assert _ids(second) == ["app2", "app3"] and _ids(third) == ["app4"]
+    assert first["version"] == second["version"] == third["version"] == 0
+    assert third["next_cursor"] is None
+    # Polling with the listing's version picks up the write made while paging
+    assert _ids(_list(client, since=first["version"])) == ["app4"]
+
+
+def test_since_returns_changes_and_removed_ids_for_a_status_filter(client, applications, appended):
+    before = _list(client, status="pending")["version"]
+    result = _bulk(client, ["app1", "app3"], "approved")
+    assert result["version"] == before + 1
+
+    changed = _list(client, since=before)
+    assert _ids(changed) == ["app1", "app3"] and changed["version"] == before + 1
+    assert "removed" not in changed
+
+    pending = _list(client, since=before, status="pending")
+    assert pending["applications"] == [] and pending["removed"] == ["app1", "app3"]
+    approved = _list(client, since=before, status="approved")
+    assert _ids(approved) == ["app1", "app3"] and approved["removed"] == []
+
+    assert _list(client, since=result["version"])["applications"] == []
+
+
+def test_unchanged_listing_answers_304(client, applications):
+    response = client.get("/api/admin/applications", params={"status": "pending"}, headers=ADMIN)
+    etag = response.headers["ETag"]
+    again = client.get("/api/admin/applications", params={"status": "pending"}, headers={**ADMIN, "If-None-Match": etag})
+    assert again.status_code == 304
+
+    _bulk(client, ["app0"], "rejected")
+    after = client.get("/api/admin/applications", params={"status": "pending"}, headers={**ADMIN, "If-None-Match": etag})
+    assert after.status_code == 200 and after.headers["ETag"] != etag
+    assert "app0" not in _ids(after.json())
+
+
+@pytest.mark.parametrize("params", [{"status": "archived"}, {"cursor": "not-a-cursor"}, {"limit": 0}])
+def test_invalid_parameters_are_rejected(client, applications, params):
+    response = client.get("/api/admin/applications", params=params, headers=ADMIN)
+    assert response.status_code in (400, 422)
+
+
+def test_bulk_reports_each_id_and_approves_in_one_batch(client, applications, appended):
+    _bulk(client, ["app2"], "approved")
+    result = _bulk(client, ["app0", "app2", "app4", "missing"], "approved")
+    assert result["updated"] == ["app0", "app4"]
+    assert result["unchanged"] == ["app2"]
+    assert result["not_found"] == ["missing"]
+    assert result["version"] == applications.version == 2
+    assert len(appended) == 2
+    statuses = {a["id"]: a["status"] for a in applications.records()}
+    assert statuses == {"app0": "approved", "app1": "pending", "app2": "approved", "app3": "pending", "app4": "approved"}
+
+
+def test_bulk_without_changes_keeps_the_version(client, applications, appended):
+    _bulk(client, ["app1"], "rejected")
+    result = _bulk(client, ["app1", "nope"], "rejected")
+    assert result["updated"] == [] and result["unchanged"] == ["app1"] and result["version"] == 1
+    assert applications.version == 1
+
+
+def test_bulk_rejects_bad_status_and_too_many_ids(client, applications):
+    assert client.post("/api/admin/applications/bulk", json={"ids": ["app0"], "status": "pending"}, headers=ADMIN).status_code == 400
+    ids = [f"id{n}" for n in range(main.ADMIN_BULK_MAX_IDS + 1)]
+    assert client.post("/api/admin/applications/bulk", json={"ids": ids, "status": "approved"}, headers=ADMIN).status_code == 400
+
+
+def test_status_change_between_pages_skips_nothing(client, applications, appended):
+    first = _list(client, status="pending", limit=2)
+    assert _ids(first) == ["app0", "app1"]
+    _bulk(client, ["app0"], "approved")
+    second = _list(client, status="pending", limit=2, cursor=first["next_cursor"])
+    third = _list(client, status="pending", limit=2, cursor=second["next_cursor"])
+    assert _ids(second) == ["app2", "app3"] and _ids(third) == ["app4"]
+    assert third["next_cursor"] is None
+    # The poll after the listing reports the approval that happened while paging
+    poll = _list(client, status="pending", since=first["version"])
+    assert poll["removed"] == ["app0"]
+
+
+def test_failed_food_file_update_is_logged_and_reported(client, applications, monkeypatch, caplog):
+    def fail(blocks):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(main, "append_food_entries", fail)
+    result = _bulk(client, ["app0", "app1"], "approved")
+    assert result["indexed"] is False and result["updated"] == ["app0", "app1"]
+    response = client.post("/api/admin/applications/approve", json={"id": "app2"}, headers=ADMIN)
+    assert response.json() == {"id": "app2", "status": "approved", "indexed": False}
+    assert [r.getMessage() for r in caplog.records if r.levelname == "ERROR"] == ["featured entries not appended"] * 2
+    assert [a["status"] for a in applications.records()][:3] == ["approved"] * 3
+
+
+def test_successful_approval_reports_indexed(client, applications, appended):
+    response = client.post("/api/admin/applications/approve", json={"id": "app0"}, headers=ADMIN)
+    assert response.json()["indexed"] is True
+    assert _bulk(client, ["app1"], "rejected")["indexed"] is True
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import cache
+from cache import MemoryBackend, SQLiteBackend, TieredCache
+
+
+class FlakyBackend:
+    name = "flaky"
+
+    def __init__(self):
+        self.calls = 0
+        self.broken = True
+        self.items = {}
+
+    def _call(self):
+        self.calls += 1
+        if self.broken:
+            raise ConnectionError("down")
+
+    def get(self, key):
+        self._call()
+        return self.items.get(key)
+
+    def set(self, key, value, expires_at):
+        self._call()
+        self.items[key] = (expires_at, value)
+
+    def delete(self, key):
+        self._call()
+        self.items.pop(key, None)
+
+    def usage(self):
+        return {}
+
+
+def test_failed_tier_is_skipped_until_backoff_ends(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_TIER_BACKOFF", 60)
+    flaky = FlakyBackend()
+    tiers = TieredCache([MemoryBackend(), flaky])
+
+    assert tiers.get("chat", "q") is None
+    assert flaky.calls == 1
+    for i in range(10):
+        tiers.set("chat", f"q{i}", {"answer": i})
+        assert tiers.get("chat", f"other{i}") is None
+    assert flaky.calls == 1
+    assert tiers.usage()["tiers"]["flaky"]["skipped_for"] > 0
+
+    flaky.broken = False
+    clock = time.time() + 61
+    monkeypatch.setattr(cache.time, "time", lambda: clock)
+    tiers.set("chat", "q", {"answer": 1})
+    assert flaky.calls == 2
+    assert "skipped_for" not in tiers.usage()["tiers"]["flaky"]
+    tiers.backends[0].delete(tiers._key("chat", "q"))
+    assert tiers.get("chat", "q") == {"answer": 1}
+
+
+def _summed(disk):
+    return disk._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+
+def test_disk_total_tracks_upserts_deletes_and_expiry(tmp_path):
+    disk = SQLiteBackend(tmp_path / "cache.sqlite3", max_bytes=10_000)
+    later = time.time() + 60
+    disk.set("a", b"x" * 100, later)
+    disk.set("b", b"x" * 50, later)
+    disk.set("a", b"x" * 30, later)
+    assert disk.usage()["bytes"] == _summed(disk) == 80
+    disk.delete("b")
+    assert disk.usage()["bytes"] == 30
+    disk.set("old", b"x" * 70, time.time() - 1)
+    disk.set("c", b"x" * 5, later)
+    assert disk.usage()["bytes"] == _summed(disk) == 35
+
+    # A second connection (another worker) sees the same total
+    other = SQLiteBackend(tmp_path / "cache.sqlite3", max_bytes=10_000)
+    assert other.usage()["bytes"] == 35
+
+
+def test_disk_hits_are_written_in_batches_and_count_for_eviction(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DISK_TOUCH_BATCH", 3)
+    monkeypatch.setattr(cache, "CACHE_DISK_TOUCH_SECONDS", 3600)
+    disk = SQLiteBackend(tmp_path / "cache.sqlite3", max_bytes=1000)
+    later = time.time() + 60
+    for key in ("a", "b", "c"):
+        disk.set(key, b"x" * 300, later)
+
+    def used_at(key):
+        return disk._db.execute("SELECT used_at FROM cache WHERE key = ?", (key,)).fetchone()[0]
+
+    before = used_at("a")
+    disk.get("a")
+    disk.get("a")
+    assert used_at("a") == before
+    assert set(disk._touched) == {"a"}
+
+    # The queued hit on "a" is written before eviction picks the least recently used
+    disk.set("d", b"x" * 300, later)
+    keys = {row[0] for row in disk._db.execute("SELECT key FROM cache")}
+    assert "a" in keys and "d" in keys and "b" not in keys
+    assert not disk._touched
+
+
+def test_counters_add_up_under_concurrent_lookups():
+    tiers = TieredCache([MemoryBackend()])
+    tiers.set("chat", "hit", {"answer": 1})
+
+    def lookups():
+        for i in range(500):
+            tiers.get("chat", "hit")
+            tiers.get("chat", f"miss{i}")
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    usage = tiers.usage()
+    assert usage["hits"] == usage["tiers"]["memory"]["hits"] == 4000
+    assert usage["misses"] == 4000
+    assert usage["namespaces"]["chat"] == {"hits": 4000, "misses": 4000, "hit_ratio": 0.5}
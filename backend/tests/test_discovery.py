@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import http_cache
+from api import main
+from cache import MemoryBackend, TieredCache
+from dataset import filter_entries, filter_mask
+from facets import FacetIndex
+
+
+@pytest.fixture
+def client(monkeypatch):
+    cache = TieredCache([MemoryBackend()])
+    monkeypatch.setattr(http_cache, "get_cache", lambda: cache)
+    return TestClient(main.app)
+
+
+def test_date_filters_are_rejected_for_undated_categories(client):
+    response = client.get("/api/discovery/data", params={"category_id": "restaurants", "date_from": "2026-02-01"})
+    assert response.status_code == 400
+
+
+def test_date_filters_narrow_events(client):
+    everything = client.get("/api/discovery/data", params={"category_id": "dataevent"}).json()
+    narrowed = client.get("/api/discovery/data", params={"category_id": "dataevent", "date_from": "2026-02-10", "date_to": "2026-02-12"}).json()
+    assert 0 < narrowed["total"] < everything["total"]
+    assert narrowed["total"] == len(narrowed["entries"])
+
+
+def test_facet_counts_cover_the_date_filtered_entries():
+    entries = [
+        {"name": "Early", "certification": "Gold", "start_date": "February 1, 2026", "end_date": "February 2, 2026"},
+        {"name": "Late", "certification": "Gold", "start_date": "March 1, 2026"},
+        {"name": "Later", "certification": "Silver", "start_date": "March 5, 2026"},
+    ]
+    index = FacetIndex(entries)
+    start = datetime(2026, 2, 20)
+    mask = filter_mask(entries, {}, start, None, index)
+    assert [e["name"] for e in filter_entries(entries, {}, start, None, index)] == ["Late", "Later"]
+    assert index.counts(mask)["certification"] == {"Gold": 1, "Silver": 1}
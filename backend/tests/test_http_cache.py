@@ -0,0 +1,39 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import http_cache
+from cache import MemoryBackend, TieredCache
+
+PAYLOAD = {"entries": [{"name": f"Place {n}", "info": "x" * 40} for n in range(100)]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    cache = TieredCache([MemoryBackend()])
+    monkeypatch.setattr(http_cache, "get_cache", lambda: cache)
+    app = FastAPI()
+
+    @app.get("/data")
+    def data(request: Request):
+        return http_cache.cached_json_response(request, http_cache.make_etag("data", 1), lambda: PAYLOAD)
+
+    return TestClient(app)
+
+
+def test_every_encoding_gets_the_same_weak_etag(client):
+    plain = client.get("/data", headers={"Accept-Encoding": "identity"})
+    gzipped = client.get("/data", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["Content-Encoding"] == "gzip" and "Content-Encoding" not in plain.headers
+    assert plain.json() == gzipped.json() == PAYLOAD
+    assert plain.headers["ETag"] == gzipped.headers["ETag"]
+    assert plain.headers["ETag"].startswith('W/"')
+
+
+@pytest.mark.parametrize("encoding", ["identity", "gzip"])
+def test_either_form_of_the_tag_revalidates(client, encoding):
+    etag = client.get("/data").headers["ETag"]
+    for candidate in (etag, etag.removeprefix("W/")):
+        response = client.get("/data", headers={"If-None-Match": candidate, "Accept-Encoding": encoding})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
@@ -0,0 +1,179 @@
+import json
+import multiprocessing
+import os
+from pathlib import Path
+
+import pytest
+
+import json_store
+from json_store import JsonStore
+
+
+@pytest.fixture(autouse=True)
+def no_fsync(monkeypatch):
+    monkeypatch.setattr(json_store, "STORE_FSYNC", False)
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "items.txt"
+    path.write_text(json.dumps({"items": [{"n": 0}]}))
+    return path
+
+
+def _append(store: JsonStore, **record) -> None:
+    with store.transaction() as tx:
+        tx.append(record)
+
+
+def test_changes_are_journaled_and_replayed_by_a_new_instance(path):
+    store = JsonStore(path, "items")
+    _append(store, n=1)
+    with store.transaction() as tx:
+        i, _ = tx.find(lambda r: r["n"] == 0)
+        tx.update(i, status="approved")
+    assert json.loads(path.read_text()) == {"items": [{"n": 0}]}
+    assert len(store.journal_path.read_bytes().splitlines()) == 2
+
+    version, records, versions = JsonStore(path, "items").view()
+    assert version == store.version == 2
+    assert records == [{"n": 0, "status": "approved"}, {"n": 1}]
+    assert versions == [2, 1]
+
+
+def test_instances_sharing_a_file_see_each_others_writes(path):
+    a, b = JsonStore(path, "items"), JsonStore(path, "items")
+    assert len(b.records()) == 1
+    _append(a, n=1)
+    assert [r["n"] for r in b.records()] == [0, 1]
+    _append(b, n=2)
+    with a.transaction() as tx:
+        assert tx.version == 3
+        tx.update(2, seen=True)
+    assert b.records()[2] == {"n": 2, "seen": True}
+    assert b.view()[2] == [0, 1, 3]
+
+
+def test_a_raising_transaction_leaves_no_trace(path):
+    store = JsonStore(path, "items")
+    before = store.records()
+    with pytest.raises(RuntimeError):
+        with store.transaction() as tx:
+            tx.append({"n": 1})
+            tx.update(0, status="approved")
+            raise RuntimeError("abort")
+    assert store.records() == [{"n": 0}]
+    assert store.version == 0
+    assert not store.journal_path.exists() or store.journal_path.read_bytes() == b""
+    assert before == [{"n": 0}]
+
+
+def test_readers_never_see_uncommitted_changes(path):
+    store = JsonStore(path, "items")
+    before = store.records()
+    with store.transaction() as tx:
+        tx.append({"n": 1})
+        tx.update(0, status="approved")
+        assert store.records() == [{"n": 0}]
+    assert before == [{"n": 0}]
+    assert [r.get("status") for r in store.records()] == ["approved", None]
+
+
+def test_torn_last_line_is_ignored_then_repaired(path):
+    store = JsonStore(path, "items")
+    _append(store, n=1)
+    with open(store.journal_path, "ab") as f:
+        f.write(b'{"op": "append", "i": 2, "v": 2, "rec')
+
+    reader = JsonStore(path, "items")
+    assert [r["n"] for r in reader.records()] == [0, 1]
+    _append(reader, n=2)
+    lines = reader.journal_path.read_bytes().splitlines()
+    assert len(lines) == 2 and all(json.loads(line) for line in lines)
+    assert [r["n"] for r in JsonStore(path, "items").records()] == [0, 1, 2]
+
+
+def test_compaction_folds_the_journal_into_the_file(path):
+    store = JsonStore(path, "items")
+    for n in range(1, 4):
+        _append(store, n=n)
+    assert store.compact()
+    assert store.journal_path.read_bytes() == b""
+    data = json.loads(path.read_text())
+    assert data["version"] == 3 and data["versions"] == [0, 1, 2, 3]
+    assert data["items"] == [{"n": 0}, {"n": 1}, {"n": 2}, {"n": 3}]
+    assert not store.compact()
+    _append(store, n=4)
+    assert [r["n"] for r in JsonStore(path, "items").records()] == [0, 1, 2, 3, 4]
+
+
+def test_reader_between_the_compaction_renames_does_not_read_into_the_new_journal(path, monkeypatch):
+    writer, reader = JsonStore(path, "items"), JsonStore(path, "items")
+    for n in range(1, 4):
+        _append(writer, n=n)
+    real_replace = os.replace
+
+    def replace(src, dst):
+        real_replace(src, dst)
+        if Path(dst) == path:
+            # The new file is in place but the old journal is still there
+            assert len(reader.records()) == 4
+
+    monkeypatch.setattr(json_store.os, "replace", replace)
+    writer.compact()
+    monkeypatch.setattr(json_store.os, "replace", real_replace)
+    for n in range(4, 10):
+        _append(writer, n=n, note="long enough to pass the old journal's length")
+    assert [r["n"] for r in reader.records()] == list(range(10))
+
+
+def test_journal_left_behind_by_an_interrupted_compaction_is_not_replayed(path):
+    store = JsonStore(path, "items")
+    with store.transaction() as tx:
+        tx.update(0, status="pending")
+    with store.transaction() as tx:
+        tx.update(0, status="review")
+    stale = store.journal_path.read_bytes()
+    store.compact()
+    with store.transaction() as tx:
+        tx.update(0, status="approved")
+    store.compact()
+    # As if the file rename of the last compaction had landed but not the journal's
+    store.journal_path.write_bytes(stale)
+
+    reader = JsonStore(path, "items")
+    assert reader.records()[0]["status"] == "approved"
+    _append(reader, n=1)
+    assert reader.version == 4
+    assert JsonStore(path, "items").records()[0]["status"] == "approved"
+
+
+def _append_many(path: Path, worker: int, count: int) -> None:
+    store = JsonStore(path, "items")
+    for k in range(count):
+        _append(store, n=1000 * (worker + 1) + k)
+        if k == count // 2:
+            store.compact()
+
+
+@pytest.mark.skipif(json_store.fcntl is None, reason="cross-process locking needs fcntl")
+def test_concurrent_workers_keep_every_change(path):
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_append_many, args=(path, w, 25)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(30)
+        assert p.exitcode == 0
+    version, records, versions = JsonStore(path, "items").view()
+    assert version == 100
+    assert sorted(versions[1:]) == list(range(1, 101))
+    assert len({r["n"] for r in records}) == 101
+
+
+def test_versions_stored_in_records_by_earlier_releases_move_out_of_them(path):
+    path.write_text(json.dumps({"items": [{"n": 0, "version": 2}, {"n": 1, "version": 1}], "version": 2}))
+    store = JsonStore(path, "items")
+    with open(store.journal_path, "ab") as f:
+        f.write(b'{"op":"set","i":1,"v":3,"fields":{"seen":true,"version":3}}\n')
+    assert store.view() == (3, [{"n": 0}, {"n": 1, "seen": True}], [2, 3])
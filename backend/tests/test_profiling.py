@@ -0,0 +1,32 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from api import main
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+ADMIN = {"Authorization": f"Bearer {main.ADMIN_TOKEN}"}
+
+
+def test_admin_request_with_x_profile_1_is_profiled(client):
+    response = client.get("/", headers={"X-Profile": "1", **ADMIN})
+    assert response.status_code == 200
+    assert main.profiler.get_request_profile(response.headers["X-Profile-Id"]) is not None
+
+
+@pytest.mark.parametrize("value", ["0", "false", "yes", ""])
+def test_other_x_profile_values_are_ignored(client, value):
+    response = client.get("/", headers={"X-Profile": value, **ADMIN})
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Bearer wrong"}])
+def test_non_admin_asking_for_a_profile_gets_the_normal_response(client, headers):
+    response = client.get("/", headers={"X-Profile": "1", **headers})
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
@@ -0,0 +1,88 @@
+import shutil
+
+import pytest
+
+import dataset
+from hours import WEEK_MINUTES
+from router import render_fragments
+
+pytestmark = pytest.mark.skipif(__import__("shared_dataset").fcntl is None, reason="shared images need fcntl")
+
+
+@pytest.fixture
+def data_dirs(tmp_path, monkeypatch):
+    """A copy of the data folders, so appends do not touch the repository's files."""
+    dirs = {}
+    for file_type, directory in dataset.DATA_DIRS.items():
+        dirs[file_type] = tmp_path / directory.name
+        shutil.copytree(directory, dirs[file_type])
+    monkeypatch.setattr(dataset, "DATA_DIRS", dirs)
+    monkeypatch.setattr(dataset, "_current", dataset.EMPTY_SNAPSHOT)
+    monkeypatch.setattr(dataset, "_watched", False)
+    return dirs
+
+
+def _load(monkeypatch, image_path):
+    monkeypatch.setattr(dataset, "SHARED_DATASET_PATH", image_path)
+    monkeypatch.setattr(dataset, "_current", dataset.EMPTY_SNAPSHOT)
+    return dataset.get_dataset()
+
+
+def _assert_same(local, shared):
+    assert local.version == shared.version
+    for file_type in dataset.DATA_TYPES:
+        assert local.all_data[file_type].keys() == shared.all_data[file_type].keys()
+        for stem, entries in local.all_data[file_type].items():
+            mapped = shared.all_data[file_type][stem]
+            assert [dict(e) for e in mapped] == [dict(e) for e in entries]
+            assert list(shared.locations[file_type][stem]) == list(local.locations[file_type][stem])
+            local_fragments = local.fragments[file_type][stem]
+            shared_fragments = shared.fragments[file_type][stem]
+            assert [shared_fragments[id(e)] for e in mapped] == [local_fragments[id(e)] for e in entries]
+            local_facets, shared_facets = local.facets[file_type][stem], shared.facets[file_type][stem]
+            assert shared_facets.counts() == local_facets.counts()
+            assert shared_facets.named == local_facets.named
+            for field, by_value in local_facets.bitmaps.items():
+                assert dict(shared_facets.bitmaps[field]) == dict(by_value)
+            local_hours, shared_hours = local.hours[file_type][stem], shared.hours[file_type][stem]
+            assert shared_hours.known == local_hours.known
+            for minute in range(0, WEEK_MINUTES, 15):
+                assert shared_hours.open_at(minute) == local_hours.open_at(minute)
+
+
+def test_image_serves_the_same_derived_structures(data_dirs, monkeypatch, tmp_path):
+    local = _load(monkeypatch, None)
+    shared = _load(monkeypatch, tmp_path / "dataset.img")
+    _assert_same(local, shared)
+    facets = {"certification": ["gold", "silver"]}
+    assert dataset.facet_masks(shared, facets) == dataset.facet_masks(local, facets)
+    assert dataset.open_masks(shared, 5 * 1440 + 20 * 60) == dataset.open_masks(local, 5 * 1440 + 20 * 60)
+
+
+def test_batch_append_matches_a_full_reparse(data_dirs, monkeypatch, tmp_path):
+    shops = data_dirs["food"] / "shops.txt"
+    bakeries = data_dirs["food"] / "bakeries.txt"
+    blocks = [
+        (shops, "\nStore Name: Test Shop One\nLocation: 100 Princess St\nHours of Operation: Mon-Fri: 9am-5pm\nInfo: Books\nCategory: Books\n---"),
+        (bakeries, "\nBusiness Name: Test Bakery\nLocation: 200 King St E\nHours: Daily: 7am-3pm\nLocal Sourcing: Yes\nVeg/Vegan Options: Yes\nGreen Plate Certification: Gold\nNotes: Bread"),
+        (shops, "\nStore Name: Test Shop Two\nLocation: 10 Brock St\nHours of Operation: Sat-Sun: 10am-4pm\nInfo: Toys\nCategory: Toys\n---"),
+    ]
+    for image_path in (None, tmp_path / "dataset.img"):
+        before = _load(monkeypatch, image_path)
+        dataset.append_food_entries(blocks)
+        appended = dataset._current
+        assert appended.version != before.version
+        reparsed = _load(monkeypatch, image_path)
+        _assert_same(reparsed, appended)
+        names = [e.get("name") for e in appended.all_data["food"]["shops"]]
+        assert names[-2:] == ["Test Shop One", "Test Shop Two"]
+        # Undo the appends for the second round
+        shutil.copy(dataset.FOOD_DIR / "shops.txt", shops)
+        shutil.copy(dataset.FOOD_DIR / "bakeries.txt", bakeries)
+
+
+def test_fragments_render_like_the_entries(data_dirs, monkeypatch, tmp_path):
+    shared = _load(monkeypatch, tmp_path / "dataset.img")
+    entries = shared.all_data["food"]["restaurants"]
+    rendered = render_fragments("food", [dict(e) for e in entries])
+    assert [shared.fragments["food"]["restaurants"][id(e)] for e in entries] == list(rendered.values())
@@ -0,0 +1,19 @@
+import threading
+
+from api import main
+
+
+def test_startup_runs_once_per_process(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "_started", False)
+    monkeypatch.setattr(main, "start_watcher", lambda: calls.append("watcher"))
+    monkeypatch.setattr(main, "warm_up_core", lambda: calls.append("core"))
+    monkeypatch.setattr(main, "start_background_warm_up", lambda: calls.append("background"))
+
+    threads = [threading.Thread(target=main.start_once) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    main.start_once()
+    assert calls == ["watcher", "core", "background"]
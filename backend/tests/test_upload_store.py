@@ -0,0 +1,95 @@
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+
+import pytest
+from starlette.datastructures import UploadFile
+
+import upload_store
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_store, "UPLOADS_DIR", tmp_path)
+    monkeypatch.setattr(upload_store, "BLOBS_DIR", tmp_path / "blobs")
+    monkeypatch.setattr(upload_store, "INDEX_PATH", tmp_path / "index.json")
+    monkeypatch.setattr(upload_store, "INDEX_LOCK_PATH", tmp_path / "index.lock")
+    monkeypatch.setattr(upload_store, "_index_cache", {"file_id": None, "index": {}, "read_ns": 0})
+    return tmp_path
+
+
+def _store(data: bytes, prefix: str) -> str:
+    upload = UploadFile(io.BytesIO(data), filename="doc.pdf")
+    return asyncio.run(upload_store.store_upload(upload, lambda digest: f"{prefix}_{digest[:12]}.pdf"))
+
+
+def test_same_bytes_are_stored_once(uploads):
+    first = _store(b"%PDF same", "a")
+    second = _store(b"%PDF same", "b")
+    path_a, digest_a = upload_store.resolve_upload(first)
+    path_b, digest_b = upload_store.resolve_upload(second)
+    assert first != second
+    assert path_a == path_b and digest_a == digest_b
+    assert len(list((uploads / "blobs").rglob("*"))) == 2  # one shard dir, one blob
+
+
+def test_oversized_upload_is_refused_and_cleaned_up(uploads):
+    with pytest.raises(Exception) as raised:
+        asyncio.run(upload_store.store_upload(UploadFile(io.BytesIO(b"x" * 100), filename="big.pdf"), lambda d: "big.pdf", max_bytes=10))
+    assert getattr(raised.value, "status_code", None) == 413
+    assert not list(uploads.glob(".incoming_*")) and not list(uploads.glob("*.part"))
+
+
+def _commit_many(worker: int, count: int) -> None:
+    for k in range(count):
+        _store(f"worker {worker} doc {k}".encode(), f"w{worker}_{k}")
+
+
+@pytest.mark.skipif(upload_store.fcntl is None, reason="cross-process locking needs fcntl")
+def test_concurrent_workers_keep_every_name(uploads):
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_commit_many, args=(w, 25)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(30)
+        assert p.exitcode == 0
+    index = json.loads((uploads / "index.json").read_text())
+    assert len(index) == 100
+    assert not list(uploads.glob("index.json.*.tmp"))
+
+
+def test_write_by_another_worker_is_seen_despite_identical_stat(uploads):
+    name = _store(b"%PDF first", "first")
+    index_path = uploads / "index.json"
+    st = index_path.stat()
+    # Another worker rewrote the index in place with the same size and mtime
+    index = json.loads(index_path.read_text())
+    other = name.replace("first", "other")
+    index[other] = index.pop(name)
+    index_path.write_text(json.dumps(index))
+    os.utime(index_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert index_path.stat().st_size == st.st_size
+    assert upload_store.resolve_upload(other) is not None
+
+
+def test_unknown_names_do_not_reread_a_settled_index(uploads, monkeypatch):
+    name = _store(b"%PDF settled", "settled")
+    legacy = uploads / "legacy.pdf"
+    legacy.write_bytes(b"%PDF legacy")
+    reads = []
+    real_load = json.load
+    monkeypatch.setattr(upload_store.json, "load", lambda f: reads.append(1) or real_load(f))
+
+    # Just written: a miss may be another worker's write hidden behind an identical stat
+    assert upload_store.resolve_upload("random_1.pdf") is None
+    assert len(reads) == 1
+
+    monkeypatch.setattr(upload_store, "INDEX_MTIME_SLACK_NS", 0)
+    for k in range(50):
+        assert upload_store.resolve_upload(f"random_{k}.pdf") is None
+    assert upload_store.resolve_upload("legacy.pdf") == (legacy, None)
+    assert upload_store.resolve_upload(name)[1] is not None
+    assert len(reads) == 1
@@ -0,0 +1,328 @@
+"""
+Request tracing: OpenTelemetry-style spans from the API middleware down to the OpenRouter call.
+
+Every request gets a trace id: taken from an incoming W3C `traceparent` header, else new.
+It is returned in the X-Trace-Id and `traceresponse` headers and forwarded to OpenRouter in
+`traceparent`, so a slow /api/chat response can be matched to its upstream request and to
+the retrieval work done for it. Spans (name, parent, start/end, attributes, status) are
+opened with `with span(...)` or the @traced decorator; the current span lives in a
+contextvar, so spans opened in the threadpool nest under the request that started them.
+
+Spans are exported when TRACE_JSONL_PATH (one span per line, for jq / pandas) and/or
+TRACE_OTLP_ENDPOINT (OTLP/HTTP JSON, e.g. http://localhost:4318/v1/traces for a local
+collector) is set; otherwise only the ids are kept. Sampling is decided per trace at its
+root: TRACE_SAMPLE_RATE of the traces are kept (an incoming traceparent's sampled flag wins),
+and with TRACE_SLOW_MS set, traces at least that slow - and failed ones - are kept too, so
+the latency tail is always there to analyze. Finished traces are handed to a background
+thread that exports them in batches; a full queue drops traces rather than slowing requests.
+"""
+import atexit
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+# Append spans here as JSON lines
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "")
+# OTLP/HTTP JSON traces endpoint of a collector
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+# Share of traces exported (0..1)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+# Traces whose root span takes at least this long are exported regardless of sampling; 0 = off
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "anangai-api")
+# Finished traces waiting for export before new ones are dropped
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "1000"))
+TRACE_EXPORT_INTERVAL_SECONDS = 2.0
+TRACING_ENABLED = bool(TRACE_JSONL_PATH or TRACE_OTLP_ENDPOINT)
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+# OTLP SpanKind values
+_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class _Trace:
+    """The spans of one trace finished in this process, until its local root ends."""
+    __slots__ = ("sampled", "recording", "failed", "spans", "lock")
+
+    def __init__(self, sampled: bool):
+        self.sampled = sampled
+        # Unsampled traces are still recorded when they may turn out slow or failed
+        self.recording = TRACING_ENABLED and (sampled or TRACE_SLOW_MS > 0)
+        self.failed = False
+        self.spans: List["Span"] = []
+        self.lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "message", "_trace", "_local_root")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], trace: _Trace, local_root: bool):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = "unset"
+        self.message = ""
+        self._trace = trace
+        self._local_root = local_root
+
+    @property
+    def recording(self) -> bool:
+        return self._trace.recording
+
+    def set(self, key: str, value: Any) -> None:
+        if self._trace.recording and value is not None:
+            self.attributes[key] = value
+
+    def fail(self, message: str) -> None:
+        self.status, self.message = "error", message
+        self._trace.failed = True
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self._trace.sampled else '00'}"
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "service": TRACE_SERVICE_NAME,
+            "start_unix_nano": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "message": self.message or None,
+            "attributes": self.attributes,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace id, parent span id, sampled) from a W3C traceparent header, or None if absent or invalid."""
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if match is None or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    active = _current_span.get()
+    return active.trace_id if active is not None else None
+
+
+def annotate(**attributes: Any) -> None:
+    """Set attributes on the current span (no-op outside a recorded trace)."""
+    active = _current_span.get()
+    if active is not None and active.recording:
+        for key, value in attributes.items():
+            active.set(key, value)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", traceparent: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Open a span as a child of the current one. Without a current span it starts a trace, as
+    a continuation of `traceparent` when given. An exception escaping the block marks the
+    span failed (and is re-raised).
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        new = Span(name, kind, parent.trace_id, parent.span_id, parent._trace, False)
+    else:
+        remote = parse_traceparent(traceparent)
+        if remote is not None:
+            trace_id, parent_id, sampled = remote
+        else:
+            trace_id, parent_id, sampled = _new_id(128), None, random.random() < TRACE_SAMPLE_RATE
+        new = Span(name, kind, trace_id, parent_id, _Trace(sampled), True)
+    for key, value in attributes.items():
+        new.set(key, value)
+    token = _current_span.set(new)
+    try:
+        yield new
+    except BaseException as e:
+        new.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(new)
+
+
+def traced(name: str):
+    """Decorator running the function inside a span (the function itself when tracing is off)."""
+    def decorate(func):
+        if not TRACING_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _finish(finished: Span) -> None:
+    finished.end_ns = time.time_ns()
+    trace = finished._trace
+    if not trace.recording:
+        return
+    with trace.lock:
+        trace.spans.append(finished)
+        if not finished._local_root:
+            return
+        spans, trace.spans = trace.spans, []
+    slow = TRACE_SLOW_MS > 0 and finished.duration_ms >= TRACE_SLOW_MS
+    if trace.sampled or slow or trace.failed:
+        _exporter.submit(spans)
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(spans: List[Span]) -> Dict:
+    """An OTLP/HTTP JSON ExportTraceServiceRequest for spans."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": "anangai.tracing"},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                "name": s.name,
+                "kind": _KINDS.get(s.kind, 1),
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in s.attributes.items()],
+                "status": {"code": 2, "message": s.message} if s.status == "error" else {"code": 0},
+            } for s in spans],
+        }],
+    }]}
+
+
+class _Exporter:
+    """Background thread writing finished traces to the JSONL file and/or the OTLP endpoint in batches."""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._failing = False
+        self.stats = {"exported_spans": 0, "dropped_traces": 0, "export_errors": 0}
+
+    def submit(self, spans: List[Span]) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.stats["dropped_traces"] += 1
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Span] = []
+            stop = False
+            try:
+                item = self._queue.get(timeout=TRACE_EXPORT_INTERVAL_SECONDS)
+                while True:
+                    if item is None:
+                        stop = True
+                        break
+                    batch.extend(item)
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            if batch:
+                self._export(batch)
+            if stop:
+                return
+
+    def _export(self, batch: List[Span]) -> None:
+        try:
+            if TRACE_JSONL_PATH:
+                with open(TRACE_JSONL_PATH, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in batch))
+            if TRACE_OTLP_ENDPOINT:
+                httpx.post(TRACE_OTLP_ENDPOINT, json=otlp_payload(batch), timeout=5).raise_for_status()
+        except (OSError, httpx.HTTPError) as e:
+            self.stats["export_errors"] += 1
+            if not self._failing:
+                self._failing = True
+                log.warning("trace export failed", extra={"error": str(e)})
+            return
+        self._failing = False
+        self.stats["exported_spans"] += len(batch)
+
+    def shutdown(self, timeout: float = 5) -> None:
+        """Export what is queued and stop the thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            thread.join(timeout)
+
+
+_exporter = _Exporter()
+atexit.register(_exporter.shutdown)
+
+
+def shutdown_tracing() -> None:
+    _exporter.shutdown()
+
+
+def tracing_status() -> Dict:
+    return {
+        "enabled": TRACING_ENABLED,
+        "jsonl_path": TRACE_JSONL_PATH or None,
+        "otlp_endpoint": TRACE_OTLP_ENDPOINT or None,
+        "sample_rate": TRACE_SAMPLE_RATE,
+        "slow_ms": TRACE_SLOW_MS,
+        **_exporter.stats,
+    }
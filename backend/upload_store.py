@@ -0,0 +1,219 @@
+"""
+Upload pipeline for license / identity documents.
+
+Uploads are copied to disk in fixed-size chunks with every blocking file call pushed to
+the threadpool, so a slow disk or a large PDF never stalls the event loop. The size cap
+is enforced while streaming (the partial file is removed as soon as it is exceeded) and
+a SHA-256 of the content is computed on the fly.
+
+Storage is content-addressed: bytes live once under uploads/blobs/<sha[:2]>/<sha>, and
+uploads/index.json maps every public upload name (the value stored as license_url) to
+its hash. Resubmitting the same document adds a name, not another copy. Workers update the
+index one at a time, under an flock of uploads/index.lock.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process, the thread lock is enough
+    fcntl = None
+
+BASE_DIR = Path(__file__).resolve().parent
+UPLOADS_DIR = BASE_DIR / "uploads"
+BLOBS_DIR = UPLOADS_DIR / "blobs"
+# Upload name -> {"sha256", "size"}; names are what applications.txt / database.txt reference.
+INDEX_PATH = UPLOADS_DIR / "index.json"
+INDEX_LOCK_PATH = UPLOADS_DIR / "index.lock"
+
+# Max size of a single uploaded document. Override with MAX_UPLOAD_BYTES (bytes).
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES") or 10 * 1024 * 1024)
+# Bytes read from the spooled upload and written to disk per step.
+UPLOAD_CHUNK_SIZE = 256 * 1024
+# Timestamp granularity allowed for: an index read this soon after its last write may have
+# missed another write that left its stat (inode, mtime, size) unchanged.
+INDEX_MTIME_SLACK_NS = 2 * 10**9
+
+
+def too_large_detail(max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    if max_bytes >= 1024 * 1024:
+        return f"File too large (max {max_bytes // (1024 * 1024)} MB)"
+    return f"File too large (max {max_bytes // 1024} KB)"
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=too_large_detail(max_bytes))
+
+
+def _remove_quietly(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+async def save_upload(upload: UploadFile, dest_path: Path, max_bytes: int = MAX_UPLOAD_BYTES) -> tuple[int, str]:
+    """
+    Stream `upload` to `dest_path` without blocking the event loop.
+    Writes go to a temporary `.part` file that is renamed into place only once the whole
+    upload is on disk, so readers never see a half-written document.
+    Returns (size_in_bytes, sha256_hexdigest). Raises 413 when the file exceeds max_bytes.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_large(max_bytes)
+    tmp_path = dest_path.with_name(dest_path.name + ".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        f = await run_in_threadpool(open, tmp_path, "wb")
+    except OSError as e:
+        raise HTTPException(500, f"Save failed: {e}")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            digest.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(os.replace, tmp_path, dest_path)
+    except HTTPException:
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(_remove_quietly, tmp_path)
+        raise
+    except Exception as e:
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(_remove_quietly, tmp_path)
+        raise HTTPException(500, f"Save failed: {e}")
+    return size, digest.hexdigest()
+
+
+_index_lock = threading.Lock()
+_index_cache = {"file_id": None, "index": {}, "read_ns": 0}
+
+
+@contextmanager
+def _index_file_lock():
+    """Serialize index updates across worker processes."""
+    if fcntl is None:
+        yield
+        return
+    with open(INDEX_LOCK_PATH, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _load_index(force: bool = False) -> dict:
+    """Name -> hash map, re-read only when another worker has replaced index.json (or when forced)."""
+    try:
+        st = INDEX_PATH.stat()
+    except FileNotFoundError:
+        return _index_cache["index"]
+    file_id = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if force or file_id != _index_cache["file_id"]:
+        read_ns = time.time_ns()
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            _index_cache["index"] = json.load(f)
+        _index_cache["file_id"] = file_id
+        _index_cache["read_ns"] = read_ns
+    return _index_cache["index"]
+
+
+def _index_may_be_stale() -> bool:
+    """True while the cached index is so close to its last write that a later one could share its stat."""
+    file_id = _index_cache["file_id"]
+    return file_id is not None and _index_cache["read_ns"] - file_id[1] < INDEX_MTIME_SLACK_NS
+
+
+def _save_index(index: dict) -> None:
+    tmp_path = INDEX_PATH.with_name(f"{INDEX_PATH.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, INDEX_PATH)
+    except OSError:
+        _remove_quietly(tmp_path)
+        raise
+    st = INDEX_PATH.stat()
+    _index_cache["index"] = index
+    _index_cache["file_id"] = (st.st_ino, st.st_mtime_ns, st.st_size)
+    _index_cache["read_ns"] = time.time_ns()
+
+
+def blob_path(digest: str) -> Path:
+    return BLOBS_DIR / digest[:2] / digest
+
+
+def _commit_blob(tmp_path: Path, name: str, size: int, digest: str) -> None:
+    """Move a fully written upload into the blob store (or drop it if the bytes are already stored) and map name -> hash."""
+    dest = blob_path(digest)
+    with _index_lock, _index_file_lock():
+        if dest.exists():
+            _remove_quietly(tmp_path)
+        else:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, dest)
+        # Re-read under the lock: another worker may have added names since our last read
+        index = dict(_load_index(force=True))
+        index[name] = {"sha256": digest, "size": size}
+        _save_index(index)
+
+
+async def store_upload(upload: UploadFile, name_for: Callable[[str], str], max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """
+    Stream `upload` into the content-addressed store and return its public name.
+    `name_for(sha256_hex)` builds the name once the hash is known, so names derived from the
+    hash never change meaning and can be cached forever by clients.
+    """
+    UPLOADS_DIR.mkdir(exist_ok=True)
+    tmp_path = UPLOADS_DIR / f".incoming_{uuid.uuid4().hex}"
+    size, digest = await save_upload(upload, tmp_path, max_bytes)
+    name = name_for(digest)
+    try:
+        await run_in_threadpool(_commit_blob, tmp_path, name, size, digest)
+    except OSError as e:
+        await run_in_threadpool(_remove_quietly, tmp_path)
+        raise HTTPException(500, f"Save failed: {e}")
+    return name
+
+
+def resolve_upload(name: str) -> Optional[Tuple[Path, Optional[str]]]:
+    """
+    Return (path, sha256) for an upload name, or None if unknown.
+    Files written before the blob store existed sit directly in uploads/ and resolve with sha256=None.
+    An unknown name costs a stat, not an index read: the index is re-read only when its stat
+    changed, or when the cached copy is recent enough that another write could share its stat.
+    """
+    with _index_lock:
+        record = _load_index().get(name)
+    if record is None:
+        legacy = UPLOADS_DIR / name
+        if legacy.is_file():
+            return legacy, None
+        with _index_lock:
+            if _index_may_be_stale():
+                record = _load_index(force=True).get(name)
+    if record:
+        path = blob_path(record["sha256"])
+        if path.is_file():
+            return path, record["sha256"]
+    legacy = UPLOADS_DIR / name
+    if legacy.is_file():
+        return legacy, None
+    return None
@@ -0,0 +1,90 @@
+"""
+Worker warm-up: what the first question after a deploy would otherwise pay for, done at startup.
+
+warm_up_core() runs at startup (main.start_once) before any request is served: it loads the
+dataset (file discovery, parsing and every per-file index) and the gazetteer. The rest runs
+on a background thread - opening the pooled OpenRouter connection (DNS, TCP, TLS) and, if
+WARMUP_QUESTIONS is set, answering those questions once so their answers are in the cache.
+/health reports 503 until both parts are done.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import dataset
+from geo import get_gazetteer
+from router import ask, warm_up_upstream
+
+log = logging.getLogger(__name__)
+
+# "|"-separated questions to answer at startup; prefix one with "fr:" to ask it in French
+WARMUP_QUESTIONS = os.getenv("WARMUP_QUESTIONS", "")
+# Set WARMUP_UPSTREAM=0 to skip pre-connecting to OpenRouter (e.g. offline development)
+WARMUP_UPSTREAM = os.getenv("WARMUP_UPSTREAM", "1").lower() not in ("0", "false", "no")
+
+_status: Dict = {"ready": False, "steps": {}, "error": None}
+_status_lock = threading.Lock()
+_thread = None
+
+
+def parse_questions(spec: str) -> List[Tuple[str, str]]:
+    """(language, question) pairs from a WARMUP_QUESTIONS value."""
+    questions = []
+    for item in spec.split("|"):
+        item = item.strip()
+        if not item:
+            continue
+        language, sep, text = item.partition(":")
+        if sep and language in ("en", "fr"):
+            questions.append((language, text.strip()))
+        else:
+            questions.append(("en", item))
+    return questions
+
+
+def _step(name: str, func) -> None:
+    started = time.perf_counter()
+    try:
+        result = func()
+    except Exception as e:
+        with _status_lock:
+            _status["steps"][name] = {"ok": False, "error": str(e)}
+            _status["error"] = f"{name}: {e}"
+        log.warning("warm-up step failed", extra={"step": name, "error": str(e)})
+        return
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    with _status_lock:
+        _status["steps"][name] = {"ok": result is not False, "ms": elapsed_ms}
+    log.info("warm-up step done", extra={"step": name, "ms": elapsed_ms})
+
+
+def warm_up_core() -> None:
+    """Load the dataset and its indexes and the gazetteer (blocking)."""
+    _step("dataset", lambda: dataset.get_dataset().version is not None)
+    _step("gazetteer", get_gazetteer)
+
+
+def _warm_up_background() -> None:
+    if WARMUP_UPSTREAM:
+        _step("upstream", warm_up_upstream)
+    for language, question in parse_questions(WARMUP_QUESTIONS):
+        _step(f"answer[{language}]: {question}", lambda: ask(question, language) is not None)
+    with _status_lock:
+        _status["ready"] = True
+    log.info("worker warm")
+
+
+def start_background_warm_up() -> None:
+    """Pre-connect upstream and prime the answer cache on a daemon thread; marks the worker ready when done."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=_warm_up_background, name="warm-up", daemon=True)
+    _thread.start()
+
+
+def warm_status() -> Dict:
+    with _status_lock:
+        return {"ready": _status["ready"], "steps": dict(_status["steps"]), "error": _status["error"]}